@@ -0,0 +1,4 @@
+"""
+host
+Tools that run on a computer (CPython), not on the board.
+"""
@@ -0,0 +1,5 @@
+"""
+host.export
+Reader for the history exports devices write to /flash (src/export.py).
+"""
+from host.export.reader import Export, read_export, full_rate, RECORD_FORMAT
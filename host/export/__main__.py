@@ -0,0 +1,52 @@
+"""
+python -m host.export
+Verify an export copied off a device's /flash, and convert it.
+
+    python -m host.export export.json                     # verify, print a summary
+    python -m host.export export.json --csv readings.csv  # readings as CSV
+    python -m host.export export.json --csv readings.csv --full-rate  # repeats expanded
+    python -m host.export export.json --json export-all.json  # for host.fleet ingest
+"""
+import argparse
+import csv
+import json
+
+from host.export.reader import read_export, full_rate
+
+
+def main():
+    """
+    main
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('manifest')
+    parser.add_argument('--csv', default=None, help='write the readings as CSV')
+    parser.add_argument('--json', default=None, help='write {"data": [...], "events": [...]}')
+    parser.add_argument('--full-rate', action='store_true',
+                        help='expand deadband repeats into one row per reading')
+    args = parser.parse_args()
+
+    export = read_export(args.manifest)
+    data = export.data
+    if args.full_rate:
+        data = full_rate(data, export.manifest.get('interval') or 5)
+    print('%s: %d records, %d readings, %d events, checksums ok' % (
+        args.manifest, len(export.data), export.manifest.get('readings', len(export.data)),
+        len(export.events)))
+    if data:
+        print('from %d to %d' % (data[0]['timestamp'], data[-1]['timestamp']))
+    if args.csv:
+        with open(args.csv, 'w', newline='') as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow(['timestamp', 'humidity', 'temperature'])
+            for record in data:
+                writer.writerow([record['timestamp'], record['humidity'], record['temperature']])
+    if args.json:
+        with open(args.json, 'w') as outfile:
+            json.dump({'data': data, 'events': export.events}, outfile)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+reader.py
+Reads and verifies a device export: the manifest (<name>.json), the binary
+readings (<name>.bin) and the events (<name>-events.jsonl).
+
+Version 2 records carry a repeat count: with deadband recording on, a record
+stands for 1 + repeats readings, one per interval.  full_rate() expands them
+back into the full-rate series.
+
+An export made with event-anchored retention on also has <name>-pinned.bin:
+readings from around past events that the cache had already evicted, each
+with its seq.  They are older than the cached readings, and come first in data.
+"""
+import hashlib
+import json
+import os
+import struct
+
+RECORD_FORMATS = {1: '<Ihh', 2: '<IhhH'}
+RECORD_FORMAT = RECORD_FORMATS[2]
+PINNED_FORMAT = '<IIhhH' # seq, then a version 2 record
+
+
+class Export:
+    """
+    Export
+    A verified export.  data holds {"data_id", "timestamp", "humidity",
+    "temperature"} dicts (the same records host.sync's client returns; plus
+    "repeats" for records standing for repeated readings) and events
+    Event.to_dict() dicts.
+    """
+    def __init__(self, manifest, data, events):
+        self.manifest = manifest
+        self.data = data
+        self.events = events
+
+    def to_dict(self):
+        """
+        to_dict
+        Returns {"data": [...], "events": [...]}, which host.fleet ingests.
+        """
+        return {'data': self.data, 'events': self.events}
+
+
+def read_export(manifest_path):
+    """
+    read_export
+    Reads the export described by the manifest at manifest_path (its files
+    are looked up next to it).  Raises ValueError if the manifest is of an
+    unknown version, or a file's size or sha256 does not match.
+    """
+    with open(manifest_path) as infile:
+        manifest = json.load(infile)
+    record_format = RECORD_FORMATS.get(manifest.get('version'))
+    if record_format is None:
+        raise ValueError('Unsupported export version: %r' % manifest.get('version'))
+    if manifest.get('record_format', record_format) != record_format:
+        raise ValueError('Unsupported record format: %r' % manifest['record_format'])
+    folder = os.path.dirname(manifest_path)
+    raw_data = _read_checked(folder, manifest['files']['data'])
+    raw_events = _read_checked(folder, manifest['files']['events'])
+
+    prefix = manifest['epoch'] + '-'
+    seq = manifest['first_seq']
+    data = []
+    if 'pinned' in manifest['files']:
+        if manifest.get('pinned_format', PINNED_FORMAT) != PINNED_FORMAT:
+            raise ValueError('Unsupported pinned format: %r' % manifest['pinned_format'])
+        raw_pinned = _read_checked(folder, manifest['files']['pinned'])
+        for values in struct.iter_unpack(PINNED_FORMAT, raw_pinned):
+            data.append(_record(prefix + str(values[0]), values[1:]))
+    for offset, values in enumerate(struct.iter_unpack(record_format, raw_data)):
+        data.append(_record(prefix + str(seq + offset), values))
+    events = [json.loads(line) for line in raw_events.splitlines() if line.strip()]
+    return Export(manifest, data, events)
+
+
+def full_rate(records, interval):
+    """
+    full_rate
+    Expands records with a repeat count into one record per reading, at
+    interval seconds apart (the repeated readings get data_id "<id>+<k>").
+    """
+    expanded = []
+    for record in records:
+        expanded.append(record)
+        for k in range(1, record.get('repeats', 0) + 1):
+            repeat = dict(record, data_id='%s+%d' % (record['data_id'], k),
+                          timestamp=record['timestamp'] + k * interval)
+            del repeat['repeats']
+            expanded.append(repeat)
+    return expanded
+
+
+def _record(data_id, values):
+    """
+    _record
+    Returns the record dict for (timestamp, humidity, temperature[, repeats])
+    values as stored in an export.
+    """
+    record = {
+        'data_id': data_id,
+        'timestamp': values[0],
+        'humidity': values[1] / 10,
+        'temperature': values[2] / 10,
+        }
+    if len(values) > 3 and values[3]:
+        record['repeats'] = values[3]
+    return record
+
+
+def _read_checked(folder, entry):
+    """
+    _read_checked
+    Returns the contents of a file listed in the manifest, after checking
+    its size and sha256.
+    """
+    with open(os.path.join(folder, entry['name']), 'rb') as infile:
+        raw = infile.read()
+    if len(raw) != entry['bytes']:
+        raise ValueError('%s: expected %d bytes, found %d' % (entry['name'], entry['bytes'],
+                                                             len(raw)))
+    if hashlib.sha256(raw).hexdigest() != entry['sha256']:
+        raise ValueError('%s: checksum mismatch' % entry['name'])
+    return raw
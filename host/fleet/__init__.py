@@ -0,0 +1,7 @@
+"""
+host.fleet
+Columnar ingestion store for data/events exported by a fleet of devices.
+Requires NumPy.
+"""
+from host.fleet.store import FleetStore, ColumnTable, split_ids
+from host.fleet.loaders import load_file, load_json, load_npz, data_columns, event_columns
@@ -0,0 +1,54 @@
+"""
+python -m host.fleet
+Ingest exported batches into a fleet store, and query it.
+
+    python -m host.fleet --root fleet ingest DEVICE_ID export1.json export2.npz
+    python -m host.fleet --root fleet aggregate --start 1700000000 --end 1700086400
+    python -m host.fleet --root fleet scan DEVICE_ID --start 1700000000 --end 1700003600
+"""
+import argparse
+import json
+import time
+
+from host.fleet.loaders import load_file
+from host.fleet.store import FleetStore
+
+
+def main():
+    """
+    main
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--root', default='fleet')
+    commands = parser.add_subparsers(dest='command', required=True)
+    ingest = commands.add_parser('ingest')
+    ingest.add_argument('device_id')
+    ingest.add_argument('files', nargs='+')
+    for name in ('aggregate', 'scan'):
+        command = commands.add_parser(name)
+        if name == 'scan':
+            command.add_argument('device_id')
+        command.add_argument('--start', type=int, default=None)
+        command.add_argument('--end', type=int, default=None)
+    args = parser.parse_args()
+
+    store = FleetStore(args.root)
+    if args.command == 'ingest':
+        for path in args.files:
+            start = time.perf_counter()
+            data, events = load_file(path)
+            added = store.ingest(args.device_id, data, events)
+            print('%s: +%d data, +%d events (%.2fs)' % (
+                path, added[0], added[1], time.perf_counter() - start))
+    elif args.command == 'aggregate':
+        print(json.dumps(store.aggregate(args.start, args.end), indent=2))
+    else:
+        columns = store.scan(args.device_id, args.start, args.end)
+        for row in zip(columns['timestamp'], columns['humidity'], columns['temperature']):
+            print('%d,%.1f,%.1f' % row)
+
+
+if __name__ == '__main__':
+    main()
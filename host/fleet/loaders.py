@@ -0,0 +1,121 @@
+"""
+loaders.py
+Turns exported batches into the column dicts FleetStore.ingest takes.
+
+Accepted inputs:
+* JSON: a list (or JSON lines) of SensorData/Event to_dict() records, raw
+  data/event characteristic responses (including batched "rows" responses),
+  or {"data": [...], "events": [...]}.
+* Binary: a NumPy .npz with the column arrays (timestamp, humidity,
+  temperature, id_hi, id_lo for data; event_timestamp, event_type,
+  event_id_hi, event_id_lo for events).
+"""
+import json
+
+import numpy as np
+
+from host.fleet.store import split_ids
+from host.sync.client import expand_data
+
+
+def data_columns(records):
+    """
+    data_columns
+    Columns for a list of {"data_id", "timestamp", "humidity", "temperature"}.
+    """
+    id_hi, id_lo = split_ids([record['data_id'] for record in records])
+    return {
+        'timestamp': np.fromiter((record['timestamp'] for record in records), np.int64,
+                                 len(records)),
+        'humidity': np.fromiter((record['humidity'] for record in records), np.float32,
+                                len(records)),
+        'temperature': np.fromiter((record['temperature'] for record in records), np.float32,
+                                   len(records)),
+        'id_hi': id_hi,
+        'id_lo': id_lo,
+        }
+
+
+def event_columns(records):
+    """
+    event_columns
+    Columns for a list of {"event_id", "timestamp", "event_type"}.
+    """
+    id_hi, id_lo = split_ids([record['event_id'] for record in records])
+    return {
+        'timestamp': np.fromiter((record['timestamp'] for record in records), np.int64,
+                                 len(records)),
+        'event_type': np.fromiter((record['event_type'] for record in records), np.int8,
+                                  len(records)),
+        'id_hi': id_hi,
+        'id_lo': id_lo,
+        }
+
+
+def load_json(payload):
+    """
+    load_json
+    Parses a JSON export (bytes or str).  Returns (data columns, event columns).
+    """
+    if isinstance(payload, bytes):
+        payload = payload.decode()
+    try:
+        parsed = json.loads(payload)
+    except ValueError:
+        # JSON lines
+        parsed = [json.loads(line) for line in payload.splitlines() if line.strip()]
+    if isinstance(parsed, dict) and ('data' in parsed or 'events' in parsed) \
+            and not 'remaining' in parsed:
+        return data_columns(parsed.get('data') or []), event_columns(parsed.get('events') or [])
+    if isinstance(parsed, dict):
+        parsed = [parsed]
+    return split_records(parsed)
+
+
+def split_records(items):
+    """
+    split_records
+    Sorts a mixed list of records and device responses into data and events.
+    """
+    data = []
+    events = []
+    responses = []
+    for item in items:
+        if 'remaining' in item:
+            responses.append(item)
+            if 'event' in item:
+                events.append(item['event'])
+        elif 'event_id' in item:
+            events.append(item)
+        elif 'data_id' in item:
+            data.append(item)
+    if responses:
+        data.extend(expand_data(responses))
+    return data_columns(data), event_columns(events)
+
+
+def load_npz(path):
+    """
+    load_npz
+    Reads a binary .npz batch.  Returns (data columns, event columns).
+    """
+    with np.load(path) as batch:
+        data = {name: batch[name] for name in
+                ('timestamp', 'humidity', 'temperature', 'id_hi', 'id_lo') if name in batch}
+        events = {name[len('event_'):]: batch[name] for name in
+                  ('event_timestamp', 'event_type', 'event_id_hi', 'event_id_lo')
+                  if name in batch}
+    if 'type' in events:
+        events['event_type'] = events.pop('type')
+    return (data if 'timestamp' in data else None), (events if 'timestamp' in events else None)
+
+
+def load_file(path):
+    """
+    load_file
+    Loads a batch file, picking the format from its extension.
+    """
+    if path.endswith('.npz'):
+        return load_npz(path)
+    with open(path, 'rb') as infile:
+        return load_json(infile.read())
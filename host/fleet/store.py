@@ -0,0 +1,261 @@
+"""
+store.py
+Columnar, per-device store for data and events exported by many devices.
+
+Layout (one directory per device, one .npy file per column):
+
+    <root>/<device_id>/data/timestamp.npy     int64, sorted ascending
+                           /humidity.npy      float32
+                           /temperature.npy   float32
+                           /id_hi.npy         uint64  \\ record id, see split_ids
+                           /id_lo.npy         int64   /
+                           /index.npy         int64, timestamp of every INDEX_BLOCK-th row
+    <root>/<device_id>/events/...             timestamp, event_type, id_hi, id_lo
+
+Columns are memory-mapped for queries.  Ingesting a batch merges it with the
+existing columns, drops records whose id is already stored, re-sorts by time
+and swaps the new column set in atomically.
+"""
+import hashlib
+import os
+import shutil
+
+import numpy as np
+
+INDEX_BLOCK = 4096 # rows per entry of the sparse time index
+
+DATA_COLUMNS = (
+    ('timestamp', np.int64),
+    ('humidity', np.float32),
+    ('temperature', np.float32),
+    ('id_hi', np.uint64),
+    ('id_lo', np.int64),
+    )
+EVENT_COLUMNS = (
+    ('timestamp', np.int64),
+    ('event_type', np.int8),
+    ('id_hi', np.uint64),
+    ('id_lo', np.int64),
+    )
+
+
+def split_ids(ids):
+    """
+    split_ids
+    Turns record ids into two integer columns.  Data ids of the form
+    "<16 hex digit epoch>-<seq>" become (epoch, seq); any other id (e.g. an
+    event uuid) becomes (64-bit blake2b hash, -1).
+    """
+    hi = np.empty(len(ids), dtype=np.uint64)
+    lo = np.empty(len(ids), dtype=np.int64)
+    for i, record_id in enumerate(ids):
+        prefix, _, seq = record_id.partition('-')
+        if len(prefix) == 16 and seq.isdigit():
+            hi[i] = int(prefix, 16)
+            lo[i] = int(seq)
+        else:
+            hi[i] = int.from_bytes(hashlib.blake2b(record_id.encode(), digest_size=8).digest(),
+                                   'little')
+            lo[i] = -1
+    return hi, lo
+
+
+class ColumnTable:
+    """
+    ColumnTable
+    A set of equal-length .npy columns in one directory, sorted by timestamp.
+    """
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+
+    def exists(self):
+        """
+        exists
+        Returns true if the table has been written.
+        """
+        return os.path.exists(os.path.join(self.path, 'timestamp.npy'))
+
+    def read(self, mmap=True):
+        """
+        read
+        Returns {column: array}.  Arrays are memory-mapped unless mmap=False.
+        """
+        if not self.exists():
+            return {name: np.empty(0, dtype=dtype) for name, dtype in self.columns}
+        mode = 'r' if mmap else None
+        return {name: np.load(os.path.join(self.path, name + '.npy'), mmap_mode=mode)
+                for name, _ in self.columns}
+
+    def __len__(self):
+        if not self.exists():
+            return 0
+        return len(self.read()['timestamp'])
+
+    def merge(self, new):
+        """
+        merge
+        Adds the rows in `new` ({column: array}) whose (id_hi, id_lo) is not
+        stored yet.  Returns the number of rows added.
+        """
+        old = self.read(mmap=True)
+        old_len = len(old['timestamp'])
+        merged = {name: np.concatenate([old[name], np.asarray(new[name], dtype=dtype)])
+                  for name, dtype in self.columns}
+        # Stable sort by id; the first row of every run of equal ids is kept,
+        # which is the stored one when the id was already present.
+        order = np.lexsort((merged['id_lo'], merged['id_hi']))
+        hi = merged['id_hi'][order]
+        lo = merged['id_lo'][order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (hi[1:] != hi[:-1]) | (lo[1:] != lo[:-1])
+        keep = order[first]
+        keep = keep[np.argsort(merged['timestamp'][keep], kind='stable')]
+        added = len(keep) - old_len
+        if added:
+            self.__write({name: merged[name][keep] for name, _ in self.columns})
+        return added
+
+    def range_slice(self, start=None, end=None):
+        """
+        range_slice
+        Returns the row slice with start <= timestamp < end, found through
+        the sparse index and a binary search inside one block.
+        """
+        columns = self.read()
+        timestamps = columns['timestamp']
+        index = np.load(os.path.join(self.path, 'index.npy')) if self.exists() else None
+        return slice(_search(timestamps, index, start, 0),
+                     _search(timestamps, index, end, len(timestamps)))
+
+    def scan(self, start=None, end=None):
+        """
+        scan
+        Returns {column: array view} for start <= timestamp < end.
+        """
+        rows = self.range_slice(start, end)
+        return {name: array[rows] for name, array in self.read().items()}
+
+    def __write(self, columns):
+        tmp_path = self.path + '.tmp'
+        old_path = self.path + '.old'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name, array in columns.items():
+            np.save(os.path.join(tmp_path, name + '.npy'), array)
+        np.save(os.path.join(tmp_path, 'index.npy'), columns['timestamp'][::INDEX_BLOCK])
+        if os.path.exists(self.path):
+            os.replace(self.path, old_path)
+        os.replace(tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+def _search(timestamps, index, value, default):
+    """
+    _search
+    First row with timestamp >= value, using the sparse index to pick the block.
+    """
+    if value is None:
+        return default
+    if index is None or not len(index):
+        return 0
+    block = max(int(np.searchsorted(index, value, side='left')) - 1, 0)
+    lo = block * INDEX_BLOCK
+    hi = min(lo + 2 * INDEX_BLOCK, len(timestamps))
+    return lo + int(np.searchsorted(timestamps[lo:hi], value, side='left'))
+
+
+class FleetStore:
+    """
+    FleetStore
+    Per-device columnar tables for data and events under one root directory.
+    """
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def devices(self):
+        """
+        devices
+        Returns the ids of every device with stored records.
+        """
+        return sorted(name for name in os.listdir(self.root)
+                      if os.path.isdir(os.path.join(self.root, name)))
+
+    def data_table(self, device_id):
+        """
+        data_table
+        Returns the data ColumnTable of a device.
+        """
+        return ColumnTable(os.path.join(self.root, device_id, 'data'), DATA_COLUMNS)
+
+    def event_table(self, device_id):
+        """
+        event_table
+        Returns the event ColumnTable of a device.
+        """
+        return ColumnTable(os.path.join(self.root, device_id, 'events'), EVENT_COLUMNS)
+
+    def ingest(self, device_id, data=None, events=None):
+        """
+        ingest
+        Adds a batch of columns ({column: array}, with id_hi/id_lo) for a
+        device.  Returns (data rows added, event rows added).
+        """
+        added_data = added_events = 0
+        if data is not None and len(data['timestamp']):
+            added_data = self.data_table(device_id).merge(data)
+        if events is not None and len(events['timestamp']):
+            added_events = self.event_table(device_id).merge(events)
+        return added_data, added_events
+
+    def scan(self, device_id, start=None, end=None):
+        """
+        scan
+        Returns the data columns of a device for start <= timestamp < end.
+        """
+        return self.data_table(device_id).scan(start, end)
+
+    def scan_events(self, device_id, start=None, end=None):
+        """
+        scan_events
+        Returns the event columns of a device for start <= timestamp < end.
+        """
+        return self.event_table(device_id).scan(start, end)
+
+    def aggregate(self, start=None, end=None, devices=None):
+        """
+        aggregate
+        Per-device count/min/max/mean of humidity and temperature over
+        start <= timestamp < end.  Returns {device_id: {...}}.
+        """
+        result = {}
+        for device_id in devices or self.devices():
+            columns = self.scan(device_id, start, end)
+            count = len(columns['timestamp'])
+            stats = {'count': count}
+            for name in ('humidity', 'temperature'):
+                values = columns[name]
+                stats[name] = {
+                    'min': float(values.min()) if count else None,
+                    'max': float(values.max()) if count else None,
+                    'mean': float(values.mean(dtype=np.float64)) if count else None,
+                    }
+            result[device_id] = stats
+        return result
+
+    def bucket_means(self, device_id, start, end, bucket_seconds, column='humidity'):
+        """
+        bucket_means
+        Mean of a column per bucket_seconds wide bucket over [start, end).
+        Returns (bucket start timestamps, means, counts); empty buckets are NaN.
+        """
+        columns = self.scan(device_id, start, end)
+        buckets = (columns['timestamp'] - start) // bucket_seconds
+        num_buckets = int(-(-(end - start) // bucket_seconds))
+        counts = np.bincount(buckets, minlength=num_buckets)
+        sums = np.bincount(buckets, weights=columns[column], minlength=num_buckets)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+        starts = start + np.arange(num_buckets, dtype=np.int64) * bucket_seconds
+        return starts, means, counts
@@ -0,0 +1,196 @@
+"""
+host.load
+Synthetic fleet load: many simulated devices on scripted wet profiles,
+synced through the device protocol at accelerated virtual time.
+
+Every device is an unmodified Device in a host.sim.SimDevice, reading its
+own host.profiles.WetProfile (own seed and wet times, so its own events).
+Devices are split into chunks, one chunk per worker process; a worker steps
+its devices in lock-step on the shared virtual clock and, every sync period,
+syncs each one with its own SyncClient (InProcessTransport), timing every
+sync on the wall clock.  Only per-device results cross process boundaries.
+
+    from host.load import run_fleet
+    results, seconds = run_fleet(devices=100, hours=2)
+"""
+import asyncio
+import concurrent.futures
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from host.profiles import WetProfile, random_wet_times
+from host.sim import SimDevice
+from host.sim.micropython import CONTEXT
+from host.sync import SyncClient, InProcessTransport
+
+START = 1792411200 # virtual wall clock at the start of every run (2026-10-19 UTC)
+HOUR = 3600
+
+
+class DeviceResult: # pylint: disable=R0902,R0903
+    """
+    DeviceResult
+    What one simulated device produced and how its syncs went.  name is
+    "device-<index>" (every device is built with the same DEVICE_ID).
+    latencies holds the wall-clock seconds of every sync round.
+    """
+    def __init__(self, index):
+        self.index = index
+        self.name = 'device-%d' % index
+        self.readings = 0 # readings synced
+        self.events = 0 # events synced
+        self.wet = 0 # wet events in the profile
+        self.syncs = 0
+        self.reads = 0
+        self.bytes = 0
+        self.latencies = []
+
+    def percentile(self, fraction):
+        """
+        percentile
+        Returns the given percentile (0..1) of the sync latencies, in seconds.
+        """
+        return percentile(self.latencies, fraction)
+
+
+def percentile(values, fraction):
+    """
+    percentile
+    Nearest-rank percentile of a list (0.0 if empty).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class FleetParams: # pylint: disable=R0902,R0903
+    """
+    FleetParams
+    Settings shared by every device of a run.
+    """
+    def __init__(self, hours=2.0, interval=5, sync_minutes=15.0, wet_per_day=6.0, # pylint: disable=R0913
+                 batch_size=64, retention=None, seed=0, output=None):
+        self.hours = hours
+        self.interval = interval
+        self.sync_minutes = sync_minutes
+        self.wet_per_day = wet_per_day
+        self.batch_size = batch_size
+        # Cache retention (days): twice the sync period is plenty, and keeps
+        # thousands of devices in RAM.
+        self.retention = retention or max(0.01, 2 * sync_minutes / (24 * 60))
+        self.seed = seed
+        self.output = output
+
+
+def make_profile(index, params):
+    """
+    make_profile
+    The scripted sensor profile of device `index`: its own seed and wet
+    times over the run (in virtual clock seconds).
+    """
+    seed = params.seed * 1000003 + index
+    rng = random.Random(seed)
+    wet_times = random_wet_times(rng, START, params.hours * HOUR, params.wet_per_day, HOUR)
+    return WetProfile(wet_times, seed=seed)
+
+
+async def _run_devices(indices, params):
+    """
+    _run_devices
+    Runs the devices with the given indices side by side on the virtual
+    clock, syncing each one every sync period.
+    """
+    CONTEXT.clock.seconds = float(START)
+    sims = []
+    clients = []
+    results = []
+    flash_root = tempfile.mkdtemp(prefix='dd-load-')
+    try:
+        for index in indices:
+            profile = make_profile(index, params)
+            flash_dir = os.path.join(flash_root, str(index))
+            os.mkdir(flash_dir)
+            sim = SimDevice(sensor=profile, flash_dir=flash_dir,
+                            duration=params.retention, interval=params.interval,
+                            num_events=1000)
+            client = SyncClient(InProcessTransport(sim), 'load-%d' % index,
+                                batch_size=params.batch_size)
+            await client.connect()
+            await client.pair()
+            result = DeviceResult(index)
+            result.wet = len(profile.wet_times)
+            sims.append(sim)
+            clients.append(client)
+            results.append(result)
+
+        sync_every = max(1, int(params.sync_minutes * 60 // params.interval))
+        steps = int(params.hours * HOUR // params.interval)
+        for step in range(1, steps + 1):
+            for sim in sims:
+                sim.step()
+            CONTEXT.clock.advance(params.interval)
+            if step % sync_every == 0 or step == steps:
+                for sim, client, result in zip(sims, clients, results):
+                    await _sync(client, result, params)
+        for client in clients:
+            await client.disconnect()
+    finally:
+        for sim in sims:
+            sim.close()
+        shutil.rmtree(flash_root, ignore_errors=True)
+    return results
+
+
+async def _sync(client, result, params):
+    """
+    _sync
+    One sync round of one device.  Appends the synced records to
+    <output>/<name>.jsonl (one data or event record per line, which
+    host.fleet ingests) if an output directory was given.
+    """
+    synced = await client.sync()
+    result.syncs += 1
+    result.readings += len(synced.data)
+    result.events += len(synced.events)
+    result.reads += synced.reads
+    result.bytes += synced.bytes
+    result.latencies.append(synced.seconds)
+    if params.output and synced.records:
+        path = os.path.join(params.output, result.name + '.jsonl')
+        with open(path, 'a') as outfile:
+            for record in synced.data + synced.events:
+                outfile.write(json.dumps(record) + '\n')
+
+
+def _run_chunk(indices, params):
+    return asyncio.run(_run_devices(indices, params))
+
+
+def run_fleet(devices=100, workers=None, chunk_size=None, **kwargs):
+    """
+    run_fleet
+    Runs `devices` simulated devices across a process pool (keyword
+    arguments are FleetParams).  Returns (one DeviceResult per device, in
+    order, wall-clock seconds of the whole run).
+    """
+    params = FleetParams(**kwargs)
+    if params.output:
+        os.makedirs(params.output, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(1, -(-devices // workers))
+    chunks = [list(range(i, min(i + chunk_size, devices))) for i in range(0, devices, chunk_size)]
+    start = time.perf_counter()
+    results = []
+    if workers == 1:
+        for chunk in chunks:
+            results.extend(_run_chunk(chunk, params))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            for chunk_results in pool.map(_run_chunk, chunks, [params] * len(chunks)):
+                results.extend(chunk_results)
+    return results, time.perf_counter() - start
@@ -0,0 +1,72 @@
+"""
+python -m host.load
+Synthetic fleet load generator: runs many simulated devices (scripted wet
+profiles, so they fire events) in a process pool at accelerated virtual time,
+syncs each through the device protocol every --sync-minutes, and reports the
+aggregate records/s and events/s the sync clients received, plus per-device
+sync latency.
+
+    python -m host.load --devices 1000 --hours 6 --workers 8
+    python -m host.load --devices 20 --per-device --output load-out
+    python -m host.fleet --root fleet ingest device-0 load-out/device-0.jsonl
+"""
+import argparse
+
+from host.load import run_fleet, percentile
+
+
+def main():
+    """
+    main
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--hours', type=float, default=2.0, help='virtual time per device')
+    parser.add_argument('--interval', type=int, default=5, help='seconds between readings')
+    parser.add_argument('--sync-minutes', type=float, default=15.0,
+                        help='virtual minutes between syncs of a device')
+    parser.add_argument('--wet-per-day', type=float, default=6.0)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: all cores)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None,
+                        help='directory for the synced records (device-<n>.jsonl)')
+    parser.add_argument('--per-device', action='store_true', help='print a row per device')
+    args = parser.parse_args()
+
+    results, seconds = run_fleet(devices=args.devices, workers=args.workers, hours=args.hours,
+                                 interval=args.interval, sync_minutes=args.sync_minutes,
+                                 wet_per_day=args.wet_per_day, batch_size=args.batch_size,
+                                 seed=args.seed, output=args.output)
+
+    if args.per_device:
+        print('%-12s %9s %6s %4s %6s %9s %9s %9s' % (
+            'device', 'readings', 'events', 'wet', 'syncs', 'p50_ms', 'p95_ms',
+            'max_ms'))
+        for result in results:
+            print('%-12s %9d %6d %4d %6d %9.2f %9.2f %9.2f' % (
+                result.name, result.readings, result.events, result.wet,
+                result.syncs, 1000 * result.percentile(0.5), 1000 * result.percentile(0.95),
+                1000 * max(result.latencies or [0.0])))
+        print()
+
+    readings = sum(result.readings for result in results)
+    events = sum(result.events for result in results)
+    latencies = [latency for result in results for latency in result.latencies]
+    virtual = args.devices * args.hours * 3600
+    print('devices: %d  virtual hours each: %.1f  wall seconds: %.2f  speedup: %.0fx' % (
+        args.devices, args.hours, seconds, virtual / seconds if seconds else 0.0))
+    print('readings: %d  events: %d  wet: %d  syncs: %d  bytes: %d' % (
+        readings, events, sum(result.wet for result in results),
+        sum(result.syncs for result in results), sum(result.bytes for result in results)))
+    print('records/s: %.0f  events/s: %.1f' % (
+        (readings + events) / seconds if seconds else 0.0, events / seconds if seconds else 0.0))
+    print('sync latency ms  p50: %.2f  p95: %.2f  p99: %.2f  max: %.2f' % (
+        1000 * percentile(latencies, 0.5), 1000 * percentile(latencies, 0.95),
+        1000 * percentile(latencies, 0.99), 1000 * max(latencies or [0.0])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+profiles.py
+Scripted humidity/temperature profiles for a worn diaper, with wet events.
+
+A profile is a callable f(seconds) -> (humidity, temperature), which is what
+host.sim expects as a sensor.  WetProfile.sample(times) evaluates the same
+profile on a NumPy array of times and returns identical values.
+"""
+import math
+
+DHT_MAX_HUMIDITY = 99.9
+NOISE_MULTIPLIER = 2654435761
+NOISE_PERIOD = 5 # seconds; one noise value per reading at the default interval
+
+
+def _noise(key, seed):
+    """
+    _noise
+    Deterministic noise in [-0.5, 0.5) from an integer key (Knuth hash).
+    """
+    return (((key * NOISE_MULTIPLIER + seed * 97) & 0xFFFFFFFF) / 4294967296.0) - 0.5
+
+
+class WetProfile: # pylint: disable=R0902,R0903
+    """
+    WetProfile
+    Dry baseline with a slow drift and sensor noise; at every wet time the
+    humidity saturates towards 99.9% with time constant rise_tau, and after
+    change_after seconds (the diaper is changed) it decays back to baseline.
+    """
+    def __init__(self, wet_times=(), seed=0, baseline=55.0, drift=3.0, noise=0.4, # pylint: disable=R0913
+                 temperature=33.0, rise_tau=20.0, change_after=1800.0, fall_tau=120.0):
+        self.wet_times = sorted(wet_times)
+        self.seed = seed
+        self.baseline = baseline
+        self.drift = drift
+        self.noise = noise
+        self.temperature = temperature
+        self.rise_tau = rise_tau
+        self.change_after = change_after
+        self.fall_tau = fall_tau
+
+    def __call__(self, seconds):
+        key = int(seconds // NOISE_PERIOD)
+        dry = (self.baseline + self.drift * math.sin(seconds * 2 * math.pi / 3600.0)
+               + self.noise * 2 * (_noise(key, self.seed) + _noise(key + 1, self.seed)))
+        wet = 0.0
+        for wet_time in self.wet_times:
+            since = seconds - wet_time
+            if since < 0:
+                break
+            if since < self.change_after:
+                wet = 1.0 - math.exp(-since / self.rise_tau)
+            else:
+                peak = 1.0 - math.exp(-self.change_after / self.rise_tau)
+                wet = peak * math.exp(-(since - self.change_after) / self.fall_tau)
+        humidity = dry + (DHT_MAX_HUMIDITY - dry) * wet
+        humidity = min(max(round(humidity, 1), 0.0), DHT_MAX_HUMIDITY)
+        temperature = round(self.temperature + 0.2 * _noise(key + 7, self.seed), 1)
+        return humidity, temperature
+
+    def sample(self, times):
+        """
+        sample
+        Evaluates the profile on an array of times.  Returns
+        (humidity, temperature) float64 arrays.
+        """
+        import numpy as np # pylint: disable=C0415
+        times = np.asarray(times, dtype=np.float64)
+        key = np.floor_divide(times, NOISE_PERIOD).astype(np.int64)
+
+        def noise(keys):
+            hashed = (keys.astype(np.uint64) * np.uint64(NOISE_MULTIPLIER)
+                      + np.uint64(self.seed * 97)) & np.uint64(0xFFFFFFFF)
+            return hashed / 4294967296.0 - 0.5
+
+        dry = (self.baseline + self.drift * np.sin(times * 2 * math.pi / 3600.0)
+               + self.noise * 2 * (noise(key) + noise(key + 1)))
+        wet = np.zeros_like(times)
+        for wet_time in self.wet_times:
+            since = times - wet_time
+            peak = 1.0 - math.exp(-self.change_after / self.rise_tau)
+            rising = 1.0 - np.exp(-np.maximum(since, 0) / self.rise_tau)
+            falling = peak * np.exp(-np.maximum(since - self.change_after, 0) / self.fall_tau)
+            wet = np.where(since >= 0, np.where(since < self.change_after, rising, falling), wet)
+        humidity = dry + (DHT_MAX_HUMIDITY - dry) * wet
+        humidity = np.clip(np.round(humidity, 1), 0.0, DHT_MAX_HUMIDITY)
+        temperature = np.round(self.temperature + 0.2 * noise(key + 7), 1)
+        return humidity, temperature
+
+
+def random_wet_times(rng, start, duration, per_day=6.0, min_gap=3600.0):
+    """
+    random_wet_times
+    Draws wet event times (Poisson, at least min_gap apart) over a window.
+    rng is a random.Random.
+    """
+    times = []
+    rate = per_day / 86400.0
+    when = start + rng.expovariate(rate)
+    while when < start + duration:
+        times.append(when)
+        when += min_gap + rng.expovariate(rate)
+    return times
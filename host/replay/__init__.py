@@ -0,0 +1,8 @@
+"""
+host.replay
+Offline replay of Device.check_for_event over recorded or synthetic traces,
+and parameter sweeps over the detection constants.  Requires NumPy.
+"""
+from host.replay.detect import (Trace, Features, Params, Score, DEVICE_PARAMS, DEFAULT_CAPACITY,
+                                candidates, detect, detect_grid, score)
+from host.replay.sweep import make_grid, evaluate, sweep
@@ -0,0 +1,140 @@
+"""
+python -m host.replay
+Sweeps the event detection constants over traces and reports events, misses,
+false positives and detection latency per parameter set.
+
+    python -m host.replay --synthetic 1000
+    python -m host.replay --files trace1.csv trace2.npz --thresholds 98.5 99.1
+    python -m host.replay --store fleet --device DEVICE_ID
+    python -m host.replay --synthetic 3 --verify
+    python -m host.replay --synthetic 20 --latency --connect-period 300
+
+--latency replays the traces through the device code instead, and reports
+where the time between a wet onset and the client's ack goes (see
+host/replay/latency.py).
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from host.replay import traces
+from host.replay.detect import DEVICE_PARAMS, DEFAULT_CAPACITY, Features, detect
+from host.replay.sweep import MATCH_WINDOW, make_grid, sweep
+
+
+def verify(sources, params, capacity):
+    """
+    verify
+    Checks the vectorized detector against the device code on every source.
+    """
+    from host.replay.verify import device_events # pylint: disable=C0415
+    for kind, arg in sources:
+        trace = traces.synthetic(*arg) if kind == 'synthetic' else traces.load_file(arg)
+        expected = device_events(trace, params)
+        actual = detect(Features(trace, capacity), params)
+        status = 'ok' if np.array_equal(expected, actual) else 'MISMATCH'
+        print('%s: device %d events, replay %d events: %s' % (
+            trace.name, len(expected), len(actual), status))
+
+
+def latency(sources, connect_period, workers):
+    """
+    latency
+    Prints the detection latency breakdown over the traces, in seconds.
+    """
+    from host.replay.latency import replay_latency, summarize # pylint: disable=C0415
+    start = time.perf_counter()
+    records, abandoned = replay_latency(sources, connect_period, workers)
+    print('%d traces, %d events, %d onsets abandoned in %.2fs' % (
+        len(sources), len(records), abandoned, time.perf_counter() - start))
+    for title, repeat in (('first events', False), ('repeats', True)):
+        print()
+        print('%-12s %6s %9s %9s %9s %9s' % (title, 'events', 'mean_s', 'p50_s', 'p95_s',
+                                              'max_s'))
+        for name, stats in summarize(records, repeat).items():
+            if not stats['count']:
+                print('%-12s %6d' % (name, 0))
+                continue
+            print('%-12s %6d %9.1f %9.1f %9.1f %9.1f' % (
+                name, stats['count'], stats['mean'], stats['p50'], stats['p95'], stats['max']))
+
+
+def main():
+    """
+    main
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', nargs='*', default=[])
+    parser.add_argument('--synthetic', type=int, default=0, help='number of synthetic traces')
+    parser.add_argument('--days', type=float, default=1.0, help='length of synthetic traces')
+    parser.add_argument('--store', default=None, help='fleet store root (unlabelled traces)')
+    parser.add_argument('--device', action='append', default=[])
+    parser.add_argument('--thresholds', type=float, nargs='+',
+                        default=[98.5, 99.0, DEVICE_PARAMS.threshold, 99.5])
+    parser.add_argument('--min-percents', type=float, nargs='+',
+                        default=[0.05, DEVICE_PARAMS.min_percent, 0.5, 1.0])
+    parser.add_argument('--min-gaps', type=int, nargs='+',
+                        default=[DEVICE_PARAMS.min_gap, 300, 900])
+    parser.add_argument('--min-points', type=int, nargs='+',
+                        default=[3, DEVICE_PARAMS.min_points, 12])
+    parser.add_argument('--capacity', type=int, default=DEFAULT_CAPACITY)
+    parser.add_argument('--match-window', type=int, default=MATCH_WINDOW)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--top', type=int, default=10, help='parameter sets to print')
+    parser.add_argument('--verify', action='store_true',
+                        help='check the replay against the device code with the device constants')
+    parser.add_argument('--latency', action='store_true',
+                        help='detection latency breakdown, from the device code')
+    parser.add_argument('--connect-period', type=float, default=0,
+                        help='--latency: seconds between client connections (0: always connected)')
+    args = parser.parse_args()
+
+    sources = [('file', path) for path in args.files]
+    sources += [('synthetic', (seed, args.days)) for seed in range(args.synthetic)]
+    if args.store:
+        # Stored traces are loaded here and handed to the workers as .npz files
+        import os # pylint: disable=C0415
+        import tempfile # pylint: disable=C0415
+        from host.fleet import FleetStore # pylint: disable=C0415
+        store = FleetStore(args.store)
+        tmp_dir = tempfile.mkdtemp(prefix='dd-replay-')
+        for device_id in args.device or store.devices():
+            trace = traces.from_store(store, device_id)
+            path = os.path.join(tmp_dir, device_id + '.npz')
+            np.savez(path, timestamp=trace.timestamps, humidity=trace.humidity,
+                     temperature=trace.temperature)
+            sources.append(('file', path))
+    if not sources:
+        parser.error('no traces: use --files, --synthetic or --store')
+
+    if args.verify:
+        verify(sources, DEVICE_PARAMS, args.capacity)
+        return
+    if args.latency:
+        latency(sources, args.connect_period, args.workers)
+        return
+
+    grid = make_grid(args.thresholds, args.min_percents, args.min_gaps, args.min_points)
+    start = time.perf_counter()
+    scores, seconds = sweep(sources, grid, args.workers, args.capacity, args.match_window)
+    elapsed = time.perf_counter() - start
+    trace_days = seconds / traces.DAY
+    print('%d traces, %.1f trace-days, %d parameter sets in %.2fs (%.0f trace-days/min)' % (
+        len(sources), trace_days, len(grid), elapsed, trace_days * 60 / elapsed))
+    # Best first: most detections, then fewest false positives and repeats
+    ranked = sorted(zip(grid, scores), key=lambda item: (
+        -item[1].detected, item[1].false_positives + item[1].repeats,
+        item[1].to_dict()['latency_p50'] or 0))
+    for params, result in ranked[:args.top]:
+        summary = dict(params._asdict(), **result.to_dict())
+        if params == DEVICE_PARAMS:
+            summary['device'] = True
+        print(json.dumps(summary))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+detect.py
+Vectorized re-implementation of Device.check_for_event for recorded traces.
+
+A trace is a series of sensor readings at the device's loop times.  Every row
+is one loop iteration: the reading (NaN humidity for a failed read) is pushed
+to the SensorCache, then check_for_event runs.  The math mirrors the device
+code: humidity in tenths, the sum over the last `capacity` readings, and the
+same integer comparisons (see threshold_tenths and percent_divisor), so the
+event times match the device's exactly; host.replay.verify checks that
+against the real Device code.
+"""
+import bisect
+import collections
+
+import numpy as np
+
+DEFAULT_CAPACITY = 120960 # calculate_cache_size(7, 5), as in main.py
+
+Params = collections.namedtuple(
+    'Params', ('threshold', 'min_percent', 'min_gap', 'min_points'))
+# The constants in src/device.py
+DEVICE_PARAMS = Params(threshold=99.1, min_percent=0.1, min_gap=60, min_points=6)
+
+
+class Trace: # pylint: disable=R0903
+    """
+    Trace
+    One recorded series: timestamps (seconds), humidity and temperature
+    (NaN for failed reads), and the labelled wet onset times, if known.
+    """
+    def __init__(self, timestamps, humidity, temperature=None, onsets=(), name=''): # pylint: disable=R0913
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+        self.humidity = np.asarray(humidity, dtype=np.float64)
+        self.temperature = (np.asarray(temperature, dtype=np.float64) if temperature is not None
+                            else np.zeros_like(self.humidity))
+        self.onsets = np.sort(np.asarray(onsets, dtype=np.float64))
+        self.name = name
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+def threshold_tenths(threshold):
+    """
+    threshold_tenths
+    HUMIDITY_THRESHOLD_TENTHS for a HUMIDITY_THRESHOLD, as in src/device.py.
+    """
+    return int(threshold * 10 + 0.001)
+
+
+def percent_divisor(min_percent):
+    """
+    percent_divisor
+    PERCENT_DIFF_DIVISOR for a MIN_PERCENT_DIFFERENCE, as in src/device.py.
+    """
+    return int(200 / min_percent + 0.5)
+
+
+class Features: # pylint: disable=R0903
+    """
+    Features
+    The per-row values check_for_event looks at, computed once per trace and
+    shared by every parameter set.
+    """
+    def __init__(self, trace, capacity=DEFAULT_CAPACITY):
+        valid = ~np.isnan(trace.humidity)
+        tenths = np.rint(trace.humidity[valid] * 10).astype(np.int64)
+        sums = np.concatenate([[0], np.cumsum(tenths)])
+        pushed = np.cumsum(valid) # readings pushed so far, per row
+        self.times = np.floor(trace.timestamps).astype(np.int64) # utime.time()
+        self.length = np.minimum(pushed, capacity)
+        last = np.maximum(pushed - 1, 0)
+        self.current = tenths[last] if len(tenths) else np.zeros(len(pushed), np.int64)
+        total = sums[pushed] - sums[pushed - self.length]
+        scaled = self.current * self.length
+        self.diff = scaled - total # > 0 <=> current above the average
+        self.magnitude = scaled + total
+
+
+def candidates(features, params):
+    """
+    candidates
+    Rows where every check_for_event condition except the time since the
+    last event holds.
+    """
+    return (_enough_points(features, params.min_points)
+            & _above_threshold(features, params.threshold)
+            & _big_change(features, params.min_percent))
+
+
+def _enough_points(features, min_points):
+    return features.length >= min_points
+
+
+def _above_threshold(features, threshold):
+    # current > HUMIDITY_THRESHOLD and current > average
+    return (features.current > threshold_tenths(threshold)) & (features.diff > 0)
+
+
+def _big_change(features, min_percent):
+    return features.diff > features.magnitude // percent_divisor(min_percent)
+
+
+def suppress(times, mask, min_gap):
+    """
+    suppress
+    Applies MIN_TIME_BETWEEN_EVENTS to the candidate rows: a candidate fires
+    if more than min_gap seconds passed since the last event (the device
+    starts with "last event at 0").  Jumps from event to event with a binary
+    search, so the cost is O(events * log(candidates)).  Returns event times.
+    """
+    candidate_times = times[mask].tolist() # bisect on a list beats np.searchsorted calls
+    events = []
+    last = 0
+    start = 0
+    while True:
+        start = bisect.bisect_right(candidate_times, last + min_gap, start)
+        if start >= len(candidate_times):
+            break
+        last = candidate_times[start]
+        events.append(last)
+    return np.asarray(events, dtype=np.int64)
+
+
+def detect(features, params):
+    """
+    detect
+    Event times check_for_event would produce for one parameter set.
+    """
+    return suppress(features.times, candidates(features, params), params.min_gap)
+
+
+def detect_grid(features, grid):
+    """
+    detect_grid
+    detect() for many parameter sets; the per-condition masks are computed
+    once per distinct value.  Returns a list of event time arrays.
+    """
+    masks = {}
+
+    def mask(condition, value):
+        key = (condition, value)
+        if key not in masks:
+            masks[key] = condition(features, value)
+        return masks[key]
+
+    results = []
+    for params in grid:
+        points = mask(_enough_points, params.min_points)
+        above = mask(_above_threshold, params.threshold)
+        diff = mask(_big_change, params.min_percent)
+        results.append(suppress(features.times, points & above & diff, params.min_gap))
+    return results
+
+
+class Score: # pylint: disable=R0903
+    """
+    Score
+    Events compared with labelled wet onsets.  An event within match_window
+    seconds after an onset detects it (the first one sets the latency; later
+    ones are repeats); any other event is a false positive.
+    """
+    def __init__(self, events=0, detected=0, missed=0, repeats=0, false_positives=0, # pylint: disable=R0913
+                 latencies=None):
+        self.events = events
+        self.detected = detected
+        self.missed = missed
+        self.repeats = repeats
+        self.false_positives = false_positives
+        self.latencies = latencies if latencies is not None else np.empty(0, np.float64)
+
+    def __iadd__(self, other):
+        self.events += other.events
+        self.detected += other.detected
+        self.missed += other.missed
+        self.repeats += other.repeats
+        self.false_positives += other.false_positives
+        self.latencies = np.concatenate([self.latencies, other.latencies])
+        return self
+
+    def to_dict(self):
+        """
+        to_dict
+        Summary of the score, with latency percentiles in seconds.
+        """
+        latencies = self.latencies
+        result = {
+            'events': self.events,
+            'detected': self.detected,
+            'missed': self.missed,
+            'repeats': self.repeats,
+            'false_positives': self.false_positives,
+            }
+        for name, value in (('latency_mean', np.mean), ('latency_p50', np.median),
+                            ('latency_p95', lambda x: np.percentile(x, 95)),
+                            ('latency_max', np.max)):
+            result[name] = round(float(value(latencies)), 1) if len(latencies) else None
+        return result
+
+
+def score(events, onsets, match_window):
+    """
+    score
+    Scores event times against sorted onset times.
+    """
+    if not len(onsets):
+        return Score(events=len(events), false_positives=len(events))
+    index = np.searchsorted(onsets, events, side='right') - 1
+    since = events - onsets[np.maximum(index, 0)]
+    matched = (index >= 0) & (since <= match_window)
+    detected, first = np.unique(index[matched], return_index=True)
+    return Score(events=len(events),
+                 detected=len(detected),
+                 missed=len(onsets) - len(detected),
+                 repeats=int(matched.sum()) - len(detected),
+                 false_positives=int((~matched).sum()),
+                 latencies=since[matched][first].astype(np.float64))
@@ -0,0 +1,148 @@
+"""
+latency.py
+Replays traces through the real Device code (under host.sim) with a client
+that acks event notifications, and collects the detection trace of every
+event (src/detection_trace.py): onset -> fire, split into MIN_DATA_POINTS
+warm-up, MIN_TIME_BETWEEN_EVENTS suppression and pending time, then fire ->
+notification sent -> acked.
+
+The client is either always connected, or connects every connect_period
+seconds (a phone waking up to sync), which is when queued notifications go
+out and get acked.  On labelled traces, the first event after each wet onset
+also gets the wet -> fire time.  Repeats (events fired while humidity stayed
+up after the previous one) are summarized apart from first events.
+"""
+import concurrent.futures
+import os
+
+import numpy as np
+
+from host.replay import traces
+from host.replay.sweep import MATCH_WINDOW
+from host.sim import SimDevice
+
+CLIENT_ID = 'replay'
+FIELDS = ('onset_ms', 'warmup_ms', 'suppressed_ms', 'pending_ms', 'sent_ms', 'acked_ms', 'wet_ms')
+
+
+def device_latency(trace, connect_period=0, duration=7, interval=5):
+    """
+    device_latency
+    Runs Device.sample() and process_notifications() once per trace row,
+    with the virtual clock at the row's timestamp.  Returns (one breakdown
+    dict per event fired, onsets abandoned).
+    """
+    row = [None]
+    acks = []
+    sim = SimDevice(sensor=lambda seconds: row[0], duration=duration, interval=interval)
+
+    def on_notification(value):
+        count, first_seq = value.decode().split('=', 1)[1].split(',')
+        acks.append(int(first_seq) + int(count) - 1)
+
+    try:
+        with sim.active():
+            from src.detection_trace import DetectionTrace # pylint: disable=C0415
+            device = sim.device
+            # Keep every breakdown, not just the last few the diagnostics show.
+            device.detection_trace = DetectionTrace(size=len(trace))
+            sim.subscribe('event_notif', on_notification)
+            sim.connect()
+            sim.write('pair', CLIENT_ID) # notifications are addressed to paired clients
+            if connect_period:
+                sim.disconnect()
+            next_connect = float(trace.timestamps[0]) + connect_period if len(trace) else 0.0
+            fired = []
+            for timestamp, humidity, temperature in zip(
+                    trace.timestamps, trace.humidity, trace.temperature):
+                sim.clock.advance(float(timestamp) - sim.clock.seconds)
+                row[0] = None if np.isnan(humidity) else (
+                    float(humidity), 0.0 if np.isnan(temperature) else float(temperature))
+                seq = device.events.next_seq()
+                device.sample()
+                if device.events.next_seq() != seq:
+                    fired.append(float(timestamp))
+                if connect_period and timestamp >= next_connect:
+                    sim.connect()
+                    sim.write('setup', 'sync_client=' + CLIENT_ID) # sends what is queued
+                    _ack(sim, acks)
+                    sim.disconnect()
+                    next_connect += connect_period * (1 + (timestamp - next_connect) // connect_period)
+                device.process_notifications()
+                _ack(sim, acks)
+            records = device.detection_trace.records()
+            abandoned = device.detection_trace.get_metrics()['abandoned']
+    finally:
+        sim.close()
+    _add_wet_times(records, fired, trace.onsets)
+    return records, abandoned
+
+
+def _ack(sim, acks):
+    while acks:
+        sim.write('setup', 'notify_ack=%s,%d' % (CLIENT_ID, acks.pop(0)))
+
+
+def _add_wet_times(records, fired, onsets):
+    """
+    _add_wet_times
+    Sets wet_ms on the first event within MATCH_WINDOW after each onset.
+    """
+    onsets = list(onsets if onsets is not None else ())
+    for record, when in zip(records, fired):
+        record['wet_ms'] = None
+        while onsets and when >= onsets[0]:
+            onset = onsets.pop(0)
+            if when - onset <= MATCH_WINDOW and (not onsets or when < onsets[0]):
+                record['wet_ms'] = int(round((when - onset) * 1000))
+
+
+def _run_source(source, connect_period):
+    kind, arg = source
+    trace = traces.synthetic(*arg) if kind == 'synthetic' else traces.load_file(arg)
+    return device_latency(trace, connect_period)
+
+
+def replay_latency(sources, connect_period=0, workers=None):
+    """
+    replay_latency
+    Runs device_latency over every trace source in a process pool.
+    Returns (all breakdowns, total onsets abandoned).
+    """
+    workers = workers or os.cpu_count() or 1
+    records = []
+    abandoned = 0
+    if workers == 1:
+        results = (_run_source(source, connect_period) for source in sources)
+        for source_records, source_abandoned in results:
+            records.extend(source_records)
+            abandoned += source_abandoned
+        return records, abandoned
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        for source_records, source_abandoned in pool.map(
+                _run_source, sources, [connect_period] * len(sources)):
+            records.extend(source_records)
+            abandoned += source_abandoned
+    return records, abandoned
+
+
+def summarize(records, repeat=False):
+    """
+    summarize
+    Over the first events (or the repeats), per field: how many events have
+    it, and its mean, p50, p95 and max in seconds (None if no event has it).
+    """
+    records = [record for record in records if record['repeat'] == repeat]
+    summary = {}
+    for field in FIELDS:
+        values = np.asarray([record[field] for record in records
+                             if record.get(field) is not None], dtype=np.float64) / 1000.0
+        name = field[:-3]
+        summary[name] = {
+            'count': len(values),
+            'mean': float(np.mean(values)) if len(values) else None,
+            'p50': float(np.median(values)) if len(values) else None,
+            'p95': float(np.percentile(values, 95)) if len(values) else None,
+            'max': float(np.max(values)) if len(values) else None,
+            }
+    return summary
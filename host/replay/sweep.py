@@ -0,0 +1,84 @@
+"""
+sweep.py
+Evaluates a grid of detection parameters over many traces in a process pool.
+
+Each worker loads (or generates) its traces itself, computes the trace
+features once and runs every parameter set over them, so only the small
+per-parameter scores cross process boundaries.
+"""
+import concurrent.futures
+import itertools
+import os
+
+from host.replay import traces
+from host.replay.detect import DEFAULT_CAPACITY, Features, Params, Score, detect_grid, score
+
+MATCH_WINDOW = 3600 # seconds after a wet onset in which events belong to it
+
+
+def make_grid(thresholds, min_percents, min_gaps, min_points):
+    """
+    make_grid
+    Every combination of the given parameter values.
+    """
+    return [Params(*values) for values in
+            itertools.product(thresholds, min_percents, min_gaps, min_points)]
+
+
+def evaluate(trace, grid, capacity=DEFAULT_CAPACITY, match_window=MATCH_WINDOW):
+    """
+    evaluate
+    Scores every parameter set in the grid on one trace.
+    """
+    features = Features(trace, capacity)
+    return [score(events, trace.onsets, match_window)
+            for events in detect_grid(features, grid)]
+
+
+def _load(source):
+    kind, arg = source
+    if kind == 'synthetic':
+        return traces.synthetic(*arg)
+    return traces.load_file(arg)
+
+
+def _run_chunk(sources, grid, capacity, match_window):
+    totals = [Score() for _ in grid]
+    seconds = 0.0
+    for source in sources:
+        trace = _load(source)
+        if len(trace) > 1:
+            seconds += trace.timestamps[-1] - trace.timestamps[0]
+        for total, result in zip(totals, evaluate(trace, grid, capacity, match_window)):
+            total += result
+    return totals, seconds
+
+
+def sweep(sources, grid, workers=None, capacity=DEFAULT_CAPACITY, match_window=MATCH_WINDOW, # pylint: disable=R0913
+          chunk_size=8):
+    """
+    sweep
+    Runs the grid over every trace source (('file', path) or
+    ('synthetic', (seed, days, ...))).  Returns (one Score per parameter set,
+    total trace seconds replayed).
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = [sources[i:i + chunk_size] for i in range(0, len(sources), chunk_size)]
+    totals = [Score() for _ in grid]
+    seconds = 0.0
+    if workers == 1:
+        results = (_run_chunk(chunk, grid, capacity, match_window) for chunk in chunks)
+        for chunk_totals, chunk_seconds in results:
+            seconds += chunk_seconds
+            for total, result in zip(totals, chunk_totals):
+                total += result
+        return totals, seconds
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_chunk, chunk, grid, capacity, match_window)
+                   for chunk in chunks]
+        for future in concurrent.futures.as_completed(futures):
+            chunk_totals, chunk_seconds = future.result()
+            seconds += chunk_seconds
+            for total, result in zip(totals, chunk_totals):
+                total += result
+    return totals, seconds
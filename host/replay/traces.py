@@ -0,0 +1,89 @@
+"""
+traces.py
+Sources of replay traces: CSV and .npz files, a fleet store, or synthetic
+diaper profiles (host.profiles) with known wet onsets.
+
+CSV traces have a header row with timestamp, humidity and temperature
+columns, plus an optional wet column; an empty humidity is a failed read and
+a non-zero wet value labels that row as a wet onset.  .npz traces hold
+timestamp, humidity, temperature and (optionally) onsets arrays.
+"""
+import csv
+import random
+
+import numpy as np
+
+from host.profiles import WetProfile, random_wet_times
+from host.replay.detect import Trace
+
+SYNTHETIC_START = 1700000000 # a time-set device; the day boundary doesn't matter
+DAY = 86400
+
+
+def load_csv(path):
+    """
+    load_csv
+    Reads a CSV trace.
+    """
+    timestamps, humidity, temperature, onsets = [], [], [], []
+    with open(path, newline='') as infile:
+        for row in csv.DictReader(infile):
+            timestamp = float(row['timestamp'])
+            timestamps.append(timestamp)
+            humidity.append(float(row['humidity']) if row.get('humidity') else np.nan)
+            temperature.append(float(row['temperature']) if row.get('temperature') else np.nan)
+            if row.get('wet') and float(row['wet']):
+                onsets.append(timestamp)
+    return Trace(timestamps, humidity, temperature, onsets, name=path)
+
+
+def load_npz(path):
+    """
+    load_npz
+    Reads a .npz trace.
+    """
+    with np.load(path) as arrays:
+        return Trace(arrays['timestamp'], arrays['humidity'],
+                     arrays['temperature'] if 'temperature' in arrays else None,
+                     arrays['onsets'] if 'onsets' in arrays else (), name=path)
+
+
+def load_file(path):
+    """
+    load_file
+    Loads a trace file, picking the format from its extension.
+    """
+    if path.endswith('.npz'):
+        return load_npz(path)
+    return load_csv(path)
+
+
+def from_store(store, device_id, start=None, end=None):
+    """
+    from_store
+    A device's stored readings (host.fleet.FleetStore) as an unlabelled trace.
+    Only successful reads are exported, so failed reads are not replayed.
+    """
+    columns = store.scan(device_id, start, end)
+    return Trace(columns['timestamp'], columns['humidity'], columns['temperature'],
+                 name=device_id)
+
+
+def synthetic(seed, days=1.0, interval=5, wet_per_day=6.0, failure_rate=0.002):
+    """
+    synthetic
+    A labelled trace of `days` at the device's reading interval, from a
+    WetProfile with random wet times and random failed reads.
+    """
+    rng = random.Random(seed)
+    start = SYNTHETIC_START + seed * DAY
+    duration = days * DAY
+    profile = WetProfile(random_wet_times(rng, start, duration, wet_per_day), seed=seed,
+                         baseline=rng.uniform(40.0, 70.0), drift=rng.uniform(0.5, 5.0),
+                         noise=rng.uniform(0.1, 0.8))
+    timestamps = start + np.arange(int(duration // interval), dtype=np.float64) * interval
+    humidity, temperature = profile.sample(timestamps)
+    failed = np.random.default_rng(seed).random(len(timestamps)) < failure_rate
+    humidity[failed] = np.nan
+    return Trace(timestamps, humidity, temperature, profile.wet_times,
+                 name='synthetic-%d' % seed)
@@ -0,0 +1,47 @@
+"""
+verify.py
+Replays a trace through the real Device code (under host.sim) to check the
+vectorized detector against it.
+"""
+import numpy as np
+
+from host.replay.detect import threshold_tenths, percent_divisor
+from host.sim import SimDevice
+
+
+def device_events(trace, params, duration=7, interval=5):
+    """
+    device_events
+    Runs Device.sample() once per trace row, with the virtual clock at the
+    row's timestamp and the detection constants in src.device set to params.
+    Returns the times of the events fired.
+    """
+    row = [None]
+    sim = SimDevice(sensor=lambda seconds: row[0], duration=duration, interval=interval)
+    try:
+        with sim.active():
+            import src.device # pylint: disable=C0415
+            names = ('HUMIDITY_THRESHOLD', 'MIN_PERCENT_DIFFERENCE', 'MIN_TIME_BETWEEN_EVENTS',
+                     'MIN_DATA_POINTS', 'HUMIDITY_THRESHOLD_TENTHS', 'PERCENT_DIFF_DIVISOR')
+            saved = [getattr(src.device, name) for name in names]
+            values = tuple(params) + (threshold_tenths(params.threshold),
+                                      percent_divisor(params.min_percent))
+            for name, value in zip(names, values):
+                setattr(src.device, name, value)
+            try:
+                events = []
+                for timestamp, humidity, temperature in zip(
+                        trace.timestamps, trace.humidity, trace.temperature):
+                    sim.clock.advance(float(timestamp) - sim.clock.seconds)
+                    row[0] = None if np.isnan(humidity) else (
+                        float(humidity), 0.0 if np.isnan(temperature) else float(temperature))
+                    seq = sim.device.events.next_seq()
+                    sim.device.sample()
+                    if sim.device.events.next_seq() != seq:
+                        events.append(int(timestamp))
+            finally:
+                for name, value in zip(names, saved):
+                    setattr(src.device, name, value)
+    finally:
+        sim.close()
+    return np.asarray(events, dtype=np.int64)
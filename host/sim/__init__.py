@@ -0,0 +1,202 @@
+"""
+host.sim
+Runs the unmodified device code (src/, lib/) under CPython.
+
+    from host.sim import SimDevice
+    sim = SimDevice()
+    sim.run(3600)                  # one hour of 5 second readings
+    sim.connect()
+    sim.write('setup', 'sync_client=phone-1')
+    print(sim.read('data'))
+
+With tcp_port= the device also runs its TCP sync server on localhost; serve it
+with `with sim.serving(): ...` and connect a host.sync.TcpTransport.
+
+MicroPython modules are replaced by the stand-ins in host.sim.micropython, so
+time is virtual and /flash lives in a temporary directory per device.
+"""
+import contextlib
+import shutil
+import sys
+import tempfile
+import threading
+
+from host.sim.micropython import CONTEXT, install, patch_gc
+
+# Characteristic names used by the host tools -> DeviceInfo attribute
+CHARACTERISTICS = {
+    'setup': 'bt_setup_char_id',
+    'pair': 'bt_pair_char_id',
+    'unpair': 'bt_unpair_char_id',
+    'data': 'bt_data_char_id',
+    'event': 'bt_event_char_id',
+    'event_notif': 'bt_event_notif_char_id',
+    'event_clear': 'bt_event_clear_char_id',
+    'diag': 'bt_diag_char_id',
+    'summary': 'bt_summary_char_id',
+    'query': 'bt_query_char_id',
+    }
+
+
+def constant_profile(humidity=45.0, temperature=22.0):
+    """
+    constant_profile
+    Sensor profile that always reads the same humidity/temperature.
+    """
+    return lambda seconds: (humidity, temperature)
+
+
+def silence():
+    """
+    silence
+    Turns the device code's console logging into no-ops.
+    """
+    for name, module in list(sys.modules.items()):
+        if module and (name.startswith('src.') or name.startswith('lib.')):
+            module.print = lambda *args, **kwargs: None
+
+
+class SimDevice: # pylint: disable=R0902
+    """
+    SimDevice
+    One simulated board: a Device instance, its flash directory, its sensor
+    profile (a function of the virtual time returning (humidity, temperature),
+    or None for a failed read) and its fake GATT server.
+    """
+    def __init__(self, sensor=None, flash_dir=None, duration=7, interval=5, num_events=100, # pylint: disable=R0913
+                 quiet=True, tcp_port=None):
+        install()
+        self.__owns_flash = flash_dir is None
+        self.flash_dir = flash_dir or tempfile.mkdtemp(prefix='dd-sim-')
+        self.sensor = sensor or constant_profile()
+        self.interval = interval
+        self.clock = CONTEXT.clock
+        with self.active():
+            from src.device import Device # pylint: disable=C0415
+            patch_gc()
+            if quiet:
+                silence()
+            self.device = Device(duration=duration, interval=interval, num_events=num_events,
+                                 tcp_port=tcp_port)
+        self.bluetooth = self.device.bluetooth_server.bluetooth
+        self.__uuids = {}
+        from lib.uuid import uuid2bytes # pylint: disable=C0415
+        bluetooth_ids = self.device.device_info.get_bluetooth_ids()
+        for name, key in CHARACTERISTICS.items():
+            self.__uuids[name] = uuid2bytes(bluetooth_ids[key])
+
+    @contextlib.contextmanager
+    def active(self):
+        """
+        active
+        Makes this device the one whose flash and sensor the stand-ins use.
+        """
+        previous = CONTEXT.flash_root, CONTEXT.sensor
+        CONTEXT.flash_root, CONTEXT.sensor = self.flash_dir, self.sensor
+        try:
+            yield self
+        finally:
+            CONTEXT.flash_root, CONTEXT.sensor = previous
+
+    def step(self):
+        """
+        step
+        One iteration of the main.py loop, without the sleep.
+        """
+        with self.active():
+            self.device.sample()
+            self.device.process_notifications()
+            self.device.idle()
+
+    def run(self, seconds):
+        """
+        run
+        Runs the main loop for the given number of virtual seconds.
+        """
+        end = self.clock.seconds + seconds
+        while self.clock.seconds < end:
+            self.step()
+            self.clock.advance(self.interval)
+
+    def characteristic(self, name):
+        """
+        characteristic
+        Returns the fake GATT characteristic with the given name.
+        """
+        return self.bluetooth.characteristics[self.__uuids[name]]
+
+    def read(self, name):
+        """
+        read
+        Client read of a characteristic.  Returns bytes.
+        """
+        with self.active():
+            return self.characteristic(name).read()
+
+    def write(self, name, value):
+        """
+        write
+        Client write to a characteristic.
+        """
+        with self.active():
+            self.characteristic(name).write(value)
+
+    def subscribe(self, name, callback):
+        """
+        subscribe
+        Calls callback(value) whenever the device notifies on a characteristic.
+        """
+        self.characteristic(name).subscribers.append(callback)
+
+    def connect(self):
+        """
+        connect
+        Simulates a client connecting.
+        """
+        with self.active():
+            self.bluetooth.connect_client()
+
+    def disconnect(self):
+        """
+        disconnect
+        Simulates a client disconnecting.
+        """
+        with self.active():
+            self.bluetooth.disconnect_client()
+
+    @contextlib.contextmanager
+    def serving(self, poll_ms=10):
+        """
+        serving
+        Serves the device's TCP sync server (tcp_port=) from a background
+        thread while the block runs, like Device.wait_for_samples() does on
+        the board between readings, and sends the notifications that are
+        due, like the main loop does.  Don't step or read the device from the
+        block's thread meanwhile.
+        """
+        stop = threading.Event()
+
+        def serve():
+            with self.active():
+                while not stop.is_set():
+                    self.device.socket_server.poll(poll_ms)
+                    self.device.process_notifications()
+
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            thread.join()
+
+    def close(self):
+        """
+        close
+        Removes the flash directory if it was created by this SimDevice, and
+        stops the TCP sync server.
+        """
+        if self.device.socket_server:
+            self.device.socket_server.close()
+        if self.__owns_flash:
+            shutil.rmtree(self.flash_dir, ignore_errors=True)
@@ -0,0 +1,78 @@
+"""
+python -m host.sim
+Runs simulated devices on a scripted wet profile (host.profiles) and reports
+how much deadband recording (setup_config=deadband=..,heartbeat=..) shrinks
+the stored history, next to the events the detector fired.  The first row is
+the device with every reading stored.
+
+    python -m host.sim --days 1 --heartbeat 300 --deadband 0 0.1 0.3
+    python -m host.sim --noise 0 --drift 0.5   # a quiet sensor
+"""
+import argparse
+import random
+import json
+
+from host.profiles import WetProfile, random_wet_times
+from host.sim import SimDevice
+from host.sim.micropython import CONTEXT
+
+DAY = 86400
+
+
+def run(profile, seconds, interval, deadband=None, heartbeat=0):
+    """
+    run
+    Runs a fresh device on the profile.  Returns its recording diagnostics
+    ({"stored", "readings"}) and the number of events it fired.
+    """
+    CONTEXT.clock.seconds = 0.0
+    retention = seconds / DAY + 0.01 # keep everything, so nothing is evicted
+    sim = SimDevice(sensor=profile, interval=interval, duration=retention, num_events=1000)
+    try:
+        if heartbeat:
+            sim.write('setup', 'setup_config=deadband=%s,heartbeat=%d' % (deadband, heartbeat))
+            with sim.active():
+                sim.device.idle() # applies it before the first reading
+        sim.run(seconds)
+        recording = json.loads(sim.read('diag'))['recording']
+        events = sim.device.events.next_seq()
+    finally:
+        sim.close()
+    return recording, events
+
+
+def main():
+    """
+    main
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=float, default=1.0)
+    parser.add_argument('--interval', type=int, default=5)
+    parser.add_argument('--deadband', type=float, nargs='+', default=[0.0, 0.1, 0.3],
+                        help='deadband(s) in %% / degrees')
+    parser.add_argument('--heartbeat', type=int, default=300, help='seconds')
+    parser.add_argument('--wet-per-day', type=float, default=4)
+    parser.add_argument('--noise', type=float, default=0.4)
+    parser.add_argument('--drift', type=float, default=3.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    seconds = int(args.days * DAY)
+    wet_times = random_wet_times(random.Random(args.seed), 0, seconds, args.wet_per_day, 3600)
+    profile = WetProfile(wet_times, seed=args.seed, noise=args.noise, drift=args.drift)
+
+    print('%-9s %9s %9s %9s %9s %7s' % (
+        'deadband', 'heartbeat', 'readings', 'stored', 'reduction', 'events'))
+    settings = [(None, 0)] + [(deadband, args.heartbeat) for deadband in args.deadband]
+    for deadband, heartbeat in settings:
+        recording, events = run(profile, seconds, args.interval, deadband, heartbeat)
+        reduction = 1 - recording['stored'] / recording['readings'] if recording['readings'] else 0
+        print('%-9s %9d %9d %9d %8.1f%% %7d' % (
+            'off' if deadband is None else deadband, heartbeat, recording['readings'],
+            recording['stored'], 100 * reduction, events))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,515 @@
+"""
+micropython.py
+CPython stand-ins for the MicroPython/Pycom modules the device code imports
+(utime, uio, uos, ujson, uarray, ubinascii, machine, pycom, network).
+
+Time is virtual: utime.sleep advances the simulated clock instead of blocking.
+Paths under /flash are mapped into the directory of the active SimDevice, and
+the DHT pin returns pulses generated from the active device's sensor profile.
+"""
+import array
+import binascii
+import calendar
+import hashlib
+import io
+import json
+import os
+import select
+import socket
+import struct
+import sys
+import time
+import tracemalloc
+import types
+
+FLASH_PREFIX = '/flash'
+
+class SimClock:
+    """
+    SimClock
+    Virtual wall clock (seconds since 1970) plus a monotonic ms tick counter.
+    """
+    def __init__(self):
+        self.seconds = 0.0 # wall clock, like the RTC right after boot
+        self.ticks = 0.0 # monotonic, in seconds
+
+    def advance(self, seconds):
+        """
+        advance
+        Moves both clocks forward.
+        """
+        self.seconds += seconds
+        self.ticks += seconds
+
+    def set_wall(self, time_tuple):
+        """
+        set_wall
+        Sets the wall clock from a (year, month, day, hour, minute, second) tuple.
+        """
+        self.seconds = float(time_to_seconds(time_tuple))
+
+
+def time_to_seconds(time_tuple):
+    """
+    time_to_seconds
+    Converts a (year, month, day, hour, minute, second) tuple to epoch seconds.
+    """
+    return calendar.timegm(tuple(time_tuple[:6]) + (0, 0, 0))
+
+
+class SimContext:
+    """
+    SimContext
+    Process-wide simulator state: the clock, and the device that is "running".
+    """
+    def __init__(self):
+        self.clock = SimClock()
+        self.flash_root = None
+        self.sensor = None
+        self.mem_free = 2 * 1024 * 1024 # what gc.mem_free() reports
+
+
+CONTEXT = SimContext()
+
+
+def map_path(path):
+    """
+    map_path
+    Maps a device path under /flash into the active device's flash directory.
+    """
+    if path.startswith(FLASH_PREFIX):
+        if CONTEXT.flash_root is None:
+            raise OSError(2, 'No simulated flash mounted', path)
+        return os.path.join(CONTEXT.flash_root, path[len(FLASH_PREFIX):].lstrip('/'))
+    return path
+
+
+def _make_utime():
+    utime = types.ModuleType('utime')
+    clock = CONTEXT.clock
+    utime.time = lambda: int(clock.seconds)
+    utime.sleep = clock.advance
+    utime.sleep_ms = lambda ms: clock.advance(ms / 1000.0)
+    utime.sleep_us = lambda us: clock.advance(us / 1000000.0)
+    utime.ticks_ms = lambda: int(clock.ticks * 1000) & 0x3FFFFFFF
+    utime.ticks_us = lambda: int(clock.ticks * 1000000) & 0x3FFFFFFF
+    utime.ticks_cpu = lambda: time.perf_counter_ns() & 0x3FFFFFFF
+    utime.ticks_add = lambda ticks, delta: (ticks + delta) & 0x3FFFFFFF
+    utime.ticks_diff = _ticks_diff
+    utime.localtime = lambda secs=None: time.gmtime(clock.seconds if secs is None else secs)[:8]
+    return utime
+
+
+def _ticks_diff(end, start):
+    diff = (end - start) & 0x3FFFFFFF
+    if diff >= 0x20000000:
+        diff -= 0x40000000
+    return diff
+
+
+def _make_uio():
+    uio = types.ModuleType('uio')
+    uio.open = lambda path, mode='r': io.open(map_path(path), mode)
+    uio.StringIO = io.StringIO
+    uio.BytesIO = io.BytesIO
+    return uio
+
+
+def _make_uos():
+    uos = types.ModuleType('uos')
+    uos.remove = lambda path: os.remove(map_path(path))
+    uos.rename = lambda src, dst: os.rename(map_path(src), map_path(dst))
+    uos.stat = lambda path: os.stat(map_path(path))
+    uos.listdir = lambda path='/flash': os.listdir(map_path(path))
+    uos.mkdir = lambda path: os.mkdir(map_path(path))
+    uos.urandom = os.urandom
+    uos.sync = lambda: None
+    return uos
+
+
+class Pin:
+    """
+    Pin
+    machine.Pin stand-in.  The DHT data pin is read through pycom.pulses_get.
+    """
+    IN = 1
+    OUT = 2
+    OPEN_DRAIN = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, pin_id, mode=None, pull=None):
+        self.pin_id = pin_id.pin_id if isinstance(pin_id, Pin) else pin_id
+        self.mode = mode
+        self.pull = pull
+        self.level = 1
+
+    def init(self, mode=None, pull=None):
+        """
+        init
+        Reconfigures the pin.
+        """
+        self.mode = mode
+        self.pull = pull
+
+    def __call__(self, value=None):
+        if value is None:
+            return self.level
+        self.level = value
+        return None
+
+
+class RTC:
+    """
+    RTC
+    machine.RTC stand-in backed by the simulated clock.
+    """
+    def init(self, time_tuple):
+        """
+        init
+        Sets the clock.
+        """
+        CONTEXT.clock.set_wall(time_tuple)
+
+    def now(self): # pylint: disable=R0201
+        """
+        now
+        Returns (year, month, day, hour, minute, second, usecond, tz).
+        """
+        secs = CONTEXT.clock.seconds
+        return tuple(time.gmtime(secs)[:6]) + (int((secs % 1) * 1000000), None)
+
+
+def _make_machine():
+    machine = types.ModuleType('machine')
+    machine.Pin = Pin
+    machine.RTC = RTC
+    machine.reset = lambda: None
+    machine.idle = lambda: None
+    return machine
+
+
+def dht_pulses(humidity, temperature):
+    """
+    dht_pulses
+    Encodes a DHT22 reading as the (level, duration_us) pulses the sensor sends.
+    """
+    rh10 = int(round(humidity * 10))
+    t10 = int(round(abs(temperature) * 10))
+    the_bytes = [rh10 >> 8, rh10 & 0xFF, (t10 >> 8) | (0x80 if temperature < 0 else 0), t10 & 0xFF]
+    the_bytes.append(sum(the_bytes) & 0xFF)
+    pulses = [(1, 40), (0, 80), (1, 80)]
+    for byte in the_bytes:
+        for bit in range(7, -1, -1):
+            pulses.append((0, 50))
+            pulses.append((1, 70 if byte & (1 << bit) else 24))
+    pulses.append((0, 50))
+    return pulses
+
+
+def _pulses_get(pin, timeout): # pylint: disable=W0613
+    sensor = CONTEXT.sensor
+    if sensor is None:
+        return []
+    reading = sensor(CONTEXT.clock.seconds)
+    if reading is None:
+        return [] # simulated read failure
+    return dht_pulses(*reading)
+
+
+def _make_pycom():
+    pycom = types.ModuleType('pycom')
+    pycom.heartbeat = lambda enabled=None: None
+    pycom.wifi_on_boot = lambda enabled=None: None
+    pycom.rgbled = lambda color: None
+    pycom.pulses_get = _pulses_get
+    return pycom
+
+
+class Characteristic:
+    """
+    Characteristic
+    GATT characteristic stand-in.  The simulator (acting as the client) calls
+    read()/write(); the device code sees the usual callback/value() API.
+    """
+    def __init__(self, uuid, properties, value):
+        self.uuid = uuid
+        self.properties = properties
+        self.__value = value
+        self.__handlers = {}
+        self.__events = 0
+        self.subscribers = []
+
+    def value(self, value=None):
+        """
+        value
+        Gets or sets the characteristic value.  Setting the value of a notify
+        characteristic notifies subscribers.
+        """
+        if value is None:
+            return self.__value
+        if isinstance(value, str):
+            value = value.encode()
+        self.__value = value
+        if self.properties & (Bluetooth.PROP_NOTIFY | Bluetooth.PROP_INDICATE):
+            for subscriber in list(self.subscribers):
+                subscriber(value)
+        return None
+
+    def callback(self, trigger=None, handler=None, arg=None): # pylint: disable=W0613
+        """
+        callback
+        Registers a handler for CHAR_READ_EVENT and/or CHAR_WRITE_EVENT.
+        """
+        for event in (Bluetooth.CHAR_READ_EVENT, Bluetooth.CHAR_WRITE_EVENT):
+            if trigger & event:
+                self.__handlers[event] = handler
+
+    def events(self):
+        """
+        events
+        Returns the events that triggered the current callback.
+        """
+        return self.__events
+
+    def read(self):
+        """
+        read
+        Performs a client read: runs the read handler, then returns the value.
+        """
+        handler = self.__handlers.get(Bluetooth.CHAR_READ_EVENT)
+        if handler:
+            self.__events = Bluetooth.CHAR_READ_EVENT
+            handler(self)
+        return self.__value or b''
+
+    def write(self, value):
+        """
+        write
+        Performs a client write: stores the value, then runs the write handler.
+        """
+        if isinstance(value, str):
+            value = value.encode()
+        self.__value = value
+        handler = self.__handlers.get(Bluetooth.CHAR_WRITE_EVENT)
+        if handler:
+            self.__events = Bluetooth.CHAR_WRITE_EVENT
+            handler(self)
+
+
+class Service:
+    """
+    Service
+    GATT service stand-in.
+    """
+    def __init__(self, bluetooth, uuid):
+        self.bluetooth = bluetooth
+        self.uuid = uuid
+
+    def characteristic(self, uuid, properties=0, value=None):
+        """
+        characteristic
+        Creates a characteristic in this service.
+        """
+        char = Characteristic(uuid, properties, value)
+        self.bluetooth.characteristics[uuid] = char
+        return char
+
+
+class Bluetooth:
+    """
+    Bluetooth
+    network.Bluetooth stand-in holding the GATT table of one device.
+    """
+    PROP_BROADCAST = 0x01
+    PROP_READ = 0x02
+    PROP_WRITE_NR = 0x04
+    PROP_WRITE = 0x08
+    PROP_NOTIFY = 0x10
+    PROP_INDICATE = 0x20
+    PROP_AUTH = 0x40
+    PROP_EXT_PROP = 0x80
+    CLIENT_CONNECTED = 0x01
+    CLIENT_DISCONNECTED = 0x02
+    CHAR_READ_EVENT = 0x04
+    CHAR_WRITE_EVENT = 0x08
+    NEW_ADV_EVENT = 0x10
+
+    def __init__(self):
+        self.advertisement = {}
+        self.advertising = False
+        self.services = []
+        self.characteristics = {}
+        self.__handler = None
+        self.__events = 0
+
+    def set_advertisement(self, **kwargs):
+        """
+        set_advertisement
+        Stores the advertisement data.
+        """
+        self.advertisement = kwargs
+
+    def advertise(self, enable):
+        """
+        advertise
+        Turns advertising on or off.
+        """
+        self.advertising = enable
+
+    def service(self, uuid, isprimary=True, nbr_chars=1, start=True): # pylint: disable=W0613
+        """
+        service
+        Creates a GATT service.
+        """
+        service = Service(self, uuid)
+        self.services.append(service)
+        return service
+
+    def callback(self, trigger=None, handler=None, arg=None): # pylint: disable=W0613
+        """
+        callback
+        Registers the connection handler.
+        """
+        self.__handler = handler
+
+    def events(self):
+        """
+        events
+        Returns the events that triggered the current callback.
+        """
+        return self.__events
+
+    def get_adv(self): # pylint: disable=R0201
+        """
+        get_adv
+        Returns the last advertisement seen (none in the simulator).
+        """
+        return None
+
+    def connect_client(self):
+        """
+        connect_client
+        Simulates a client connecting.
+        """
+        self.__fire(Bluetooth.CLIENT_CONNECTED)
+
+    def disconnect_client(self):
+        """
+        disconnect_client
+        Simulates a client disconnecting.
+        """
+        self.__fire(Bluetooth.CLIENT_DISCONNECTED)
+
+    def __fire(self, events):
+        self.__events = events
+        if self.__handler:
+            self.__handler(self)
+
+
+def _make_gc():
+    # MicroPython's gc has heap statistics and CPython's doesn't.  While
+    # tracemalloc is tracing, mem_alloc() is the bytes it traces (CPython frees
+    # on the last reference, so a difference only counts what was kept);
+    # otherwise 0.  mem_free() is the board's heap, settable on the context.
+    # collect() is a no-op: a full CPython collection every loop would
+    # dominate run time.
+    gc = types.ModuleType('gc')
+    gc.collect = lambda: None
+    gc.mem_alloc = lambda: tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+    gc.mem_free = lambda: CONTEXT.mem_free
+    gc.enable = gc.disable = lambda: None
+    return gc
+
+
+GC = _make_gc()
+
+
+def patch_gc():
+    """
+    patch_gc
+    Points the `gc` global of every loaded device module at the stand-in.
+    (The device code imports `gc`, which CPython already provides.)
+    """
+    for name, module in list(sys.modules.items()):
+        if module and (name.startswith('src.') or name.startswith('lib.')) \
+                and getattr(module, 'gc', None) is not None and module.gc is not GC:
+            module.gc = GC
+
+
+def _make_network():
+    network = types.ModuleType('network')
+    network.Bluetooth = Bluetooth
+    return network
+
+
+class Poll:
+    """
+    Poll
+    uselect.poll stand-in.  MicroPython's poll() returns the registered
+    objects; CPython's returns file descriptors.
+    """
+    def __init__(self):
+        self.__poll = select.poll()
+        self.__objects = {}
+
+    def register(self, obj, eventmask=select.POLLIN):
+        """
+        register
+        Starts polling obj.
+        """
+        self.__objects[obj.fileno()] = obj
+        self.__poll.register(obj, eventmask)
+
+    def unregister(self, obj):
+        """
+        unregister
+        Stops polling obj.
+        """
+        self.__objects.pop(obj.fileno(), None)
+        self.__poll.unregister(obj)
+
+    def poll(self, timeout=-1):
+        """
+        poll
+        Returns [(obj, events), ...] for the ready objects.
+        """
+        return [(self.__objects[fd], events) for fd, events in self.__poll.poll(timeout)
+                if fd in self.__objects]
+
+
+def _make_uselect():
+    uselect = types.ModuleType('uselect')
+    uselect.poll = Poll
+    uselect.POLLIN = select.POLLIN
+    uselect.POLLOUT = select.POLLOUT
+    uselect.POLLHUP = select.POLLHUP
+    uselect.POLLERR = select.POLLERR
+    return uselect
+
+
+def install():
+    """
+    install
+    Registers the stand-in modules in sys.modules.  Safe to call repeatedly.
+    """
+    if 'utime' in sys.modules and getattr(sys.modules['utime'], '__sim__', False):
+        return
+    modules = {
+        'utime': _make_utime(),
+        'uio': _make_uio(),
+        'uos': _make_uos(),
+        'machine': _make_machine(),
+        'pycom': _make_pycom(),
+        'network': _make_network(),
+        'uselect': _make_uselect(),
+        }
+    for module in modules.values():
+        module.__sim__ = True
+    modules['ujson'] = json
+    modules['uarray'] = array
+    modules['ubinascii'] = binascii
+    modules['ustruct'] = struct
+    modules['uhashlib'] = hashlib
+    modules['usocket'] = socket # real sockets: the TCP sync server listens on localhost
+    sys.modules.update(modules)
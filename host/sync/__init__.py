@@ -0,0 +1,6 @@
+"""
+host.sync
+Host-side sync client for the device protocol, and its transports.
+"""
+from host.sync.client import SyncClient, SyncResult, decode_data, decode_events, expand_data
+from host.sync.transport import Transport, InProcessTransport, TcpTransport
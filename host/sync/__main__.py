@@ -0,0 +1,46 @@
+"""
+python -m host.sync
+Measures the end-to-end sync rate against a simulated device, without radios.
+"""
+import argparse
+import asyncio
+
+from host.sim import SimDevice
+from host.sync import SyncClient, InProcessTransport
+
+
+async def measure(records, batch_size, window):
+    """
+    measure
+    Fills a simulated device with readings, then syncs them all.
+    """
+    sim = SimDevice()
+    try:
+        sim.run(records * sim.interval)
+        client = SyncClient(InProcessTransport(sim), 'host-sync', batch_size=batch_size,
+                            window=window)
+        await client.connect()
+        await client.pair()
+        result = await client.sync()
+        await client.disconnect()
+    finally:
+        sim.close()
+    print('records: %d  reads: %d  bytes: %d  seconds: %.3f  records/s: %.0f' % (
+        result.records, result.reads, result.bytes, result.seconds, result.records_per_second))
+
+
+def main():
+    """
+    main
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--window', type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(measure(args.records, args.batch_size, args.window))
+
+
+if __name__ == '__main__':
+    main()
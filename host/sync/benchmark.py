@@ -0,0 +1,180 @@
+"""
+python -m host.sync.benchmark
+End-to-end sync benchmark over a simulated BLE link, and over TCP.
+
+Fills a simulated device's caches to the capacities main.py uses (7 days of
+5 second readings, 100 events), drains them through the BluetoothServer
+data/event callbacks over a BleLink, and reports records/s, bytes on air,
+total sync time and device CPU time per record.  One-record-per-read and
+batched (sync_batch=) reads are compared for every link setting.
+
+The same caches are then drained over the device's TCP sync server on
+localhost, with pipelined requests and --tcp-batch-size rows per read
+(capped at 4 KB per reply), timed on the wall clock.  Localhost has no radio,
+so this is the device code's TCP limit; a WiFi round trip adds to it.
+
+    python -m host.sync.benchmark
+    python -m host.sync.benchmark --mtu 23 247 --interval 7.5 30 --readings 20000
+"""
+import argparse
+import asyncio
+import itertools
+import socket
+import time
+
+from host.sim import SimDevice
+from host.sim.micropython import CONTEXT
+from host.sync.client import SyncClient
+from host.sync.link import BleLink, BleLinkTransport
+from host.sync.transport import TcpTransport
+
+READINGS = 120960 # calculate_cache_size(7, 5)
+EVENTS = 100 # EVENTS_COUNT in main.py
+MODES = (('single', 1), ('batch', 64))
+TCP_BATCH_SIZE = 1000
+
+
+def fill(sim, readings, events):
+    """
+    fill
+    Pushes readings (one per interval of virtual time) and events straight
+    into the device caches.
+    """
+    with sim.active():
+        from src.sensor_data import SensorData # pylint: disable=C0415
+        from src.event import Event # pylint: disable=C0415
+        device = sim.device
+        for i in range(readings):
+            sim.clock.advance(sim.interval)
+            device.sensor_data.push(SensorData(40.0 + (i % 500) / 10.0, 20.0 + (i % 100) / 10.0))
+        for _ in range(events):
+            device.events.push(Event())
+
+
+async def run(link, batch_size, readings, events):
+    """
+    run
+    Syncs a freshly filled device over the link.  Returns a result dict.
+    """
+    CONTEXT.clock.seconds = 0.0 # same timestamps, so the same row sizes, in every run
+    sim = SimDevice(num_events=max(events, 1))
+    try:
+        fill(sim, readings, events)
+        transport = BleLinkTransport(sim, link)
+        client = SyncClient(transport, 'bench', batch_size=batch_size, window=1)
+        await client.connect()
+        await client.pair()
+        start_seconds, start_cpu = link.seconds, transport.device_seconds
+        start_bytes = link.air_bytes
+        result = await client.sync()
+        await client.disconnect()
+    finally:
+        sim.close()
+    sync_seconds = link.seconds - start_seconds
+    return {
+        'records': result.records,
+        'reads': result.reads,
+        'att_ops': link.ops,
+        'air_bytes': link.air_bytes - start_bytes,
+        'sync_seconds': sync_seconds,
+        'records_per_second': result.records / sync_seconds if sync_seconds else 0.0,
+        'cpu_us_per_record': ((transport.device_seconds - start_cpu) * 1e6 / result.records
+                              if result.records else 0.0),
+        }
+
+
+def free_port():
+    """
+    free_port
+    Returns a TCP port on localhost that is free right now.
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def run_tcp(batch_size, readings, events, clients=1):
+    """
+    run_tcp
+    Syncs a freshly filled device over its TCP sync server, with `clients`
+    paired clients syncing concurrently.  Returns a result dict.
+    """
+    CONTEXT.clock.seconds = 0.0
+    port = free_port()
+    sim = SimDevice(num_events=max(events, 1), tcp_port=port)
+    try:
+        fill(sim, readings, events)
+        with sim.serving():
+            sync_clients = [SyncClient(TcpTransport('127.0.0.1', port), 'bench-%d' % i,
+                                       batch_size=batch_size) for i in range(clients)]
+            for client in sync_clients:
+                await client.connect()
+                await client.pair()
+            start = time.perf_counter()
+            results = await asyncio.gather(*[client.sync() for client in sync_clients])
+            sync_seconds = time.perf_counter() - start
+            for client in sync_clients:
+                await client.disconnect()
+    finally:
+        sim.close()
+    records = sum(result.records for result in results)
+    return {
+        'records': records,
+        'reads': sum(result.reads for result in results),
+        'bytes': sum(result.bytes for result in results),
+        'sync_seconds': sync_seconds,
+        'records_per_second': records / sync_seconds if sync_seconds else 0.0,
+        }
+
+
+def main():
+    """
+    main
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readings', type=int, default=READINGS)
+    parser.add_argument('--events', type=int, default=EVENTS)
+    parser.add_argument('--mtu', type=int, nargs='+', default=[23, 185])
+    parser.add_argument('--interval', type=float, nargs='+', default=[30.0],
+                        help='connection interval(s), ms')
+    parser.add_argument('--op-latency', type=float, default=1.0, help='per-op device latency, ms')
+    parser.add_argument('--packets-per-event', type=int, default=6)
+    parser.add_argument('--ll-payload', type=int, default=27,
+                        help='link-layer payload size (251 with data length extension)')
+    parser.add_argument('--cpu-scale', type=float, default=1.0,
+                        help='multiplier for measured device CPU time (host vs board)')
+    parser.add_argument('--batch-size', type=int, default=MODES[1][1])
+    parser.add_argument('--tcp-batch-size', type=int, default=TCP_BATCH_SIZE)
+    parser.add_argument('--tcp-clients', type=int, nargs='+', default=[1, 4],
+                        help='concurrent TCP clients (0 skips the TCP runs)')
+    args = parser.parse_args()
+
+    modes = (MODES[0], (MODES[1][0], args.batch_size))
+    print('%-6s %5s %8s %8s %8s %12s %10s %10s %10s' % (
+        'mode', 'mtu', 'interval', 'records', 'att_ops', 'air_bytes', 'sync_s', 'records/s',
+        'cpu_us/rec'))
+    for mtu, interval, (mode, batch_size) in itertools.product(args.mtu, args.interval, modes):
+        link = BleLink(mtu=mtu, interval_ms=interval, op_latency_ms=args.op_latency,
+                       ll_payload=args.ll_payload, packets_per_event=args.packets_per_event,
+                       cpu_scale=args.cpu_scale)
+        result = asyncio.run(run(link, batch_size, args.readings, args.events))
+        print('%-6s %5d %8.1f %8d %8d %12d %10.1f %10.1f %10.1f' % (
+            mode, mtu, interval, result['records'], result['att_ops'], result['air_bytes'],
+            result['sync_seconds'], result['records_per_second'], result['cpu_us_per_record']))
+
+    clients = [count for count in args.tcp_clients if count > 0]
+    if clients:
+        print()
+        print('%-6s %7s %8s %8s %12s %10s %10s' % (
+            'mode', 'clients', 'records', 'reads', 'bytes', 'sync_s', 'records/s'))
+    for count in clients:
+        result = asyncio.run(run_tcp(args.tcp_batch_size, args.readings, args.events, count))
+        print('%-6s %7d %8d %8d %12d %10.2f %10.1f' % (
+            'tcp', count, result['records'], result['reads'], result['bytes'],
+            result['sync_seconds'], result['records_per_second']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+"""
+client.py
+Host-side (CPython, asyncio) client for the device sync protocol.
+
+    client = SyncClient(transport, client_id='phone-1')
+    await client.connect()
+    await client.pair()
+    result = await client.sync()
+    print(result.records_per_second, len(result.data), len(result.events))
+
+Data is read in batches (sync_batch=) with several reads kept in flight, and
+the raw responses are decoded in one go once the cache is drained.  Only then
+are they acked (data_ack=, event_ack=): the device keeps what a client has
+read but not acked, and returns it again after the client identifies itself.
+"""
+import asyncio
+import collections
+import datetime
+import json
+import re
+import time
+
+DEFAULT_BATCH_SIZE = 64 # rows per data read (the device caps it to fit 512 bytes)
+REMAINING_RE = re.compile(rb'"remaining":\s*(\d+)')
+
+
+class SyncResult: # pylint: disable=R0903
+    """
+    SyncResult
+    Records fetched by one SyncClient.sync() call plus transfer statistics.
+    """
+    def __init__(self, data, events, reads, num_bytes, seconds):
+        self.data = data
+        self.events = events
+        self.reads = reads
+        self.bytes = num_bytes
+        self.seconds = seconds
+
+    @property
+    def records(self):
+        """
+        records
+        Total number of data points and events fetched.
+        """
+        return len(self.data) + len(self.events)
+
+    @property
+    def records_per_second(self):
+        """
+        records_per_second
+        Sync rate over the whole call.
+        """
+        return self.records / self.seconds if self.seconds else 0.0
+
+
+def decode_data(responses):
+    """
+    decode_data
+    Decodes raw data-characteristic responses (single or batched) into a list
+    of {"data_id", "timestamp", "humidity", "temperature"} dicts.
+    """
+    return expand_data(_decode_all(responses))
+
+
+def expand_data(responses):
+    """
+    expand_data
+    Like decode_data, for responses that have already been parsed.
+    """
+    records = []
+    for response in responses:
+        if 'rows' in response:
+            prefix = response['epoch'] + '-'
+            if 'seqs' in response: # pinned readings (query) are not consecutive
+                seqs = response['seqs']
+            else:
+                seqs = range(response['seq'], response['seq'] + len(response['rows']))
+            for seq, row in zip(seqs, response['rows']):
+                record = {
+                    'data_id': prefix + str(seq),
+                    'timestamp': row[0],
+                    'humidity': row[1],
+                    'temperature': row[2],
+                    }
+                if len(row) > 3:
+                    record['repeats'] = row[3] # deadband recording; see host.export.full_rate
+                records.append(record)
+        elif 'data' in response:
+            records.append(response['data'])
+    return records
+
+
+def decode_events(responses):
+    """
+    decode_events
+    Decodes raw event-characteristic responses into a list of event dicts.
+    """
+    return [response['event'] for response in _decode_all(responses) if 'event' in response]
+
+
+def _decode_all(responses):
+    """
+    _decode_all
+    Parses every response with a single json.loads call.
+    """
+    if not responses:
+        return []
+    return json.loads(b'[' + b','.join(responses) + b']')
+
+
+def _next_seq(responses):
+    """
+    _next_seq
+    Returns the seq after the last record in parsed data or event responses,
+    or None if they hold no record.
+    """
+    next_seq = None
+    for response in responses:
+        if response.get('rows'):
+            seq = response['seq'] + len(response['rows'])
+        elif 'data' in response:
+            seq = int(response['data']['data_id'].rsplit('-', 1)[1]) + 1
+        elif 'event' in response:
+            seq = response['seq'] + 1
+        else:
+            continue
+        next_seq = seq if next_seq is None else max(next_seq, seq)
+    return next_seq
+
+
+class SyncClient:
+    """
+    SyncClient
+    Speaks the pair/unpair/setup/data/event/clear protocol over a Transport.
+    """
+    def __init__(self, transport, client_id, batch_size=DEFAULT_BATCH_SIZE, window=None):
+        self.transport = transport
+        self.client_id = client_id
+        self.batch_size = batch_size
+        self.window = window or transport.max_in_flight
+        self.notifications = asyncio.Queue()
+        self.reads = 0
+        self.bytes = 0
+
+    async def connect(self):
+        """
+        connect
+        Connects, and starts collecting event notifications.
+        """
+        await self.transport.connect()
+        self.transport.subscribe('event_notif', self.__on_notification)
+
+    async def disconnect(self):
+        """
+        disconnect
+        Disconnects from the device.
+        """
+        await self.transport.disconnect()
+
+    async def pair(self):
+        """
+        pair
+        Pairs this client with the device.
+        """
+        await self.transport.write('pair', self.client_id)
+
+    async def unpair(self):
+        """
+        unpair
+        Unpairs this client from the device.
+        """
+        await self.transport.write('unpair', self.client_id)
+
+    async def set_time(self, when=None):
+        """
+        set_time
+        Sets the device clock (UTC; defaults to now).
+        """
+        when = when or datetime.datetime.now(datetime.timezone.utc)
+        values = (when.year, when.month, when.day, when.hour, when.minute, when.second)
+        await self.transport.write('setup', 'setup_time=' + ','.join(str(v) for v in values))
+
+    async def identify(self):
+        """
+        identify
+        Tells the device which client's cursors the following reads use, and
+        the batch size for data reads.
+        """
+        await self.transport.write('setup', 'sync_client=' + self.client_id)
+        if self.batch_size > 1:
+            await self.transport.write('setup', 'sync_batch=' + str(self.batch_size))
+
+    async def fetch_data(self):
+        """
+        fetch_data
+        Reads every data point this client has not read yet, and acks them.
+        """
+        responses = _decode_all(await self.drain('data', max(1, self.batch_size)))
+        await self.__ack('data_ack=', _next_seq(responses))
+        return expand_data(responses)
+
+    async def fetch_events(self):
+        """
+        fetch_events
+        Reads every event this client has not read yet, and acks them.
+        """
+        responses = _decode_all(await self.drain('event'))
+        await self.__ack('event_ack=', _next_seq(responses))
+        return [response['event'] for response in responses if 'event' in response]
+
+    async def clear_event(self, event_id):
+        """
+        clear_event
+        Marks an event as handled.
+        """
+        await self.transport.write('event_clear', 'event_cleared=' + event_id)
+
+    async def ack_notifications(self, seq):
+        """
+        ack_notifications
+        Acks event notifications up to and including seq.
+        """
+        await self.transport.write('setup', 'notify_ack=%s,%d' % (self.client_id, seq))
+
+    async def read_diagnostics(self, section=None):
+        """
+        read_diagnostics
+        Returns the device diagnostics as a dict.  section picks one section
+        for this and later reads ('' for all of them again).
+        """
+        if section is not None:
+            await self.transport.write('setup', 'diag_section=' + section)
+        return json.loads(await self.transport.read('diag'))
+
+    async def read_summary(self, page=0):
+        """
+        read_summary
+        Returns the device summary as a dict; page selects the hourly buckets.
+        """
+        await self.transport.write('setup', 'summary_page=%d' % page)
+        return json.loads(await self.transport.read('summary'))
+
+    async def query(self, start, end, max_count=1000):
+        """
+        query
+        Reads the data points taken from start to end (timestamps, inclusive),
+        at most max_count, without removing them from the device.
+        """
+        await self.transport.write('setup', 'query_range=%d,%d,%d' % (start, end, max_count))
+        return decode_data(await self.drain('query'))
+
+    async def sync(self):
+        """
+        sync
+        Identifies this client, then drains data and events.
+        """
+        reads, num_bytes = self.reads, self.bytes
+        start = time.perf_counter()
+        await self.identify()
+        data = await self.fetch_data()
+        events = await self.fetch_events()
+        return SyncResult(data, events, self.reads - reads, self.bytes - num_bytes,
+                          time.perf_counter() - start)
+
+    async def drain(self, name, per_read=1):
+        """
+        drain
+        Reads a characteristic until the device reports nothing remaining.
+        Keeps up to `window` reads in flight, but never more than the last
+        reply's "remaining" needs at up to per_read records a read, and
+        awaits every read it sent: a read moves this client's read position
+        on the device whether or not its reply is wanted (records read but
+        not acked are read again after the next identify()).  Returns the raw
+        responses.
+        """
+        responses = []
+        in_flight = collections.deque()
+        remaining = 1 # the first read finds out
+        while True:
+            while len(in_flight) < min(self.window, -(-remaining // per_read)):
+                in_flight.append(asyncio.ensure_future(self.transport.read(name)))
+            if not in_flight:
+                return responses
+            response = await in_flight.popleft()
+            self.reads += 1
+            self.bytes += len(response)
+            match = REMAINING_RE.search(response)
+            if match is None:
+                remaining = 0 # not a sync reply: only collect the reads already sent
+                continue
+            responses.append(response)
+            remaining = int(match.group(1))
+
+    async def __ack(self, prefix, next_seq):
+        if next_seq is not None:
+            await self.transport.write('setup', prefix + str(next_seq))
+
+    def __on_notification(self, value):
+        self.notifications.put_nowait(value.decode())
@@ -0,0 +1,127 @@
+"""
+link.py
+A timing model of a BLE connection, and a transport that runs the sync
+protocol over it against a simulated device.
+
+The model works at the ATT level on a virtual clock:
+* ATT allows one outstanding request per connection, so every read or write
+  is a request/response exchange and nothing is pipelined.
+* A request goes out at the next connection event; the device answers after
+  op_latency plus the time its callback took; the response goes out from the
+  next connection event on, at most packets_per_event link-layer packets per
+  event.
+* Values longer than MTU - 1 bytes are fetched with Read Blob requests,
+  MTU - 1 bytes at a time (and one extra, empty, blob when the length is an
+  exact multiple, as clients do).
+* Every ATT PDU gets a 4 byte L2CAP header and is split into link-layer
+  packets of at most ll_payload bytes, each with LL_OVERHEAD bytes of
+  preamble, access address, header and CRC.
+"""
+import math
+import time
+
+from host.sync.transport import InProcessTransport
+
+ATT_HEADER = 1 # opcode
+ATT_HANDLE = 2
+L2CAP_HEADER = 4
+LL_OVERHEAD = 10 # preamble 1 + access address 4 + header 2 + CRC 3
+READ_REQUEST = ATT_HEADER + ATT_HANDLE
+READ_BLOB_REQUEST = ATT_HEADER + ATT_HANDLE + 2 # + value offset
+WRITE_RESPONSE = ATT_HEADER
+
+
+class BleLink: # pylint: disable=R0902
+    """
+    BleLink
+    Virtual-time model of one BLE connection; see the module docstring.
+    cpu_scale multiplies the measured device callback time, to approximate
+    the board's slower CPU.
+    """
+    def __init__(self, mtu=23, interval_ms=30.0, op_latency_ms=1.0, ll_payload=27, # pylint: disable=R0913
+                 packets_per_event=6, cpu_scale=1.0):
+        self.mtu = mtu
+        self.interval = interval_ms / 1000.0
+        self.op_latency = op_latency_ms / 1000.0
+        self.ll_payload = ll_payload
+        self.packets_per_event = packets_per_event
+        self.cpu_scale = cpu_scale
+        self.seconds = 0.0
+        self.ops = 0
+        self.packets = 0
+        self.air_bytes = 0
+
+    def read(self, length, device_seconds=0.0):
+        """
+        read
+        Accounts for reading a value of the given length.
+        """
+        chunk = self.mtu - 1
+        self.__exchange(READ_REQUEST, ATT_HEADER + min(length, chunk), device_seconds)
+        offset = chunk
+        while offset <= length:
+            self.__exchange(READ_BLOB_REQUEST, ATT_HEADER + min(length - offset, chunk), 0.0)
+            offset += chunk
+
+    def write(self, length, device_seconds=0.0):
+        """
+        write
+        Accounts for writing a value of the given length (Write Request).
+        """
+        self.__exchange(READ_REQUEST + length, WRITE_RESPONSE, device_seconds)
+
+    def __exchange(self, request_length, response_length, device_seconds):
+        self.ops += 1
+        start = self.__next_event(self.seconds)
+        request_events = self.__send(request_length)
+        received = start + (request_events - 1) * self.interval
+        ready = received + self.op_latency + device_seconds * self.cpu_scale
+        response_start = self.__next_event(ready)
+        response_events = self.__send(response_length)
+        self.seconds = response_start + (response_events - 1) * self.interval
+
+    def __send(self, att_length):
+        """
+        Adds one ATT PDU to the counters.  Returns the connection events used.
+        """
+        length = att_length + L2CAP_HEADER
+        packets = max(1, int(math.ceil(length / float(self.ll_payload))))
+        self.packets += packets
+        self.air_bytes += length + packets * LL_OVERHEAD
+        return int(math.ceil(packets / float(self.packets_per_event)))
+
+    def __next_event(self, when):
+        # Strictly after `when`: a PDU can't go out in the event it was produced in.
+        return (math.floor(when / self.interval + 1e-9) + 1) * self.interval
+
+
+class BleLinkTransport(InProcessTransport):
+    """
+    BleLinkTransport
+    InProcessTransport that charges every request to a BleLink, and measures
+    the time the device code spends serving it.  Only one request can be in
+    flight, as on a real ATT bearer.
+    """
+    max_in_flight = 1
+
+    def __init__(self, sim_device, link):
+        super().__init__(sim_device)
+        self.link = link
+        self.device_seconds = 0.0
+
+    async def read(self, name):
+        start = time.perf_counter()
+        value = self.sim.read(name)
+        elapsed = time.perf_counter() - start
+        self.device_seconds += elapsed
+        self.link.read(len(value), elapsed)
+        return value
+
+    async def write(self, name, value):
+        if isinstance(value, str):
+            value = value.encode()
+        start = time.perf_counter()
+        self.sim.write(name, value)
+        elapsed = time.perf_counter() - start
+        self.device_seconds += elapsed
+        self.link.write(len(value), elapsed)
@@ -0,0 +1,172 @@
+"""
+transport.py
+Transports carry the sync protocol between SyncClient and a device.
+
+A transport exposes the device's characteristics by name (see
+CHARACTERISTICS): reads return the raw value bytes, writes take bytes or str.
+Reads must complete in the order they were issued, like ATT requests on a
+BLE link; a transport may keep several of them in flight.
+
+TcpTransport speaks the line protocol of the device's TCP sync server
+(src/socket_server.py) to a real socket, e.g. one opened by
+SimDevice(tcp_port=...).
+"""
+import asyncio
+import collections
+
+CHARACTERISTICS = ('setup', 'pair', 'unpair', 'data', 'event', 'event_notif', 'event_clear', 'diag',
+                   'summary', 'query')
+
+
+class Transport:
+    """
+    Transport
+    Base class for sync transports.
+    """
+    # Maximum number of requests the transport can usefully keep in flight.
+    max_in_flight = 1
+
+    async def connect(self):
+        """
+        connect
+        Opens the link to the device.
+        """
+        raise NotImplementedError
+
+    async def disconnect(self):
+        """
+        disconnect
+        Closes the link to the device.
+        """
+        raise NotImplementedError
+
+    async def read(self, name):
+        """
+        read
+        Reads a characteristic.  Returns bytes.
+        """
+        raise NotImplementedError
+
+    async def write(self, name, value):
+        """
+        write
+        Writes a characteristic.
+        """
+        raise NotImplementedError
+
+    def subscribe(self, name, callback):
+        """
+        subscribe
+        Calls callback(value_bytes) for every notification on a characteristic.
+        """
+        raise NotImplementedError
+
+
+class InProcessTransport(Transport):
+    """
+    InProcessTransport
+    Transport bound to a host.sim.SimDevice running in the same process.
+    Requests go straight into the device's GATT callbacks, so sync rates
+    measured with it are the device code's own limit.
+    """
+    max_in_flight = 8
+
+    def __init__(self, sim_device):
+        self.sim = sim_device
+        self.connected = False
+        self.__lock = asyncio.Lock()
+
+    async def connect(self):
+        self.sim.connect()
+        self.connected = True
+
+    async def disconnect(self):
+        self.sim.disconnect()
+        self.connected = False
+
+    async def read(self, name):
+        async with self.__lock:
+            return self.sim.read(name)
+
+    async def write(self, name, value):
+        async with self.__lock:
+            self.sim.write(name, value)
+
+    def subscribe(self, name, callback):
+        self.sim.subscribe(name, callback)
+
+
+class TcpTransport(Transport):
+    """
+    TcpTransport
+    Transport over a TCP connection to the device's sync server.  Requests
+    are pipelined: up to max_in_flight of them are written before the first
+    reply arrives, and the replies are matched up in order.
+    """
+    max_in_flight = 32
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.__reader = None
+        self.__writer = None
+        self.__receiver = None
+        self.__pending = collections.deque()
+        self.__subscribers = collections.defaultdict(list)
+
+    async def connect(self):
+        self.__reader, self.__writer = await asyncio.open_connection(self.host, self.port)
+        self.__receiver = asyncio.ensure_future(self.__receive())
+
+    async def disconnect(self):
+        self.__writer.close()
+        await self.__writer.wait_closed()
+        await self.__receiver
+
+    async def read(self, name):
+        return await self.__request('R ' + name)
+
+    async def write(self, name, value):
+        if isinstance(value, bytes):
+            value = value.decode()
+        await self.__request('W %s %s' % (name, value))
+
+    def subscribe(self, name, callback):
+        self.__subscribers[name].append(callback)
+
+    async def __request(self, line):
+        future = asyncio.get_running_loop().create_future()
+        self.__pending.append(future)
+        self.__writer.write(line.encode() + b'\n')
+        await self.__writer.drain()
+        return await future
+
+    async def __receive(self):
+        """
+        __receive
+        Routes reply lines to the pending requests, and notification lines to
+        the subscribers.
+        """
+        while True:
+            line = await self.__reader.readline()
+            if not line:
+                break
+            line = line.rstrip(b'\r\n')
+            if line.startswith(b'*'):
+                name, _, value = line[2:].partition(b' ')
+                for callback in self.__subscribers[name.decode()]:
+                    callback(value)
+            elif self.__pending:
+                # Replies pair up with requests in order, including requests
+                # whose caller gave up waiting (cancelled): drop their reply.
+                future = self.__pending.popleft()
+                if future.cancelled():
+                    continue
+                if line.startswith(b'='):
+                    future.set_result(line[2:])
+                else:
+                    future.set_exception(OSError(line[2:].decode()))
+        while self.__pending:
+            future = self.__pending.popleft()
+            if not future.cancelled():
+                future.set_exception(ConnectionError('connection closed'))
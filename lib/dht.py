@@ -31,20 +31,48 @@ def calculate_checksum(the_bytes):
     return the_bytes[0] + the_bytes[1] + the_bytes[2] + the_bytes[3] & 255
 
 class DHTResult: # pylint: disable=C1001, R0903
-    'DHT sensor result returned by DHT.read() method'
+    """
+    DHT sensor result returned by DHT.read() method.
+    Values are kept in tenths (the DHT22's resolution), as ints, so a result
+    can be refilled by DHT.read() without allocating.
+    """
 
     ERR_NO_ERROR = 0
     ERR_MISSING_DATA = 1
     ERR_CRC = 2
 
     error_code = ERR_NO_ERROR
-    temperature = -1
-    humidity = -1
+    temperature_tenths = -10
+    humidity_tenths = -10
 
-    def __init__(self, error_code, temperature, humidity):
+    def __init__(self, error_code=ERR_NO_ERROR, temperature=-1, humidity=-1):
+        self.set(error_code, int(round(temperature * 10)), int(round(humidity * 10)))
+
+    def set(self, error_code, temperature_tenths, humidity_tenths):
+        """
+        set
+        Refills the result in place.
+        """
         self.error_code = error_code
-        self.temperature = temperature
-        self.humidity = humidity
+        self.temperature_tenths = temperature_tenths
+        self.humidity_tenths = humidity_tenths
+        return self
+
+    @property
+    def temperature(self):
+        """
+        temperature
+        Temperature in degrees C.
+        """
+        return self.temperature_tenths / 10
+
+    @property
+    def humidity(self):
+        """
+        humidity
+        Relative humidity in %.
+        """
+        return self.humidity_tenths / 10
 
     def is_valid(self):
         """
@@ -65,48 +93,68 @@ class DHT: # pylint: disable=C1001,R0903
     def __init__(self, pin, sensor=0):
         self.__pin = Pin(pin, mode=Pin.OPEN_DRAIN, pull=Pin.PULL_UP)
         self.__dhttype = sensor
+        self.__bytes = bytearray(5)
         self.__pin(1)
         utime.sleep(1.0)
 
-    def read(self):
+    def read(self, result=None):
         """
         read
-        Reads data from DHT sensor
+        Reads data from DHT sensor.  If a DHTResult is passed in it is refilled
+        and returned, so (apart from the pulse list pulses_get returns) a read
+        does not allocate.
         """
+        if result is None:
+            result = DHTResult()
         # pull down to low
         self.__send_and_sleep(0, 0.019)
         data = pycom.pulses_get(self.__pin, 100) # pylint: disable=E1101
         self.__pin.init(Pin.OPEN_DRAIN)
         self.__pin(1)
-        bits = []
-        for a, b in data:
-            if a == 1 and 18 <= b <= 28:
-                bits.append(0)
-            if a == 1 and 65 <= b <= 75:
-                bits.append(1)
-        if len(bits) != 40:
-            return DHTResult(DHTResult.ERR_MISSING_DATA, 0, 0)
-        # we have the bits, calculate bytes
-        the_bytes = bits_to_bytes(bits)
+        the_bytes = self.__bytes
+        if self.__decode(data) != 40:
+            return result.set(DHTResult.ERR_MISSING_DATA, 0, 0)
         # calculate checksum and check
-        checksum = calculate_checksum(the_bytes)
-        if the_bytes[4] != checksum:
-            return DHTResult(DHTResult.ERR_CRC, 0, 0)
+        if the_bytes[4] != calculate_checksum(the_bytes):
+            return result.set(DHTResult.ERR_CRC, 0, 0)
         # ok, we have valid data, return it
-        [int_rh, dec_rh, int_t, dec_t, csum] = the_bytes # pylint: disable=E0632,W0612
         if self.__dhttype == 0:
             #dht11
-            rh = int_rh                 #dht11 20% ~ 90%
-            t = int_t                   #dht11 0..50 deg C
+            rh = the_bytes[0] * 10      #dht11 20% ~ 90%
+            t = the_bytes[2] * 10       #dht11 0..50 deg C
         else:
             #dht21,dht22
-            rh = ((int_rh * 256) + dec_rh)/10
-            t = (((int_t & 0x7F) * 256) + dec_t)/10
-            if (int_t & 0x80) != 0:
+            rh = (the_bytes[0] * 256) + the_bytes[1]
+            t = ((the_bytes[2] & 0x7F) * 256) + the_bytes[3]
+            if (the_bytes[2] & 0x80) != 0:
                 t = -t
-        return DHTResult(DHTResult.ERR_NO_ERROR, t, rh)
+        return result.set(DHTResult.ERR_NO_ERROR, t, rh)
 
 
+    def __decode(self, data):
+        """
+        __decode
+        Decodes the bits of the pulses straight into the 5 byte buffer.
+        Returns the number of bits found (40 in a complete reading).
+        """
+        the_bytes = self.__bytes
+        for i in range(5):
+            the_bytes[i] = 0
+        num_bits = 0
+        for a, b in data:
+            if a != 1:
+                continue
+            if 18 <= b <= 28:
+                bit = 0
+            elif 65 <= b <= 75:
+                bit = 1
+            else:
+                continue
+            if num_bits < 40:
+                the_bytes[num_bits >> 3] = ((the_bytes[num_bits >> 3] << 1) | bit) & 0xFF
+            num_bits += 1
+        return num_bits
+
     def __send_and_sleep(self, output, mysleep):
         self.__pin(output)
         utime.sleep(mysleep)
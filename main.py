@@ -9,26 +9,35 @@ sys.path.append('/flash/src')
 
 # pylint: disable=C0413
 import pycom # pylint: disable=F0401
-import utime # pylint: disable=E0401
 from src.device import Device
 
 # Turn off blinking LED.
 pycom.heartbeat(False) # pylint: disable=E1101
-# Disable WiFi:
-pycom.wifi_on_boot(False) # pylint: disable=E1101
 
 DATA_CACHE_DURATION = 7 # days
 DATA_INTERVAL = 5 # seconds
 EVENTS_COUNT = 100 # max # of events stored in memory.
+# Port to also serve the sync protocol on over WiFi (e.g. 8266), or None for
+# BLE only.  The WLAN itself is set up in boot.py / the Pycom WiFi settings.
+SYNC_TCP_PORT = None
+
+# Disable WiFi unless the TCP sync server needs it:
+pycom.wifi_on_boot(SYNC_TCP_PORT is not None) # pylint: disable=E1101
 
 # Initialize Device object
 DD_DEVICE = Device(
     duration=DATA_CACHE_DURATION,
     interval=DATA_INTERVAL,
-    num_events=EVENTS_COUNT
+    num_events=EVENTS_COUNT,
+    tcp_port=SYNC_TCP_PORT
     )
 
+# Read the sensor on its own thread, every DATA_INTERVAL seconds on the dot,
+# whatever the main loop (BLE, TCP, detection) is busy with.
+DD_DEVICE.start_sampling()
+
 while True:
-    DD_DEVICE.read_sensor_data() # create humidity_temp reading.
-    DD_DEVICE.check_for_event() # check sensor data for event
-    utime.sleep(DATA_INTERVAL) # sleep until time to create new reading
+    DD_DEVICE.process_samples() # store queued humidity_temp readings, and check them for an event
+    DD_DEVICE.process_notifications() # send/retry event notifications
+    DD_DEVICE.idle() # collect garbage before going to sleep
+    DD_DEVICE.wait_for_samples() # sleep (or serve TCP clients) until the next reading
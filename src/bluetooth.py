@@ -6,28 +6,25 @@ Bluetooth connection, services, and client management
 """
 from network import Bluetooth # pylint: disable=F0401
 from lib.uuid import uuid2bytes
-from lib.helpers import set_current_time, current_timestamp
+from src.sync_protocol import SyncSession, OP_SETUP, OP_PAIR, OP_UNPAIR, OP_DATA, OP_EVENT, \
+    OP_EVENT_CLEAR, OP_DIAG, OP_SUMMARY, OP_QUERY
 
 BT_ADV_PREFIX = 'dd-device-'
 BT_MANUFACTURER_NAME = 'diaper-detective'
 BT_DEVICE_VERSION = 'v0.0.1'
-EVENT_CLEAR_PREFIX = 'event_cleared='
-TIME_SETUP_PREFIX = 'setup_time='
+BATCH_MAX_BYTES = 400 # rows per batched read; with the envelope this fits 512 bytes
 
 class BluetoothServer: # pylint: disable=C1001,R0903,R0902
     """
     BluetoothServer
-    Advertises bluetooth services, handles connection and clients
+    Advertises bluetooth services, handles connection and clients.
+    Characteristic reads/writes are handed to the SyncProtocol.
     """
-    def __init__(self, # pylint: disable=W0102,R0913,R0914
+    def __init__(self, # pylint: disable=W0102,R0915
                  device_id='',
                  bluetooth_ids={},
                  client_ids=set(),
-                 on_client_paired=None,
-                 on_client_unpaired=None,
-                 get_next_data_item=None,
-                 get_next_event_item=None,
-                 clear_event=None):
+                 protocol=None):
         # Read bluetooth IDs:
         self.__device_id = device_id
         self.__bt_id = bluetooth_ids.get('bt_id')
@@ -38,6 +35,9 @@ class BluetoothServer: # pylint: disable=C1001,R0903,R0902
         self.__bt_event_svc_id = bluetooth_ids.get('bt_event_svc_id')
         self.__bt_event_notif_svc_id = bluetooth_ids.get('bt_event_notif_svc_id')
         self.__bt_event_clear_svc_id = bluetooth_ids.get('bt_event_clear_svc_id')
+        self.__bt_diag_svc_id = bluetooth_ids.get('bt_diag_svc_id')
+        self.__bt_summary_svc_id = bluetooth_ids.get('bt_summary_svc_id')
+        self.__bt_query_svc_id = bluetooth_ids.get('bt_query_svc_id')
         self.__bt_setup_char_id = bluetooth_ids.get('bt_setup_char_id')
         self.__bt_pair_char_id = bluetooth_ids.get('bt_pair_char_id')
         self.__bt_unpair_char_id = bluetooth_ids.get('bt_unpair_char_id')
@@ -45,11 +45,11 @@ class BluetoothServer: # pylint: disable=C1001,R0903,R0902
         self.__bt_event_char_id = bluetooth_ids.get('bt_event_char_id')
         self.__bt_event_notif_char_id = bluetooth_ids.get('bt_event_notif_char_id')
         self.__bt_event_clear_char_id = bluetooth_ids.get('bt_event_clear_char_id')
-        self.__on_client_paired = on_client_paired
-        self.__on_client_unpaired = on_client_unpaired
-        self.__get_next_data_item = get_next_data_item
-        self.__get_next_event_item = get_next_event_item
-        self.__clear_event = clear_event
+        self.__bt_diag_char_id = bluetooth_ids.get('bt_diag_char_id')
+        self.__bt_summary_char_id = bluetooth_ids.get('bt_summary_char_id')
+        self.__bt_query_char_id = bluetooth_ids.get('bt_query_char_id')
+        self.__protocol = protocol
+        self.__session = SyncSession(BATCH_MAX_BYTES)
         # Save currently paired clients
         self.client_ids = client_ids
         # Setup bluetooth & configure advertisement.
@@ -79,6 +79,15 @@ class BluetoothServer: # pylint: disable=C1001,R0903,R0902
         event_notif_service = self.bluetooth.service(
             uuid=uuid2bytes(self.__bt_event_notif_svc_id),
             isprimary=True)
+        diag_service = self.bluetooth.service(
+            uuid=uuid2bytes(self.__bt_diag_svc_id),
+            isprimary=True)
+        summary_service = self.bluetooth.service(
+            uuid=uuid2bytes(self.__bt_summary_svc_id),
+            isprimary=True)
+        query_service = self.bluetooth.service(
+            uuid=uuid2bytes(self.__bt_query_svc_id),
+            isprimary=True)
         # event_clear_service = self.bluetooth.service(
         #     uuid=uuid2bytes(self.__bt_event_clear_svc_id),
         #     isprimary=True)
@@ -112,6 +121,18 @@ class BluetoothServer: # pylint: disable=C1001,R0903,R0902
             uuid=uuid2bytes(self.__bt_event_clear_char_id),
             properties=Bluetooth.PROP_WRITE,
             value=None)
+        self.__diag_char = diag_service.characteristic(
+            uuid=uuid2bytes(self.__bt_diag_char_id),
+            properties=Bluetooth.PROP_READ,
+            value=None)
+        self.__summary_char = summary_service.characteristic(
+            uuid=uuid2bytes(self.__bt_summary_char_id),
+            properties=Bluetooth.PROP_READ,
+            value=None)
+        self.__query_char = query_service.characteristic(
+            uuid=uuid2bytes(self.__bt_query_char_id),
+            properties=Bluetooth.PROP_READ,
+            value=None)
 
         # Add callbacks:
         self.bluetooth.callback(
@@ -141,6 +162,18 @@ class BluetoothServer: # pylint: disable=C1001,R0903,R0902
             trigger=Bluetooth.CHAR_WRITE_EVENT,
             handler=self.__on_event_clear,
             arg=None)
+        self.__diag_char.callback(
+            trigger=Bluetooth.CHAR_READ_EVENT,
+            handler=self.__on_diag_read,
+            arg=None)
+        self.__summary_char.callback(
+            trigger=Bluetooth.CHAR_READ_EVENT,
+            handler=self.__on_summary_read,
+            arg=None)
+        self.__query_char.callback(
+            trigger=Bluetooth.CHAR_READ_EVENT,
+            handler=self.__on_query_read,
+            arg=None)
         # Start advertising:
         self.bluetooth.advertise(True)
 
@@ -161,28 +194,20 @@ class BluetoothServer: # pylint: disable=C1001,R0903,R0902
     def __on_client_connected(self, bt_o): # pylint: disable=R0201
         adv = bt_o.get_adv()
         print('Client connected: ', adv)
+        self.__protocol.on_connected(self.__session)
 
     def __on_client_disconnected(self, bt_o): # pylint: disable=R0201
         adv = bt_o.get_adv()
         print('Client disconnected: ', adv)
+        self.__protocol.on_disconnected(self.__session)
+        self.__session = SyncSession(BATCH_MAX_BYTES)
 
     def __on_setup_write(self, ch):# pylint: disable=R0201,C0103
         """
         __on_setup_write
         Setup device
         """
-        data = ch.value().decode()
-        print("setup_write: ", data)
-        if TIME_SETUP_PREFIX in data:
-            time_vals = data.replace(TIME_SETUP_PREFIX, "", 1)
-            time_vals = [int(x) for x in time_vals.split(",")]
-            set_current_time((time_vals[0],
-                              time_vals[1],
-                              time_vals[2],
-                              time_vals[3],
-                              time_vals[4],
-                              time_vals[5]))
-            print("Current timestamp: ", current_timestamp())
+        self.__protocol.write(self.__session, OP_SETUP, ch.value().decode())
 
     def __on_pair_write(self, ch): # pylint: disable=C0103
         """
@@ -190,21 +215,17 @@ class BluetoothServer: # pylint: disable=C1001,R0903,R0902
         Triggered from the pair-write characteristic.
         Expected data is the unique "client id" from the app.
         """
-        client_id = ch.value().decode()
-        self.__on_client_paired(client_id)
-        print("pair_write: ", client_id)
+        self.__protocol.write(self.__session, OP_PAIR, ch.value().decode())
 
     def __on_unpair_write(self, ch): # pylint: disable=C0103
-        client_id = ch.value().decode()
-        self.__on_client_unpaired(client_id)
-        print("unpair_write: ", client_id)
+        self.__protocol.write(self.__session, OP_UNPAIR, ch.value().decode())
 
     def __on_data_read(self, ch): # pylint: disable=C0103
         """
         __on_data_read
         Triggered from the data characteristic.
         """
-        data = self.__get_next_data_item()
+        data = self.__protocol.read(self.__session, OP_DATA)
         ch.value(data)
         print("data_read: ", data)
 
@@ -213,7 +234,7 @@ class BluetoothServer: # pylint: disable=C1001,R0903,R0902
         __on_event_read
         Triggered from the event characteristic.
         """
-        data = self.__get_next_event_item()
+        data = self.__protocol.read(self.__session, OP_EVENT)
         ch.value(data)
         print("event_read: ", data)
 
@@ -222,14 +243,42 @@ class BluetoothServer: # pylint: disable=C1001,R0903,R0902
         __on_event_clear
         Triggered from event_clear characteristic
         """
-        data = ch.value().decode()
-        if EVENT_CLEAR_PREFIX in data:
-            e_id = data.replace(EVENT_CLEAR_PREFIX, "", 1)
-            self.__clear_event(e_id)
+        self.__protocol.write(self.__session, OP_EVENT_CLEAR, ch.value().decode())
+
+    def __on_diag_read(self, ch): # pylint: disable=C0103
+        """
+        __on_diag_read
+        Triggered from the diagnostics characteristic.
+        """
+        data = self.__protocol.read(self.__session, OP_DIAG)
+        ch.value(data)
+        print("diag_read: ", data)
+
+    def __on_summary_read(self, ch): # pylint: disable=C0103
+        """
+        __on_summary_read
+        Triggered from the summary characteristic.
+        """
+        data = self.__protocol.read(self.__session, OP_SUMMARY)
+        ch.value(data)
+        print("summary_read: ", data)
+
+    def __on_query_read(self, ch): # pylint: disable=C0103
+        """
+        __on_query_read
+        Triggered from the query characteristic.
+        """
+        data = self.__protocol.read(self.__session, OP_QUERY)
+        ch.value(data)
+        print("query_read: ", data)
 
-    def send_event_notification(self, event):
+    def send_notification(self, payload, client_id):
         """
-        send_event_notification
+        send_notification
+        Writes payload to the event notification characteristic, if the
+        connected client is client_id.
         """
-        print("Notifying client of event: ", event.event_id)
-        self.__event_notif_char.value("new_event=" + event.event_id)
+        if self.__session.client_id != client_id:
+            return
+        print("Notifying client: ", payload)
+        self.__event_notif_char.value(payload)
@@ -0,0 +1,196 @@
+"""
+capacity.py
+Sizes the caches from the heap the board actually has.
+
+The configured retention asks for retention * 86400 / interval sensor
+records, which is 1.2 MB for 7 days at 5 s: more than some boards have.
+CapacityPlanner measures gc.mem_free() (after a collection), keeps
+HEAP_RESERVE free for BLE/TCP buffers, JSON responses and the sampler, and
+splits the rest, by each cache's bytes per record:
+* events first (few and small), up to a quarter of the heap,
+* pinned readings, up to 1/PINNED_SHARE of what is left,
+* the sensor cache, the rest (up to what the retention asks for).
+
+When the sensor cache cannot hold the retention, the retention degrades
+instead of the device running out of memory: if the config has no heartbeat,
+the planner sets one, so repeated readings (equal, or within the configured
+deadband) fold into one record (see sensor_cache.py) and a steady stretch
+takes up to MAX_FOLD times less room.
+The horizon is then between capacity * interval (every reading differs) and
+capacity * heartbeat (nothing changes).
+
+The config keeps what was asked for; the plan is what was possible, and is
+reported in the diagnostics.  Allocations can still fail on a fragmented
+heap, so allocate() retries with a smaller capacity.
+
+A config change is planned against the free heap alone: resizing allocates
+the new arrays while the old ones still hold the readings.  A cache never
+gets smaller than it is unless the config asks for less, and resize() does
+not retry smaller: if the new arrays do not fit, the cache keeps its
+capacity (and the failure is counted), instead of dropping unsynced readings.
+"""
+import gc
+from src.sensor_cache import calculate_cache_size
+
+SENSOR_RECORD_BYTES = 14 # SensorCache: 7 arrays of 2 bytes
+PINNED_RECORD_BYTES = 14 # PinnedReadings: a 4 byte seq + 10 bytes of a record (no folded sums)
+EVENT_BYTES = 128 # EventCache: seq list entry, Event object, its id and map entries (estimate)
+HEAP_RESERVE = 32768 # bytes kept free for BLE/TCP buffers, JSON responses and the sampler
+PINNED_SHARE = 4 # pinned readings take at most 1/PINNED_SHARE of the heap left after events
+MIN_EVENTS = 10
+MAX_FOLD = 12 # readings a planned heartbeat folds into one record, at most
+SHRINK_PERCENT = 75 # capacity kept by every allocate() retry
+
+class CapacityPlanner: # pylint: disable=C1001,R0902
+    """
+    CapacityPlanner
+    Plans the cache capacities for a DeviceConfig (see the module docstring).
+    """
+    def __init__(self, reserve=HEAP_RESERVE):
+        self.__reserve = reserve
+        self.__free = 0 # gc.mem_free() when planned
+        self.__wanted = 0 # sensor records the retention asks for
+        self.__sensor_records = 0
+        self.__events = 0
+        self.__pin_budget = 0
+        self.__heartbeat = 0
+        self.__interval = 1
+        self.__shrunk = 0 # allocate() retries
+        self.__resize_failed = 0 # resize() calls that kept the old capacity
+
+    def plan(self, config):
+        """
+        plan
+        Plans the capacities for config, from the free heap.  After the first
+        plan, the capacities planned before are the current ones: they only
+        go down if config asks for less (see the module docstring).
+        """
+        gc.collect()
+        self.__free = gc.mem_free() # pylint: disable=E1101
+        heap = max(0, self.__free - self.__reserve)
+        self.__interval = config.interval
+        events = _keep(min(config.num_events, max(MIN_EVENTS, heap // 4 // EVENT_BYTES)),
+                       self.__events, config.num_events)
+        heap = max(0, heap - max(0, events - self.__events) * EVENT_BYTES)
+        self.__events = events
+        if config.pin and config.pin_budget:
+            pin_budget = _keep(min(config.pin_budget,
+                                   heap // PINNED_SHARE // PINNED_RECORD_BYTES),
+                               self.__pin_budget, config.pin_budget)
+            heap = max(0, heap - max(0, pin_budget - self.__pin_budget) * PINNED_RECORD_BYTES)
+            self.__pin_budget = pin_budget
+        else:
+            self.__pin_budget = 0
+        self.__wanted = max(1, calculate_cache_size(config.retention, config.interval))
+        self.set_sensor_records(_keep(min(self.__wanted, max(1, heap // SENSOR_RECORD_BYTES)),
+                                      self.__sensor_records, self.__wanted),
+                                config.heartbeat)
+
+    def set_sensor_records(self, records, heartbeat):
+        """
+        set_sensor_records
+        Records the sensor capacity actually allocated, and plans the
+        heartbeat for it: the configured one, or if there is none and the
+        capacity is short of the retention, one that folds enough readings.
+        """
+        self.__sensor_records = records
+        self.__heartbeat = heartbeat
+        if not heartbeat and records < self.__wanted:
+            fold = min(MAX_FOLD, (self.__wanted + records - 1) // records)
+            self.__heartbeat = fold * self.__interval if fold > 1 else 0
+
+    def allocate(self, allocate, records):
+        """
+        allocate
+        Calls allocate(records) (a cache constructor), retrying with
+        SHRINK_PERCENT of the capacity while it raises MemoryError or returns
+        false.  Returns its result and the capacity it succeeded with.
+        """
+        while True:
+            try:
+                result = allocate(records)
+                if result is not False:
+                    return result, records
+            except MemoryError:
+                pass
+            if records <= 1:
+                raise MemoryError('no room for the sensor cache')
+            self.__shrunk += 1
+            records = max(1, records * SHRINK_PERCENT // 100)
+            gc.collect()
+
+    def resize(self, resize, records, current):
+        """
+        resize
+        Calls resize(records) (SensorCache.resize) once.  Unlike allocate(),
+        it does not retry with less, which could drop readings the cache
+        holds: if resize raises MemoryError or returns false, the cache keeps
+        its current capacity, and the failure is counted.  Returns the
+        capacity the cache has afterwards.
+        """
+        try:
+            if resize(records) is not False:
+                return records
+        except MemoryError:
+            pass
+        print('Could not resize the sensor cache to', records, 'records')
+        self.__resize_failed += 1
+        return current
+
+    def sensor_records(self):
+        """
+        sensor_records
+        Returns the planned sensor cache capacity.
+        """
+        return self.__sensor_records
+
+    def events(self):
+        """
+        events
+        Returns the planned event capacity.
+        """
+        return self.__events
+
+    def pin_budget(self):
+        """
+        pin_budget
+        Returns the planned pinned readings budget.
+        """
+        return self.__pin_budget
+
+    def heartbeat(self):
+        """
+        heartbeat
+        Returns the planned heartbeat (seconds; 0 stores every reading).
+        """
+        return self.__heartbeat
+
+    def get_metrics(self):
+        """
+        get_metrics
+        Returns the plan for the diagnostics: heap free when planned and the
+        reserve (bytes), sensor records wanted and planned, event capacity,
+        pinned budget, heartbeat, allocation retries, failed resizes, and the
+        retention horizon in seconds: [min, max] (see the module docstring).
+        """
+        return {
+            "free": self.__free,
+            "reserve": self.__reserve,
+            "wanted": self.__wanted,
+            "sensor": self.__sensor_records,
+            "events": self.__events,
+            "pin_budget": self.__pin_budget,
+            "heartbeat": self.__heartbeat,
+            "shrunk": self.__shrunk,
+            "resize_failed": self.__resize_failed,
+            "horizon_s": [self.__sensor_records * self.__interval,
+                          self.__sensor_records * max(self.__interval, self.__heartbeat)]
+            }
+
+def _keep(planned, current, asked):
+    """
+    _keep
+    Returns the capacity to plan: planned, but not less than the current
+    capacity unless less was asked for.
+    """
+    return max(planned, min(current, asked))
@@ -0,0 +1,183 @@
+"""
+detection_trace.py
+Where the time goes between a humidity rise and the client hearing about it.
+
+check_for_event tags the onset: the first reading whose humidity is above
+HUMIDITY_THRESHOLD and far enough above the cache average (the humidity
+conditions of an event).  From then on, the time until the next reading is
+booked to why the event did not fire on this one:
+* warmup: fewer than MIN_DATA_POINTS readings in the cache,
+* suppressed: an event fired less than MIN_TIME_BETWEEN_EVENTS ago,
+* pending: the humidity conditions stopped holding (the average caught up).
+The onset is dropped (counted as abandoned) if humidity falls back to the
+threshold before an event fires.  An event that fires while humidity has
+not dropped to the threshold since the previous one is a repeat: its onset
+is the end of that event's suppression, not a new wetting.
+
+When the event fires, the breakdown is stored with the notifier's seq of
+the event, and the NotificationDispatcher reports when a notification
+covering it was first sent, and when a client acked it.  The last
+TRACE_EVENTS breakdowns are kept.  Times are ticks_ms of the readings, so
+tracing a reading does not allocate; only a firing event adds a record.
+"""
+import utime # pylint: disable=E0401
+
+TRACE_EVENTS = 4 # breakdowns kept for the diagnostics
+STATE_WARMUP = 0
+STATE_SUPPRESSED = 1
+STATE_PENDING = 2
+
+# Record fields (a list per event, oldest record first)
+FIELD_ONSET_MS = 0 # onset -> fire
+FIELD_WARMUP_MS = 1
+FIELD_SUPPRESSED_MS = 2
+FIELD_PENDING_MS = 3
+FIELD_READINGS = 4 # readings from the onset to the one that fired
+FIELD_SENT_MS = 5 # fire -> first notification sent (None until sent)
+FIELD_ACKED_MS = 6 # fire -> acked by a client (None until acked)
+FIELD_REPEAT = 7 # 1 if humidity stayed above the threshold since the previous event
+FIELD_NOTIFY_SEQ = 8
+FIELD_FIRE_TICKS = 9
+
+class DetectionTrace: # pylint: disable=C1001,R0902
+    """
+    DetectionTrace
+    Per-event detection latency breakdown (see the module docstring).
+    """
+    def __init__(self, size=TRACE_EVENTS):
+        self.__size = size
+        self.__records = []
+        self.__onset_ticks = None # ticks_ms of the onset reading; None = no onset
+        self.__last_ticks = 0 # ticks_ms of the last traced reading
+        self.__state = STATE_PENDING # why the last traced reading did not fire
+        self.__warmup_ms = 0
+        self.__suppressed_ms = 0
+        self.__pending_ms = 0
+        self.__readings = 0
+        self.__repeat = 0 # 1 while humidity stays above the threshold after an event
+        self.__fired = 0
+        self.__abandoned = 0
+
+    def mark(self, ticks, state):
+        """
+        mark
+        Traces a reading on which no event fired.  A warmup or suppressed
+        reading meets the humidity conditions, so it tags the onset if there
+        is none; a pending one only counts once an onset is tagged.
+        """
+        if self.__onset_ticks is None:
+            if state == STATE_PENDING:
+                return
+            self.__start(ticks)
+        else:
+            self.__book(ticks)
+        self.__state = state
+
+    def clear(self):
+        """
+        clear
+        Humidity is at or below the threshold: drops the onset, if any.
+        """
+        self.__repeat = 0
+        if self.__onset_ticks is not None:
+            self.__onset_ticks = None
+            self.__abandoned += 1
+
+    def fire(self, ticks, notify_seq):
+        """
+        fire
+        An event fired on the reading at ticks.  Stores its breakdown.
+        """
+        if self.__onset_ticks is None:
+            self.__start(ticks)
+        else:
+            self.__book(ticks)
+        self.__records.append([
+            utime.ticks_diff(ticks, self.__onset_ticks),
+            self.__warmup_ms,
+            self.__suppressed_ms,
+            self.__pending_ms,
+            self.__readings,
+            None,
+            None,
+            self.__repeat,
+            notify_seq,
+            ticks])
+        if len(self.__records) > self.__size:
+            del self.__records[0]
+        self.__onset_ticks = None
+        self.__repeat = 1
+        self.__fired += 1
+
+    def on_sent(self, last_seq):
+        """
+        on_sent
+        Called by the NotificationDispatcher when it sent a notification
+        covering every seq up to last_seq.
+        """
+        self.__delivered(last_seq, FIELD_SENT_MS)
+
+    def on_acked(self, seq):
+        """
+        on_acked
+        Called by the NotificationDispatcher when a client acked every seq up
+        to seq.
+        """
+        self.__delivered(seq, FIELD_ACKED_MS)
+
+    def records(self):
+        """
+        records
+        Returns the stored breakdowns as dicts, oldest first (times in ms).
+        """
+        return [{
+            "onset_ms": record[FIELD_ONSET_MS],
+            "warmup_ms": record[FIELD_WARMUP_MS],
+            "suppressed_ms": record[FIELD_SUPPRESSED_MS],
+            "pending_ms": record[FIELD_PENDING_MS],
+            "readings": record[FIELD_READINGS],
+            "sent_ms": record[FIELD_SENT_MS],
+            "acked_ms": record[FIELD_ACKED_MS],
+            "repeat": bool(record[FIELD_REPEAT])
+            } for record in self.__records]
+
+    def get_metrics(self):
+        """
+        get_metrics
+        Returns the trace for the diagnostics: events traced, onsets
+        abandoned, ms since a pending onset (None if none) and the last
+        breakdowns as [onset, warmup, suppressed, pending, readings, sent,
+        acked, repeat] rows, oldest first.
+        """
+        return {
+            "fired": self.__fired,
+            "abandoned": self.__abandoned,
+            "onset_age_ms": (utime.ticks_diff(utime.ticks_ms(), self.__onset_ticks)
+                             if self.__onset_ticks is not None else None),
+            "events": [record[:FIELD_NOTIFY_SEQ] for record in self.__records]
+            }
+
+    def __start(self, ticks):
+        self.__onset_ticks = ticks
+        self.__last_ticks = ticks
+        self.__warmup_ms = 0
+        self.__suppressed_ms = 0
+        self.__pending_ms = 0
+        self.__readings = 1
+
+    def __book(self, ticks):
+        elapsed = utime.ticks_diff(ticks, self.__last_ticks)
+        if self.__state == STATE_WARMUP:
+            self.__warmup_ms += elapsed
+        elif self.__state == STATE_SUPPRESSED:
+            self.__suppressed_ms += elapsed
+        else:
+            self.__pending_ms += elapsed
+        self.__last_ticks = ticks
+        self.__readings += 1
+
+    def __delivered(self, seq, field):
+        now = utime.ticks_ms()
+        for record in self.__records:
+            if record[field] is None and record[FIELD_NOTIFY_SEQ] <= seq:
+                record[field] = utime.ticks_diff(now, record[FIELD_FIRE_TICKS])
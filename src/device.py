@@ -3,46 +3,123 @@ device.py
 
 Contains the Device class. Used for interacting with device & managing data.
 """
-from lib.dht import DHT
-from src.sensor_data import SensorData
-from src.sensor_cache import SensorCache, calculate_cache_size
-from src.event_cache import EventCache
+from lib.dht import DHT, DHTResult
+from lib.helpers import set_current_time, is_time_set
+from src.sensor_cache import SensorCache
+from src.event_cache import EventCache, EVENT_LOG_PATH
 from src.event import Event, EventType
 from src.device_info import generate_device_info_file, write_device_info_file
 from src.device_info import reset_device_info, read_device_info_file, does_device_info_file_exist
 from src.bluetooth import BluetoothServer
+from src.sync_protocol import SyncProtocol
+from src.socket_server import SocketServer
+from src.notifier import NotificationDispatcher, NOTIFIER_STATE_PATH
+from src.timebase import Timebase
+from src.sync_cursors import SyncCursors, SYNC_CURSORS_PATH, DATA_CURSOR, EVENT_CURSOR
+from src.device_config import DeviceConfig, DEVICE_CONFIG_PATH
+from src.summary import HourlyStats, NUM_BUCKETS, DAY_BUCKETS, PAGE_BUCKETS
+from src.export import export_history, is_valid_export_name, EXPORT_NAME
+from src.sampler import Sampler
+from src.detection_trace import DetectionTrace, STATE_WARMUP, STATE_SUPPRESSED, STATE_PENDING
+from src.capacity import CapacityPlanner
 # MicroPython libraries:
+import gc
 import ujson  # pylint: disable=F0401
+import utime # pylint: disable=E0401
 from machine import Pin # pylint: disable=F0401
 
 HUMIDITY_THRESHOLD = 99.1
 MIN_PERCENT_DIFFERENCE = 0.1
 MIN_TIME_BETWEEN_EVENTS = 60 # 1 minute.
 MIN_DATA_POINTS = 6 # 30 seconds
+# check_for_event works on the cache's integer tenths, so it doesn't allocate:
+# current > HUMIDITY_THRESHOLD  <=>  current_tenths > HUMIDITY_THRESHOLD_TENTHS
+HUMIDITY_THRESHOLD_TENTHS = int(HUMIDITY_THRESHOLD * 10 + 0.001)
+# percent diff > MIN_PERCENT_DIFFERENCE  <=>  diff > (scaled + sum) // PERCENT_DIFF_DIVISOR
+# (exact while 200 / MIN_PERCENT_DIFFERENCE is a whole number)
+PERCENT_DIFF_DIVISOR = int(200 / MIN_PERCENT_DIFFERENCE + 0.5)
+LOG_SENSOR_DATA = False # print every reading (allocates; for debugging on the REPL)
+SAMPLE_POLL_MS = 100 # how often wait_for_samples checks the sampler's queue
 
-class Device: # pylint: disable=C1001
+class Device: # pylint: disable=C1001,R0902,R0904
     """
     Device
     Represents the device itself.  Exposes methods for interacting with sensors,
     connecting bluetooth, etc.
     """
-    def __init__(self, duration, interval, num_events):
+    def __init__(self, duration, interval, num_events, tcp_port=None):
         # define class properties
         self.device_info = None
         self.init_device_info()
         self.dht_sensor = DHT(Pin('P11', mode=Pin.OPEN_DRAIN), 1)
-        self.sensor_data = SensorCache(calculate_cache_size(duration, interval))
-        self.interval = interval
-        self.events = EventCache(num_events)
-        self.bluetooth_server = BluetoothServer(
-            device_id=self.device_info.device_id,
-            bluetooth_ids=self.device_info.get_bluetooth_ids(),
-            client_ids=self.device_info.client_ids,
+        self.__dht_result = DHTResult() # refilled by every read
+        self.__alloc_read = 0 # bytes allocated by the last sensor read
+        self.__alloc_detect = 0 # bytes allocated by the last store + detect
+        self.__alloc_detect_max = 0
+        self.__gc_ms = 0 # duration of the last idle collection
+        self.sampler = None # Sampler thread, once start_sampling() was called
+        self.detection_trace = DetectionTrace()
+        self.__sample_ticks = 0 # ticks_ms of the newest reading
+        # main.py's values are the defaults; a config saved on flash wins.
+        self.config = DeviceConfig(duration, interval, num_events, DEVICE_CONFIG_PATH)
+        self.timebase = Timebase(is_time_set())
+        # Cache capacities come from the heap this board has, not just the config.
+        self.capacity = CapacityPlanner()
+        self.capacity.plan(self.config)
+        self.sensor_data, data_size = self.capacity.allocate(
+            lambda size: SensorCache(size, self.timebase), self.capacity.sensor_records())
+        self.capacity.set_sensor_records(data_size, self.config.heartbeat)
+        self.interval = self.config.interval
+        self.__apply_deadband()
+        self.__apply_pinning()
+        self.events = EventCache(self.capacity.events(), EVENT_LOG_PATH)
+        self.summary = HourlyStats()
+        self.__export_name = None # export requested over BLE, run from idle()
+        self.__config_values = None # config changes received over BLE, applied from idle()
+        self.__export_status = None
+        self.sync_cursors = SyncCursors(SYNC_CURSORS_PATH)
+        self.__update_sync_cursors()
+        # Per-connection state (client, batch size, ...) lives in the
+        # SyncSession each transport passes to the callbacks.
+        self.protocol = SyncProtocol(
             on_client_paired=self.__on_client_paired,
             on_client_unpaired=self.__on_client_unpaired,
             get_next_data_item=self.get_next_data_json,
             get_next_event_item=self.get_next_event_json,
-            clear_event=self.clear_event)
+            clear_event=self.clear_event,
+            on_client_connected=self.__on_client_connected,
+            on_client_disconnected=self.__on_client_disconnected,
+            on_notification_ack=self.__on_notification_ack,
+            get_diagnostics=self.get_diagnostics_json,
+            on_sync_client=self.__on_sync_client,
+            set_time=self.set_time,
+            on_sync_batch=self.__on_sync_batch,
+            on_config=self.request_config,
+            get_summary=self.get_summary_json,
+            on_summary_page=self.__on_summary_page,
+            on_query=self.query_range,
+            get_query_data=self.get_query_data_json,
+            on_export=self.request_export,
+            on_diag_section=self.__on_diag_section,
+            on_data_ack=self.__on_data_ack,
+            on_event_ack=self.__on_event_ack)
+        self.bluetooth_server = BluetoothServer(
+            device_id=self.device_info.device_id,
+            bluetooth_ids=self.device_info.get_bluetooth_ids(),
+            client_ids=self.device_info.client_ids,
+            protocol=self.protocol)
+        self.socket_server = None
+        if tcp_port:
+            try:
+                self.socket_server = SocketServer(self.protocol, tcp_port)
+            except OSError as err:
+                print('Could not start TCP sync server', err)
+        self.notifier = NotificationDispatcher(
+            self.device_info.client_ids,
+            self.__send_notification,
+            on_sent=self.__on_notification_sent,
+            on_acked=self.__on_notification_acked,
+            path=NOTIFIER_STATE_PATH)
 
     def init_device_info(self):
         """
@@ -77,18 +154,99 @@ class Device: # pylint: disable=C1001
         reset_device_info()
         self.read_device_info()
 
+    def sample(self):
+        """
+        sample
+        Reads the sensor, stores the reading and checks for an event, and
+        records how many bytes each step allocated (see get_diagnostics_json).
+        The store + detect steps allocate nothing unless an event may fire.
+        """
+        before = gc.mem_alloc() # pylint: disable=E1101
+        self.read_sensor_data()
+        after = gc.mem_alloc() # pylint: disable=E1101
+        self.check_for_event()
+        self.__alloc_read = after - before
+        self.__alloc_detect = gc.mem_alloc() - after # pylint: disable=E1101
+        self.__alloc_detect_max = max(self.__alloc_detect_max, self.__alloc_detect)
+
+    def start_sampling(self):
+        """
+        start_sampling
+        Starts reading the sensor on its own thread, on a fixed grid of
+        deadlines (see src/sampler.py).  The main loop then calls
+        process_samples() instead of sample().
+        """
+        self.sampler = Sampler(self.dht_sensor, self.interval * 1000)
+        self.sampler.start()
+
+    def process_samples(self):
+        """
+        process_samples
+        Stores the readings the sampler thread queued, and checks each for an
+        event, recording how many bytes that allocated (alloc_detect).
+        """
+        dht_result = self.__dht_result
+        ticks = self.sampler.pop(dht_result)
+        while ticks is not None:
+            before = gc.mem_alloc() # pylint: disable=E1101
+            self.__store_reading(dht_result, ticks)
+            self.check_for_event()
+            self.__alloc_detect = gc.mem_alloc() - before # pylint: disable=E1101
+            self.__alloc_detect_max = max(self.__alloc_detect_max, self.__alloc_detect)
+            ticks = self.sampler.pop(dht_result)
+
+    def wait_for_samples(self):
+        """
+        wait_for_samples
+        Waits until the sampler thread has queued a reading, serving the TCP
+        sync server's clients in the meantime if it is running.
+        """
+        while not self.sampler.pending():
+            if self.socket_server:
+                self.socket_server.poll(SAMPLE_POLL_MS)
+            else:
+                utime.sleep_ms(SAMPLE_POLL_MS)
+
+    def idle(self):
+        """
+        idle
+        Applies a pending config change, runs a pending export, then the
+        garbage collector, while the device has nothing else to do, so none of
+        them lands in a sensor read or a BLE callback.
+        """
+        if self.__config_values:
+            values = self.__config_values
+            self.__config_values = None
+            self.apply_config(values)
+        if self.__export_name:
+            self.export()
+        start = utime.ticks_ms()
+        gc.collect()
+        self.__gc_ms = utime.ticks_diff(utime.ticks_ms(), start)
+
     def read_sensor_data(self):
         """
         read_sensor_data
-        Reads sensor data, and adds an SensorData object to the cache
+        Reads sensor data, and adds it to the cache
         """
-        dht_result = self.dht_sensor.read()
+        dht_result = self.dht_sensor.read(self.__dht_result)
         if dht_result.is_valid():
-            data = SensorData(dht_result.humidity, dht_result.temperature)
-            self.sensor_data.push(data)
-            data.log_data() # log data to console
+            self.__store_reading(dht_result)
         else:
-            print('Invalid sensor data.', dht_result)
+            print('Invalid sensor data.', dht_result.error_code)
+
+    def __store_reading(self, dht_result, ticks=None):
+        """
+        __store_reading
+        Adds a valid reading, taken now or at the given ticks_ms, to the
+        cache and the summary.
+        """
+        self.__sample_ticks = utime.ticks_ms() if ticks is None else ticks
+        self.sensor_data.push_now(dht_result.humidity_tenths, dht_result.temperature_tenths,
+                                  ticks)
+        self.summary.add(dht_result.humidity_tenths, dht_result.temperature_tenths)
+        if LOG_SENSOR_DATA:
+            self.sensor_data.peek().log_data() # log data to console
 
     def check_for_event(self):
         """
@@ -104,43 +262,213 @@ class Device: # pylint: disable=C1001
         - humidity less than the "dry" humidity threshold.
         - humidity must have been decreasing for specified period of time.
         - must have been long enough since last event was fired.
+
+        With n readings, current humidity c and average a (both in tenths of
+        %), the percent difference |c - a| / ((c + a) / 2) * 100 is compared
+        as |c*n - sum| against (c*n + sum) // PERCENT_DIFF_DIVISOR, all in
+        small ints.  The time since the last event is only looked up (which
+        allocates) once every other condition holds.
+
+        Every reading that meets the humidity conditions is traced (see
+        src/detection_trace.py): which of MIN_DATA_POINTS or
+        MIN_TIME_BETWEEN_EVENTS held the event back, and for how long.
         """
-        if self.sensor_data.length() < MIN_DATA_POINTS:
+        count = self.sensor_data.raw_count()
+        if not count:
+            return
+        trace = self.detection_trace
+        current = self.sensor_data.last_humidity_tenths()
+        if current <= HUMIDITY_THRESHOLD_TENTHS:
+            trace.clear()
             return
 
-        last_data = self.sensor_data.peek()
-        current_humidity = last_data.humidity
-        average_humidity = self.sensor_data.get_average_humidity()
-        percent_diff_from_average = (abs(current_humidity - average_humidity) / ((current_humidity + average_humidity) / 2)) * 100 # pylint: disable=C0301
-        long_enough_since_last_event = self.events.time_since_last_dirty_event() > MIN_TIME_BETWEEN_EVENTS # pylint: disable=C0301
-
-        if long_enough_since_last_event and current_humidity > HUMIDITY_THRESHOLD and current_humidity > average_humidity and percent_diff_from_average > MIN_PERCENT_DIFFERENCE: # pylint: disable=C0301
-            event = Event()
+        total = self.sensor_data.humidity_sum_tenths()
+        scaled = current * count # current humidity, scaled like the sum
+        diff = scaled - total # > 0 <=> current humidity above the average
+        if diff <= 0 or diff <= (scaled + total) // PERCENT_DIFF_DIVISOR:
+            trace.mark(self.__sample_ticks, STATE_PENDING)
+        elif count < MIN_DATA_POINTS:
+            trace.mark(self.__sample_ticks, STATE_WARMUP)
+        elif self.events.time_since_last_dirty_event() <= MIN_TIME_BETWEEN_EVENTS:
+            trace.mark(self.__sample_ticks, STATE_SUPPRESSED)
+        else:
+            event = Event(time_set=self.timebase.is_time_set())
             self.events.push(event)
-            self.bluetooth_server.send_event_notification(event)
+            self.sensor_data.pin() # keep the readings around it (event-anchored retention)
+            trace.fire(self.__sample_ticks, self.notifier.notify(event))
 
-    def get_next_data_json(self):
+    def process_notifications(self):
+        """
+        process_notifications
+        Sends queued event notifications, and retries unacknowledged ones.
+        """
+        self.notifier.poll()
+
+    def get_next_data_json(self, session):
         """
         get_next_data_json
-        Removes oldest data point from cache, and returns as JSON string.
+        Returns the oldest data point the session's client has not read yet as
+        JSON string.  Data points are removed from the cache once every paired
+        client has acked them (data_ack=, see src/sync_cursors.py).
         """
-        item = self.sensor_data.deque()
-        items_left = self.sensor_data.length()
+        if session.batch > 1:
+            return self.get_next_data_batch_json(session)
+        seq = max(self.sync_cursors.get(session.client_id, DATA_CURSOR),
+                  self.sensor_data.first_seq())
+        item = self.sensor_data.get(seq)
+        if item:
+            seq += 1
+            self.sync_cursors.advance(session.client_id, DATA_CURSOR, seq)
+        items_left = self.sensor_data.next_seq() - seq
         result = {"remaining": items_left}
         if item:
             result["data"] = item.to_dict()
         return ujson.dumps(result)
 
-    def get_next_event_json(self):
+    def get_next_data_batch_json(self, session):
+        """
+        get_next_data_batch_json
+        Like get_next_data_json, but returns up to sync_batch consecutive data
+        points (as many as fit session.max_bytes) as compact rows:
+        {"remaining": n, "epoch": e, "seq": s, "rows": [[timestamp, humidity, temperature], ...]}
+        The data_id of row i is "<epoch>-<seq + i>".
+        """
+        first = max(self.sync_cursors.get(session.client_id, DATA_CURSOR),
+                    self.sensor_data.first_seq())
+        rows = self.__data_rows(first, min(first + session.batch, self.sensor_data.next_seq()),
+                                session.max_bytes)
+        seq = first + len(rows)
+        if rows:
+            self.sync_cursors.advance(session.client_id, DATA_CURSOR, seq)
+        return ujson.dumps({
+            "remaining": self.sensor_data.next_seq() - seq,
+            "epoch": self.sensor_data.epoch_id(),
+            "seq": first,
+            "rows": rows
+            })
+
+    def query_range(self, session, start, end, max_count):
+        """
+        query_range
+        Selects the data points taken from start to end (timestamps,
+        inclusive), at most max_count of them, for get_query_data_json.
+        Pinned readings (older than the cache) in the range come first.
+        The start is found by binary search; nothing is removed from the cache.
+        """
+        max_count = max(0, max_count)
+        session.pinned_seq = session.pinned_end = 0
+        pinned = self.sensor_data.pinned()
+        if pinned:
+            first = pinned.find_time(start)
+            last = min(pinned.find_time(end + 1), first + max_count)
+            if first < last:
+                session.pinned_seq = pinned.seq(first)
+                session.pinned_end = pinned.seq(last - 1) + 1
+                max_count -= last - first
+        session.query_seq = self.sensor_data.find_time(start)
+        session.query_end = min(self.sensor_data.find_time(end + 1),
+                                session.query_seq + max_count)
+
+    def get_query_data_json(self, session):
+        """
+        get_query_data_json
+        Returns the next batch of the data points selected by query_range as
+        JSON string, in the same format as get_next_data_batch_json:
+        {"remaining": n, "epoch": e, "seq": s, "rows": [[timestamp, humidity, temperature], ...]}
+        Pinned readings are not consecutive, so their batches carry each
+        row's seq in "seqs" instead of "seq".  Data points older than the
+        cache (released since the query) are skipped.
+        """
+        pinned = self.sensor_data.pinned()
+        if pinned and session.pinned_seq < session.pinned_end:
+            return self.__pinned_rows_json(session, pinned)
+        first = max(session.query_seq, self.sensor_data.first_seq())
+        rows = self.__data_rows(first, session.query_end, session.max_bytes)
+        session.query_seq = first + len(rows)
+        return ujson.dumps({
+            "remaining": max(0, session.query_end - session.query_seq),
+            "epoch": self.sensor_data.epoch_id(),
+            "seq": first,
+            "rows": rows
+            })
+
+    def __pinned_rows_json(self, session, pinned):
+        """
+        __pinned_rows_json
+        Returns the next batch of the pinned readings selected by
+        query_range, as many as fit session.max_bytes:
+        {"remaining": n, "epoch": e, "seqs": [s, ...],
+         "rows": [[timestamp, humidity, temperature], ...]}
+        """
+        index = pinned.find_seq(session.pinned_seq)
+        seqs = []
+        rows = []
+        size = 0
+        while index < pinned.length() and size < session.max_bytes:
+            seq = pinned.seq(index)
+            if seq >= session.pinned_end:
+                break
+            humidity, temperature, repeats = pinned.values(index)
+            row = [pinned.timestamp(index), humidity / 10, temperature / 10]
+            if repeats:
+                row.append(repeats)
+            size += len(str(row)) + len(str(seq)) + 3
+            if rows and size >= session.max_bytes:
+                break
+            seqs.append(seq)
+            rows.append(row)
+            index += 1
+        session.pinned_seq = seqs[-1] + 1 if seqs else session.pinned_end
+        remaining = pinned.find_seq(session.pinned_end) - index
+        cached_from = max(session.query_seq, self.sensor_data.first_seq())
+        remaining += max(0, session.query_end - cached_from)
+        return ujson.dumps({
+            "remaining": remaining,
+            "epoch": self.sensor_data.epoch_id(),
+            "seqs": seqs,
+            "rows": rows
+            })
+
+    def __data_rows(self, first, end, max_bytes):
+        """
+        __data_rows
+        Returns [timestamp, humidity, temperature] rows for seqs first..end-1,
+        stopping early so the rows fit max_bytes.  Items that stand for
+        repeated readings (deadband recording) get the repeat count as a
+        fourth column.
+        """
+        rows = []
+        size = 0
+        seq = first
+        while seq < end and size < max_bytes:
+            item = self.sensor_data.get(seq)
+            row = [item.timestamp, item.humidity, item.temperature]
+            repeats = self.sensor_data.repeats(seq)
+            if repeats:
+                row.append(repeats)
+            size += len(str(row)) + 2
+            if rows and size >= max_bytes:
+                break
+            rows.append(row)
+            seq += 1
+        return rows
+
+    def get_next_event_json(self, session):
         """
         get_next_event_json
-        Removes oldest event from cache, and returns as JSON string.
+        Returns the oldest event the session's client has not read yet as JSON
+        string: {"remaining": n, "seq": s, "event": {...}}.  Events are removed
+        from the cache once every paired client has acked them (event_ack=).
         """
-        event = self.events.deque()
-        events_left = self.events.length()
-        result = {"remaining": events_left}
+        seq = self.events.find_next(self.sync_cursors.get(session.client_id, EVENT_CURSOR))
+        event = self.events.get(seq)
+        result = {}
         if event:
+            result["seq"] = seq
             result["event"] = event.to_dict()
+            seq += 1
+            self.sync_cursors.advance(session.client_id, EVENT_CURSOR, seq)
+        result["remaining"] = self.events.count_from(seq)
         return ujson.dumps(result)
 
     def clear_event(self, e_id):
@@ -151,26 +479,339 @@ class Device: # pylint: disable=C1001
         # Find & remove the existing event if it exists.
         self.events.remove_event(e_id)
         # Generate the 'change' event, and pass to client.
-        new_event = Event(EventType.changed)
+        new_event = Event(EventType.changed, time_set=self.timebase.is_time_set())
         self.events.push(new_event)
-        self.bluetooth_server.send_event_notification(new_event)
+        self.notifier.notify(new_event)
+
+    def request_export(self, name):
+        """
+        request_export
+        Schedules an export of the cached history to /flash (see export()).
+        Triggered by the SyncProtocol; the export itself runs from idle().
+        """
+        name = name or EXPORT_NAME
+        if not is_valid_export_name(name):
+            print('Invalid export name', name)
+            return
+        self.__export_name = name
+
+    def export(self, name=None):
+        """
+        export
+        Writes the readings and events in the caches to /flash (see
+        src/export.py), without removing them.  The result is reported in the
+        diagnostics.
+        """
+        name = name or self.__export_name or EXPORT_NAME
+        self.__export_name = None
+        start = utime.ticks_ms()
+        try:
+            manifest = export_history(self.sensor_data, self.events, name, self.config)
+            self.__export_status = {
+                "name": name,
+                "records": manifest["records"],
+                "readings": manifest["readings"],
+                "events": manifest["events"],
+                "ms": utime.ticks_diff(utime.ticks_ms(), start)
+                }
+        except OSError as err:
+            print('Could not export history', err)
+            self.__export_status = {"name": name, "error": str(err)}
+
+    def set_time(self, time_tuple):
+        """
+        set_time
+        Sets the RTC, and corrects the timestamps recorded before it was set.
+        """
+        before = utime.time()
+        set_current_time(time_tuple)
+        delta = utime.time() - before
+        self.timebase.on_time_set(delta)
+        self.events.on_time_set(delta)
+
+    def request_config(self, values):
+        """
+        request_config
+        Schedules a config change (see apply_config()).  Triggered by the
+        SyncProtocol; the change, which resizes the caches, is applied from
+        idle().  Changes received before then are merged, the latest value
+        of a key winning.
+        """
+        pending = self.__config_values or {}
+        pending.update(values)
+        self.__config_values = pending
 
-    def __on_client_paired(self, client_id):
+    def apply_config(self, values):
+        """
+        apply_config
+        Changes the reading interval, data retention, event capacity, deadband
+        recording and/or event-anchored retention ({"interval": s, "retention":
+        days, "events": n, "deadband": %, "heartbeat": s, "pin": s,
+        "pin_budget": n}), resizes the caches in place (as far as the heap
+        allows, see capacity.py) and saves the config.
+        """
+        try:
+            self.config.update(values)
+        except ValueError as err:
+            print('Invalid config', err)
+            return
+        self.capacity.plan(self.config)
+        self.events.resize(self.capacity.events())
+        data_size = self.capacity.resize(self.sensor_data.resize, self.capacity.sensor_records(),
+                                         self.sensor_data.max_size())
+        self.capacity.set_sensor_records(data_size, self.config.heartbeat)
+        self.interval = self.config.interval
+        if self.sampler:
+            self.sampler.set_interval(self.interval * 1000)
+        self.__apply_deadband()
+        self.__apply_pinning()
+        self.config.save()
+        self.__update_sync_cursors()
+        print('Config: ', self.config.to_dict())
+
+    def get_summary_json(self, session):
+        """
+        get_summary_json
+        Returns the summary as JSON string: min/max/mean humidity and
+        temperature (tenths) over the last day and week, the humidity trend
+        (tenths of % per hour), seconds since the last dirty event (null if
+        none), the unhandled event count, and one page of hourly humidity
+        [min, max, mean] buckets, newest first (see summary_page=).
+        """
+        first_age = session.summary_page * PAGE_BUCKETS
+        return ujson.dumps({
+            "day": self.summary.aggregate(DAY_BUCKETS),
+            "week": self.summary.aggregate(NUM_BUCKETS),
+            "trend": self.summary.trend(),
+            "since_dirty": (self.events.time_since_last_dirty_event()
+                            if self.events.has_dirty_event() else None),
+            "unhandled": self.events.unhandled_count(),
+            "page": session.summary_page,
+            "hour_age": self.summary.hour_age_seconds(),
+            "hours": self.summary.hours(first_age, PAGE_BUCKETS)
+            })
+
+    def get_diagnostics_json(self, session=None):
+        """
+        get_diagnostics_json
+        Returns device diagnostics as JSON string.  If the session picked a
+        section (diag_section=), only that one: {"<section>": {...}}.
+        """
+        diagnostics = {
+            "notifications": self.notifier.get_metrics(),
+            "config": self.config.to_dict(),
+            "sampling": {
+                "alloc_read": self.__alloc_read,
+                "alloc_detect": self.__alloc_detect,
+                "alloc_detect_max": self.__alloc_detect_max,
+                "thread": self.sampler.get_metrics() if self.sampler else None
+                },
+            "memory": {
+                "free": gc.mem_free(), # pylint: disable=E1101
+                "alloc": gc.mem_alloc(), # pylint: disable=E1101
+                "gc_ms": self.__gc_ms
+                },
+            "export": self.__export_status,
+            "recording": {
+                "stored": self.sensor_data.length(),
+                "readings": self.sensor_data.raw_count()
+                },
+            "retention": self.__retention_diagnostics(),
+            "capacity": self.capacity.get_metrics(),
+            "detection": self.detection_trace.get_metrics()
+            }
+        if session and session.diag_section:
+            section = session.diag_section
+            return ujson.dumps({section: diagnostics.get(section)})
+        return ujson.dumps(diagnostics)
+
+    def __retention_diagnostics(self):
+        """
+        __retention_diagnostics
+        Returns what the full cache evicted, and how many evicted readings
+        event-anchored retention kept (and dropped to stay in its budget).
+        """
+        pinned = self.sensor_data.pinned()
+        return {
+            "evicted": self.sensor_data.evicted(),
+            "pinned": pinned.length() if pinned else 0,
+            "pin_budget": pinned.budget() if pinned else 0,
+            "pin_windows": pinned.window_count() if pinned else 0,
+            "pin_dropped": pinned.dropped() if pinned else 0
+            }
+
+    def __on_client_paired(self, session, client_id):
         """
         __on_client_paired
-        Triggered by BluetoothServer when a new client has paired.
+        Triggered by the SyncProtocol when a new client has paired.
         """
         if not client_id in self.device_info.client_ids:
             self.device_info.client_ids.add(client_id)
             self.update_device_info()
             self.bluetooth_server.update_client_ids(self.device_info.client_ids)
+            self.notifier.update_client_ids(self.device_info.client_ids)
+            self.__update_sync_cursors()
+        self.__set_session_client(session, client_id)
+        self.sync_cursors.rewind(client_id)
 
-    def __on_client_unpaired(self, client_id):
+    def __on_client_unpaired(self, session, client_id):
         """
         __on_client_unpaired
-        Triggered by BluetoothServer when a device has unpaired.
+        Triggered by the SyncProtocol when a device has unpaired.
         """
         if client_id in self.device_info.client_ids:
             self.device_info.client_ids.discard(client_id)
             self.update_device_info()
             self.bluetooth_server.update_client_ids(self.device_info.client_ids)
+            self.notifier.update_client_ids(self.device_info.client_ids)
+            self.__update_sync_cursors()
+        if session.client_id == client_id:
+            self.__set_session_client(session, None)
+
+    def __on_client_connected(self, session): # pylint: disable=W0613
+        """
+        __on_client_connected
+        Triggered by the SyncProtocol when a client connects.  Notifications
+        start once it says which client it is (see __set_session_client).
+        """
+
+    def __on_client_disconnected(self, session):
+        """
+        __on_client_disconnected
+        Triggered by the SyncProtocol when a client disconnects.
+        """
+        self.__set_session_client(session, None)
+        self.sync_cursors.flush()
+
+    def __on_notification_ack(self, client_id, seq):
+        """
+        __on_notification_ack
+        Triggered by the SyncProtocol when a client acks event notifications.
+        """
+        self.notifier.on_ack(client_id, seq)
+
+    def __on_sync_client(self, session, client_id):
+        """
+        __on_sync_client
+        Triggered by the SyncProtocol when a client identifies itself before
+        reading data/events.  Its reads start over from what it acked.
+        """
+        self.__set_session_client(session, client_id or None)
+        self.sync_cursors.rewind(session.client_id)
+
+    def __on_data_ack(self, session, seq):
+        """
+        __on_data_ack
+        Triggered by the SyncProtocol when a client acks every data point
+        before seq.  Releases what every paired client has acked.
+        """
+        seq = min(seq, self.sensor_data.next_seq())
+        if self.sync_cursors.ack(session.client_id, DATA_CURSOR, seq):
+            self.sensor_data.release_before(self.sync_cursors.min_seq(DATA_CURSOR))
+
+    def __on_event_ack(self, session, seq):
+        """
+        __on_event_ack
+        Triggered by the SyncProtocol when a client acks every event before
+        seq.  Releases what every paired client has acked.
+        """
+        seq = min(seq, self.events.next_seq())
+        if self.sync_cursors.ack(session.client_id, EVENT_CURSOR, seq):
+            self.events.release_before(self.sync_cursors.min_seq(EVENT_CURSOR))
+
+    def __set_session_client(self, session, client_id):
+        """
+        __set_session_client
+        Sets the client a session belongs to, and tells the notifier, which
+        addresses notifications to the clients' connections.
+        """
+        if session.client_id == client_id:
+            return
+        if session.client_id:
+            self.notifier.on_disconnected(session.client_id)
+        session.client_id = client_id
+        if client_id:
+            self.notifier.on_connected(client_id)
+
+    def __update_sync_cursors(self):
+        """
+        __update_sync_cursors
+        Keeps a read cursor for every paired client.  New clients start at the
+        oldest data point and event still in the caches.
+        """
+        self.sync_cursors.update_client_ids(self.device_info.client_ids,
+                                            self.sensor_data.first_seq(),
+                                            self.events.first_seq())
+        self.sync_cursors.clamp(DATA_CURSOR,
+                                self.sensor_data.first_seq(),
+                                self.sensor_data.next_seq())
+        self.sync_cursors.clamp(EVENT_CURSOR,
+                                self.events.first_seq(),
+                                self.events.next_seq())
+
+    def __on_sync_batch(self, session, batch_size):
+        """
+        __on_sync_batch
+        Triggered by the SyncProtocol when a client asks for batched data reads.
+        """
+        session.batch = max(1, batch_size)
+
+    def __on_summary_page(self, session, page):
+        """
+        __on_summary_page
+        Triggered by the SyncProtocol when a client picks which hourly buckets
+        the summary read returns (page p = hours p*PAGE_BUCKETS.. ago).
+        """
+        session.summary_page = min(max(0, page), (NUM_BUCKETS - 1) // PAGE_BUCKETS)
+
+    def __on_diag_section(self, session, section):
+        """
+        __on_diag_section
+        Triggered by the SyncProtocol when a client picks the diagnostics
+        section its diag reads return (empty for all of them, which can
+        outgrow a BLE attribute).
+        """
+        session.diag_section = section or None
+
+    def __apply_deadband(self):
+        """
+        __apply_deadband
+        Passes the deadband recording settings on to the sensor cache, with
+        the planned heartbeat (the configured one, unless the heap is short).
+        """
+        self.sensor_data.set_deadband(int(self.config.deadband * 10 + 0.5),
+                                      self.capacity.heartbeat())
+
+    def __apply_pinning(self):
+        """
+        __apply_pinning
+        Passes the event-anchored retention settings on to the sensor cache:
+        config.pin seconds of readings (rounded up to whole intervals) on
+        each side of an event, at most the planned budget of readings.
+        """
+        window = (self.config.pin + self.config.interval - 1) // self.config.interval
+        self.sensor_data.set_pinning(window, window, self.capacity.pin_budget())
+
+    def __on_notification_sent(self, last_seq):
+        """
+        __on_notification_sent
+        Triggered by the NotificationDispatcher after it sent a notification.
+        """
+        self.detection_trace.on_sent(last_seq)
+
+    def __on_notification_acked(self, seq):
+        """
+        __on_notification_acked
+        Triggered by the NotificationDispatcher after a client acked notifications.
+        """
+        self.detection_trace.on_acked(seq)
+
+    def __send_notification(self, payload, client_id):
+        """
+        __send_notification
+        Sends an event notification to client_id's connections, over every
+        transport.
+        """
+        self.bluetooth_server.send_notification(payload, client_id)
+        if self.socket_server:
+            self.socket_server.send_notification(payload, client_id)
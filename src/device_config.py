@@ -0,0 +1,114 @@
+"""
+device_config.py
+Sampling and retention settings that can be changed at runtime.
+"""
+import uio # pylint: disable=F0401
+import ujson # pylint: disable=F0401
+
+# Path to json file where the config is stored (next to device-info.json)
+DEVICE_CONFIG_PATH = '/flash/device-config.json'
+# Config keys (as used by the setup_config= command)
+CONFIG_INTERVAL = 'interval' # seconds between readings
+CONFIG_RETENTION = 'retention' # days of readings kept in the cache
+CONFIG_EVENTS = 'events' # max # of events kept in the cache
+CONFIG_DEADBAND = 'deadband' # % / degrees a reading must move to be stored
+CONFIG_HEARTBEAT = 'heartbeat' # max seconds between stored readings; 0 stores every reading
+CONFIG_PIN = 'pin' # seconds of readings kept before and after each event; 0 = off
+CONFIG_PIN_BUDGET = 'pin_budget' # max # of pinned readings (14 bytes each)
+DEFAULT_PIN_BUDGET = 1440
+# Allowed ranges (inclusive)
+CONFIG_LIMITS = {
+    CONFIG_INTERVAL: (1, 3600),
+    CONFIG_RETENTION: (0.01, 30),
+    CONFIG_EVENTS: (1, 1000),
+    CONFIG_DEADBAND: (0, 10),
+    CONFIG_HEARTBEAT: (0, 3600),
+    CONFIG_PIN: (0, 3600),
+    CONFIG_PIN_BUDGET: (0, 20000),
+}
+
+class DeviceConfig: # pylint: disable=C1001,R0902
+    """
+    DeviceConfig
+    The reading interval, data retention, event capacity, deadband recording
+    and event-anchored retention settings.  Starts from the values main.py
+    passes in (deadband recording and pinning off), overridden by the config
+    saved on flash.
+
+    Stored on flash as
+    {"interval": 5, "retention": 7, "events": 100, "deadband": 0, "heartbeat": 0,
+     "pin": 0, "pin_budget": 1440}.
+    """
+    def __init__(self, duration, interval, num_events, path=None):
+        self.interval = interval
+        self.retention = duration
+        self.num_events = num_events
+        self.deadband = 0.0
+        self.heartbeat = 0
+        self.pin = 0
+        self.pin_budget = DEFAULT_PIN_BUDGET
+        self.__path = path
+        if path:
+            self.__load()
+
+    def update(self, values):
+        """
+        update
+        Applies a {key: value} dict of changes (values may be strings).
+        Raises ValueError (and changes nothing) if a key or value is invalid.
+        """
+        checked = {}
+        for key, value in values.items():
+            if key not in CONFIG_LIMITS:
+                raise ValueError('Unknown config key: ' + key)
+            value = float(value) if key in (CONFIG_RETENTION, CONFIG_DEADBAND) else int(value)
+            low, high = CONFIG_LIMITS[key]
+            if not low <= value <= high:
+                raise ValueError('Config value out of range: ' + key)
+            checked[key] = value
+        self.interval = checked.get(CONFIG_INTERVAL, self.interval)
+        self.retention = checked.get(CONFIG_RETENTION, self.retention)
+        self.num_events = checked.get(CONFIG_EVENTS, self.num_events)
+        self.deadband = checked.get(CONFIG_DEADBAND, self.deadband)
+        self.heartbeat = checked.get(CONFIG_HEARTBEAT, self.heartbeat)
+        self.pin = checked.get(CONFIG_PIN, self.pin)
+        self.pin_budget = checked.get(CONFIG_PIN_BUDGET, self.pin_budget)
+
+    def to_dict(self):
+        """
+        to_dict
+        Returns the config as a dict.
+        """
+        return {
+            CONFIG_INTERVAL: self.interval,
+            CONFIG_RETENTION: self.retention,
+            CONFIG_EVENTS: self.num_events,
+            CONFIG_DEADBAND: self.deadband,
+            CONFIG_HEARTBEAT: self.heartbeat,
+            CONFIG_PIN: self.pin,
+            CONFIG_PIN_BUDGET: self.pin_budget,
+        }
+
+    def save(self):
+        """
+        save
+        Writes the config to flash.
+        """
+        if not self.__path:
+            return
+        try:
+            with uio.open(self.__path, mode='w') as outfile:
+                outfile.write(ujson.dumps(self.to_dict()))
+            outfile.close()
+        except OSError as err:
+            print('Could not write device config file', err)
+
+    def __load(self):
+        try:
+            with uio.open(self.__path, mode='r') as infile:
+                self.update(ujson.loads(infile.read()))
+            infile.close()
+        except ValueError as err:
+            print("Could not parse device config file", err)
+        except OSError:
+            pass # No config saved yet.
@@ -21,6 +21,9 @@ BT_DATA_SVC_ID = '9dce6733-198c-46e3-b138-9cce67b3d96c'
 BT_EVENT_SVC_ID = '48241209-0402-41c0-a070-389cce673399'
 BT_EVENT_NOTIF_SVC_ID = '77e90f18-69ae-4283-bf53-f940e4588afa'
 BT_EVENT_CLEAR_SVC_ID = '8b30ec19-6368-4920-939b-80c8cd24b3b0'
+BT_DIAG_SVC_ID = '4ba7789a-7597-4f3f-b1a6-f9e7bcab0ddd'
+BT_SUMMARY_SVC_ID = 'a1cfc25d-ef1a-489e-8687-62fbc5366033'
+BT_QUERY_SVC_ID = 'dfae9025-8dd9-4428-98a9-e2ec42ea857b'
 BT_PAIR_CHAR_ID = '369bcde6-73b9-4cae-97eb-753a9dcee773'
 BT_UNPAIR_CHAR_ID = 'b95caed7-eb75-4a9d-8e67-b359acd6eb75'
 BT_DATA_CHAR_ID = 'cae57239-9c4e-4793-89e4-72b9dc6e379b'
@@ -28,6 +31,9 @@ BT_EVENT_CHAR_ID = '6db65bad-d66b-45da-adf6-7bbd5eaf57ab'
 BT_EVENT_NOTIF_CHAR_ID = 'a647940e-ebc1-4bd4-b273-a600929476cd'
 BT_EVENT_CLEAR_CHAR_ID = 'ee7a4fc7-6305-48e1-92e9-7c1c9be13b63'
 BT_SETUP_CHAR_ID = '2e97cbe5-f2f9-4c3e-9f0f-0783c1603018'
+BT_DIAG_CHAR_ID = '98136779-7dc9-4d30-905d-11e6fab7692f'
+BT_SUMMARY_CHAR_ID = '682cc7a0-437f-41b5-908d-5dcae264c170'
+BT_QUERY_CHAR_ID = '3be4f904-97d4-4e5f-8efa-db4dac5c8901'
 
 # pylint: disable=C0325
 class DeviceInfo: # pylint: disable=C1001,R0902
@@ -55,6 +61,13 @@ class DeviceInfo: # pylint: disable=C1001,R0902
             self.bt_event_char_id = initial_values.get('bt_event_char_id') or ''
             self.bt_event_notif_char_id = initial_values.get('bt_event_notif_char_id') or ''
             self.bt_event_clear_char_id = initial_values.get('bt_event_clear_char_id') or ''
+            # Added after the first release; older files fall back to the defaults.
+            self.bt_diag_svc_id = initial_values.get('bt_diag_svc_id') or BT_DIAG_SVC_ID
+            self.bt_diag_char_id = initial_values.get('bt_diag_char_id') or BT_DIAG_CHAR_ID
+            self.bt_summary_svc_id = initial_values.get('bt_summary_svc_id') or BT_SUMMARY_SVC_ID
+            self.bt_summary_char_id = initial_values.get('bt_summary_char_id') or BT_SUMMARY_CHAR_ID
+            self.bt_query_svc_id = initial_values.get('bt_query_svc_id') or BT_QUERY_SVC_ID
+            self.bt_query_char_id = initial_values.get('bt_query_char_id') or BT_QUERY_CHAR_ID
 
         if generate_initial_values:
             self.__generate_initial_values()
@@ -82,6 +95,12 @@ class DeviceInfo: # pylint: disable=C1001,R0902
         self.bt_event_char_id = BT_EVENT_CHAR_ID
         self.bt_event_notif_char_id = BT_EVENT_NOTIF_CHAR_ID
         self.bt_event_clear_char_id = BT_EVENT_CLEAR_CHAR_ID
+        self.bt_diag_svc_id = BT_DIAG_SVC_ID
+        self.bt_diag_char_id = BT_DIAG_CHAR_ID
+        self.bt_summary_svc_id = BT_SUMMARY_SVC_ID
+        self.bt_summary_char_id = BT_SUMMARY_CHAR_ID
+        self.bt_query_svc_id = BT_QUERY_SVC_ID
+        self.bt_query_char_id = BT_QUERY_CHAR_ID
 
     def get_bluetooth_ids(self):
         """
@@ -103,7 +122,13 @@ class DeviceInfo: # pylint: disable=C1001,R0902
             "bt_data_char_id": self.bt_data_char_id,
             "bt_event_char_id": self.bt_event_char_id,
             "bt_event_notif_char_id": self.bt_event_notif_char_id,
-            "bt_event_clear_char_id": self.bt_event_clear_char_id
+            "bt_event_clear_char_id": self.bt_event_clear_char_id,
+            "bt_diag_svc_id": self.bt_diag_svc_id,
+            "bt_diag_char_id": self.bt_diag_char_id,
+            "bt_summary_svc_id": self.bt_summary_svc_id,
+            "bt_summary_char_id": self.bt_summary_char_id,
+            "bt_query_svc_id": self.bt_query_svc_id,
+            "bt_query_char_id": self.bt_query_char_id
             }
 
     def to_json(self):
@@ -129,7 +154,13 @@ class DeviceInfo: # pylint: disable=C1001,R0902
             "bt_data_char_id": self.bt_data_char_id,
             "bt_event_char_id": self.bt_event_char_id,
             "bt_event_notif_char_id": self.bt_event_notif_char_id,
-            "bt_event_clear_char_id": self.bt_event_clear_char_id
+            "bt_event_clear_char_id": self.bt_event_clear_char_id,
+            "bt_diag_svc_id": self.bt_diag_svc_id,
+            "bt_diag_char_id": self.bt_diag_char_id,
+            "bt_summary_svc_id": self.bt_summary_svc_id,
+            "bt_summary_char_id": self.bt_summary_char_id,
+            "bt_query_svc_id": self.bt_query_svc_id,
+            "bt_query_char_id": self.bt_query_char_id
             })
 
 # Functions:
@@ -4,7 +4,6 @@ Event
 Class representing humidity reading event
 """
 
-import time
 import uuid
 from lib.helpers import current_timestamp
 
@@ -22,12 +21,19 @@ class Event: # pylint: disable=C1001, R0903
     Event
     Represents an event derived from changes in humidity/temperature
     """
-    def __init__(self, event_type=EventType.one):
-        self.event_id = str(uuid.uuid4())
-        self.timestamp = time.time()
-        self.event_type = 1
-        self.timestamp = current_timestamp()
-        self.event_type = event_type
+    def __init__(self, event_type=EventType.one, initial_values=None, time_set=True):
+        # False while the timestamp is from before the RTC was set; the
+        # EventCache corrects it (on_time_set) once the clock is set.
+        self.time_set = True
+        if initial_values:
+            self.event_id = initial_values.get('event_id') or ''
+            self.timestamp = initial_values.get('timestamp') or 0
+            self.event_type = initial_values.get('event_type') or event_type
+        else:
+            self.event_id = str(uuid.uuid4())
+            self.timestamp = current_timestamp()
+            self.event_type = event_type
+            self.time_set = time_set
 
     def log(self):
         """
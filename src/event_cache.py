@@ -1,95 +1,183 @@
-
 """
 event_cache.py
-A cache that holds sensor data until it is synced.
+A cache that holds events until they are synced.
+
+Every event gets a monotonically increasing sequence number.  The live seqs
+are kept in ascending order (new events always go to the end), next to a
+seq -> event map and an id -> seq index, so lookup is O(1) and finding the
+next event at or after a seq is a binary search.  Removing an event frees its
+place right away: the cache evicts its oldest event only when max_size events
+are live, however many seqs removals skipped.  The seqs are a plain list, not
+a ring: a removal shifts the entries after it, a memmove of at most max_size
+(<= 1000) pointers, and in exchange count_from() stays an index subtraction
+with no tombstones to skip.
+
+Every push/remove is written through to an append-only log on flash.  On boot
+the log is replayed, and then compacted into a fresh snapshot.  Compaction
+writes a temp file before swapping it in, so a crash at any point leaves either
+the old or the new log intact.  A torn last line (crash mid-write) is dropped.
+Sequence numbers are logged too, so they stay stable across reboots and can be
+used as persistent read positions.
 """
+import uos # pylint: disable=E0401
+import uio # pylint: disable=F0401
+import ujson # pylint: disable=F0401
 import utime # pylint: disable=E0401
-from src.event import EventType
+from src.event import Event, EventType
+from src.device_info import does_file_exist
 
-class EventCache: # pylint: disable=C1001
+# Path to the event log on flash
+EVENT_LOG_PATH = '/flash/events.log'
+# The log is compacted once it holds this many records per event max_size allows.
+LOG_COMPACT_FACTOR = 4
+# Log record operations
+LOG_OP_PUSH = 'p'
+LOG_OP_REMOVE = 'r'
+LOG_OP_NEXT_SEQ = 'n'
+
+class EventCache: # pylint: disable=C1001,R0902
     """
     EventCache
     Cache for events.  Works like a stack.
     """
-    def __init__(self, max_size):
+    def __init__(self, max_size, log_path=None):
         self.__max_size = max_size
-        self.__cache = []
-        self.__last_dirty_timestamp = 0
-        self.__last_clear_timestamp = 0
+        self.__seqs = [] # seqs of the events in the cache, ascending
+        self.__events = {} # seq -> event
+        self.__index = {} # event_id -> seq
+        self.__next_seq = 0 # seq assigned to the next pushed event
+        self.__unhandled_count = 0
+        # Kept as events (not timestamps) so they follow on_time_set corrections.
+        self.__last_dirty_event = None
+        self.__last_clear_event = None
+        self.__log_path = log_path
+        self.__log = None
+        self.__log_records = 0
+        if log_path:
+            self.__recover()
 
     def time_since_last_dirty_event(self):
         """
         time_since_last_dirty_event
         Returns time since last dirty event
         """
-        return utime.time() - self.__last_dirty_timestamp
+        if not self.__last_dirty_event:
+            return utime.time()
+        return utime.time() - self.__last_dirty_event.timestamp
+
+    def has_dirty_event(self):
+        """
+        has_dirty_event
+        Returns true if a dirty event has been pushed since boot (or is in the log).
+        """
+        return self.__last_dirty_event is not None
 
     def time_since_last_clear_event(self):
         """
         time_since_last_clear_event
         Returns time since last dirty event
         """
-        return utime.time() - self.__last_clear_timestamp
+        if not self.__last_clear_event:
+            return utime.time()
+        return utime.time() - self.__last_clear_event.timestamp
 
     def has_unhandled_events(self):
         """
         has_unhandled_events
         Returns true if there are events with type one or two.
         """
-        for evt in self.__cache:
-            if evt.event_type != EventType.changed:
-                return True
-        return False
+        return self.__unhandled_count > 0
+
+    def unhandled_count(self):
+        """
+        unhandled_count
+        Returns the number of events with type one or two.
+        """
+        return self.__unhandled_count
 
     def remove_event(self, event_id):
         """
         remove_event
         removes event from cache
         """
-        found_event = self.find_by_id(event_id)
-        if found_event:
-            self.__cache.remove(found_event)
-        else:
+        seq = self.__index.get(event_id)
+        if seq is None:
             print("Cannot remove event {}. Does not exist.".format(event_id)) # pylint: disable=C0325
+            return
+        self.__release(seq)
+        self.__write_log({"o": LOG_OP_REMOVE, "id": event_id})
 
     def find_by_id(self, event_id):
         """
         find_by_id
         finds an event by id
         """
-        for e in self.__cache: # pylint: disable=C0103
-            if e.event_id == event_id:
-                return e
-        return None
+        seq = self.__index.get(event_id)
+        if seq is None:
+            return None
+        return self.__events[seq]
 
     def length(self):
         """
         length
         returns number of items in cache
         """
-        return len(self.__cache)
+        return len(self.__seqs)
+
+    def first_seq(self):
+        """
+        first_seq
+        returns the seq of the oldest event in the cache (next_seq if empty)
+        """
+        return self.__seqs[0] if self.__seqs else self.__next_seq
+
+    def next_seq(self):
+        """
+        next_seq
+        returns the seq that the next pushed event will get
+        """
+        return self.__next_seq
+
+    def find_next(self, seq):
+        """
+        find_next
+        returns the seq of the oldest event at or after seq (or next_seq if none).
+        """
+        position = self.__position(seq)
+        if position < len(self.__seqs):
+            return self.__seqs[position]
+        return self.__next_seq
+
+    def get(self, seq):
+        """
+        get
+        returns the event with the given seq, or None if it is not in the cache.
+        """
+        return self.__events.get(seq)
+
+    def count_from(self, seq):
+        """
+        count_from
+        returns the number of events at or after seq
+        """
+        return len(self.__seqs) - self.__position(seq)
 
     def push(self, event):
         """
         push
         adds an item to the cache
         """
-        if len(self.__cache) == self.__max_size:
-            self.deque()
-        self.__cache.append(event)
-
-        if event.event_type == EventType.changed:
-            self.__last_clear_timestamp = event.timestamp
-        else:
-            self.__last_dirty_timestamp = event.timestamp
+        seq = self.__next_seq
+        self.__insert(event)
+        self.__write_log({"o": LOG_OP_PUSH, "s": seq, "e": event.to_dict()})
 
     def peek(self):
         """
         peek
         returns the top of the stack without removing it.
         """
-        if self.__cache:
-            return self.__cache[-1]
+        if self.__seqs:
+            return self.__events[self.__seqs[-1]]
         return None
 
     def deque(self):
@@ -97,6 +185,182 @@ class EventCache: # pylint: disable=C1001
         deque
         removes and returns the first item from the cache
         """
-        if self.__cache:
-            return self.__cache.pop(0)
-        return None
+        event = self.__pop_oldest()
+        if event:
+            self.__write_log({"o": LOG_OP_REMOVE, "id": event.event_id})
+        return event
+
+    def release_before(self, seq):
+        """
+        release_before
+        removes every event older than seq
+        """
+        while self.__seqs and self.__seqs[0] < seq:
+            self.deque()
+
+    def max_size(self):
+        """
+        max_size
+        returns the number of events the cache can hold
+        """
+        return self.__max_size
+
+    def resize(self, max_size):
+        """
+        resize
+        Changes the capacity.  Events keep their seq; when shrinking, the
+        oldest events that no longer fit are dropped.  The log is compacted,
+        so it matches the resized cache.
+        """
+        if max_size == self.__max_size:
+            return
+        while len(self.__seqs) > max_size:
+            self.__pop_oldest()
+        self.__max_size = max_size
+        if self.__log_path:
+            self.__compact()
+
+    def on_time_set(self, delta):
+        """
+        on_time_set
+        Called after the RTC was first set (it moved by delta seconds).
+        Corrects the timestamps of events created before, and rewrites the
+        log with the corrected ones.
+        """
+        changed = False
+        for seq in self.__seqs:
+            event = self.__events[seq]
+            if not event.time_set:
+                event.timestamp += delta
+                event.time_set = True
+                changed = True
+        if changed and self.__log_path:
+            self.__compact()
+
+    def __position(self, seq):
+        """
+        __position
+        Returns the index of the first seq in __seqs that is >= seq.
+        """
+        seqs = self.__seqs
+        low = 0
+        high = len(seqs)
+        while low < high:
+            middle = (low + high) // 2
+            if seqs[middle] < seq:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def __skip_to(self, seq):
+        """
+        __skip_to
+        Moves next_seq forward to seq.  Skipped seqs take no room.
+        """
+        self.__next_seq = max(self.__next_seq, seq)
+
+    def __insert(self, event):
+        if len(self.__seqs) >= self.__max_size:
+            self.__pop_oldest()
+        seq = self.__next_seq
+        self.__next_seq += 1
+        self.__seqs.append(seq)
+        self.__events[seq] = event
+        self.__index[event.event_id] = seq
+        if event.event_type == EventType.changed:
+            self.__last_clear_event = event
+        else:
+            self.__unhandled_count += 1
+            self.__last_dirty_event = event
+
+    def __pop_oldest(self):
+        """
+        __pop_oldest
+        Removes and returns the oldest event (None if the cache is empty).
+        """
+        if not self.__seqs:
+            return None
+        return self.__release(self.__seqs[0])
+
+    def __release(self, seq):
+        event = self.__events.pop(seq)
+        del self.__seqs[self.__position(seq)]
+        del self.__index[event.event_id]
+        if event.event_type != EventType.changed:
+            self.__unhandled_count -= 1
+        return event
+
+    def __write_log(self, record):
+        if not self.__log:
+            return
+        try:
+            self.__log.write(ujson.dumps(record) + '\n')
+            self.__log.flush()
+            self.__log_records += 1
+        except OSError as err:
+            print('Could not write event log', err)
+            return
+        if self.__log_records > self.__max_size * LOG_COMPACT_FACTOR:
+            self.__compact()
+
+    def __recover(self):
+        """
+        __recover
+        Replays the event log from flash, then compacts it.
+        """
+        tmp_path = self.__log_path + '.tmp'
+        if does_file_exist(self.__log_path):
+            if does_file_exist(tmp_path):
+                # Crashed while writing a snapshot; the old log is still whole.
+                uos.remove(tmp_path)
+        elif does_file_exist(tmp_path):
+            # Crashed after removing the old log; the snapshot is complete.
+            uos.rename(tmp_path, self.__log_path)
+
+        try:
+            with uio.open(self.__log_path, mode='r') as infile:
+                for line in infile:
+                    try:
+                        record = ujson.loads(line)
+                    except ValueError:
+                        print('Dropping torn event log record')
+                        break
+                    self.__replay(record)
+            infile.close()
+        except OSError:
+            pass # No log yet.
+        self.__compact()
+
+    def __replay(self, record):
+        if record.get("o") == LOG_OP_NEXT_SEQ:
+            self.__skip_to(record.get("s"))
+        elif record.get("o") == LOG_OP_PUSH:
+            self.__skip_to(record.get("s") or 0)
+            self.__insert(Event(initial_values=record.get("e")))
+        elif record.get("o") == LOG_OP_REMOVE and record.get("id") in self.__index:
+            self.__release(self.__index[record.get("id")])
+
+    def __compact(self):
+        """
+        __compact
+        Rewrites the log as a snapshot of the events currently in the cache.
+        """
+        tmp_path = self.__log_path + '.tmp'
+        if self.__log:
+            self.__log.close()
+            self.__log = None
+        try:
+            with uio.open(tmp_path, mode='w') as outfile:
+                for seq in self.__seqs:
+                    event = self.__events[seq]
+                    outfile.write(ujson.dumps({"o": LOG_OP_PUSH, "s": seq, "e": event.to_dict()}) + '\n') # pylint: disable=C0301
+                outfile.write(ujson.dumps({"o": LOG_OP_NEXT_SEQ, "s": self.__next_seq}) + '\n')
+            outfile.close()
+            if does_file_exist(self.__log_path):
+                uos.remove(self.__log_path)
+            uos.rename(tmp_path, self.__log_path)
+            self.__log = uio.open(self.__log_path, mode='a')
+            self.__log_records = len(self.__seqs)
+        except OSError as err:
+            print('Could not compact event log', err)
@@ -0,0 +1,181 @@
+"""
+export.py
+Bulk export of the cached history to /flash, so it can be copied off over
+FTP/USB instead of synced over BLE.
+
+An export is three (or four) files:
+* <name>.bin: the readings, 10 bytes each (little endian): timestamp (uint32),
+  humidity and temperature in tenths (int16), and the repeat count (uint16):
+  with deadband recording a record stands for 1 + repeats readings, one per
+  interval, so the full-rate series can be rebuilt.  The reading with seq
+  first_seq + i is record i.
+* <name>-pinned.bin: the readings event-anchored retention kept after the
+  cache evicted them (older than <name>.bin, not consecutive), 14 bytes each:
+  their seq (uint32), then a record as above.  Only written with pinning on.
+* <name>-events.jsonl: the events, one Event.to_dict() JSON object per line.
+* <name>.json: the manifest, written last: record format and counts, the
+  data id epoch and first seq, the interval and deadband settings, and the
+  size and sha256 of each file.
+
+Files are written in chunks of EXPORT_CHUNK records, so the export never
+holds more than one chunk in RAM.  host/export/reader.py reads the format.
+
+The export is of the caches as they were when it started: readings and
+events added while it runs are left out.  A sync can release readings while
+it runs; records are positional, so the readings file stops before the first
+chunk with a released reading (the manifest counts the records written).
+Released events are skipped.
+"""
+import uio # pylint: disable=F0401
+import ujson # pylint: disable=F0401
+import ustruct # pylint: disable=E0401
+import uhashlib # pylint: disable=E0401
+import ubinascii # pylint: disable=E0401
+import utime # pylint: disable=E0401
+
+EXPORT_DIR = '/flash/'
+EXPORT_NAME = 'export'
+EXPORT_VERSION = 2
+EXPORT_RECORD_FORMAT = '<IhhH'
+EXPORT_RECORD_SIZE = 10
+EXPORT_CHUNK = 256 # records per write (2.5 KB)
+EXPORT_PINNED_FORMAT = '<IIhhH'
+EXPORT_PINNED_SIZE = 14
+
+def is_valid_export_name(name):
+    """
+    is_valid_export_name
+    Returns true if name is a plain file name (letters, digits, - and _).
+    """
+    if not name or len(name) > 32:
+        return False
+    for char in name:
+        if not (char.isalpha() or char.isdigit() or char in '-_'):
+            return False
+    return True
+
+def export_history(sensor_data, events, name=EXPORT_NAME, config=None):
+    """
+    export_history
+    Writes the readings and events currently in the caches to /flash (see
+    the module docstring).  Nothing is removed from the caches.  Returns the
+    manifest as a dict.
+    Raises OSError if a file cannot be written.
+    """
+    first_seq = sensor_data.first_seq()
+    events_end = events.next_seq()
+    data_file, records = _export_data(sensor_data, name + '.bin')
+    pinned = sensor_data.pinned()
+    pinned_file = None
+    if pinned:
+        pinned_file = _export_pinned(pinned, name + '-pinned.bin')
+    events_file, num_events = _export_events(events, events_end, name + '-events.jsonl')
+
+    manifest = {
+        "version": EXPORT_VERSION,
+        "created": utime.time(),
+        "interval": config.interval if config else None,
+        "deadband": config.deadband if config else None,
+        "heartbeat": config.heartbeat if config else None,
+        "epoch": sensor_data.epoch_id(),
+        "first_seq": first_seq,
+        "records": records,
+        "readings": sensor_data.raw_count(),
+        "pinned": pinned.length() if pinned else 0,
+        "events": num_events,
+        "record_format": EXPORT_RECORD_FORMAT,
+        "files": {"data": data_file, "events": events_file}
+    }
+    if pinned_file:
+        manifest["pinned_format"] = EXPORT_PINNED_FORMAT
+        manifest["files"]["pinned"] = pinned_file
+    with uio.open(EXPORT_DIR + name + '.json', mode='w') as outfile:
+        outfile.write(ujson.dumps(manifest))
+    outfile.close()
+    return manifest
+
+def _export_data(sensor_data, file_name):
+    """
+    _export_data
+    Writes the readings in the cache to /flash, in chunks, stopping before
+    the first chunk with a released reading.  Returns the manifest's entry
+    for the file and the number of records written.
+    """
+    first_seq = sensor_data.first_seq()
+    next_seq = sensor_data.next_seq()
+    data_hash = uhashlib.sha256()
+    data_bytes = 0
+    buf = bytearray(EXPORT_CHUNK * EXPORT_RECORD_SIZE)
+    with uio.open(EXPORT_DIR + file_name, mode='wb') as outfile:
+        seq = first_seq
+        while seq < next_seq:
+            count = min(EXPORT_CHUNK, next_seq - seq)
+            for i in range(count):
+                ustruct.pack_into(EXPORT_RECORD_FORMAT, buf, i * EXPORT_RECORD_SIZE,
+                                  sensor_data.timestamp(seq + i) or 0,
+                                  sensor_data.humidity_tenths(seq + i),
+                                  sensor_data.temperature_tenths(seq + i),
+                                  sensor_data.repeats(seq + i))
+            if sensor_data.first_seq() > seq:
+                break # released while packed: the chunk may hold pruned timestamps
+            chunk = memoryview(buf)[:count * EXPORT_RECORD_SIZE]
+            outfile.write(chunk)
+            data_hash.update(chunk)
+            data_bytes += len(chunk)
+            seq += count
+    outfile.close()
+    return {"name": file_name, "bytes": data_bytes,
+            "sha256": ubinascii.hexlify(data_hash.digest()).decode()}, seq - first_seq
+
+def _export_events(events, events_end, file_name):
+    """
+    _export_events
+    Writes the events before events_end to /flash, one per line, skipping
+    released ones.  Returns the manifest's entry for the file and the number
+    of events written.
+    """
+    events_hash = uhashlib.sha256()
+    events_bytes = 0
+    num_events = 0
+    with uio.open(EXPORT_DIR + file_name, mode='wb') as outfile:
+        seq = events.find_next(events.first_seq())
+        while seq < events_end:
+            event = events.get(seq)
+            seq = events.find_next(seq + 1)
+            if not event:
+                continue # released since find_next
+            line = (ujson.dumps(event.to_dict()) + '\n').encode()
+            outfile.write(line)
+            events_hash.update(line)
+            events_bytes += len(line)
+            num_events += 1
+    outfile.close()
+    return {"name": file_name, "bytes": events_bytes,
+            "sha256": ubinascii.hexlify(events_hash.digest()).decode()}, num_events
+
+def _export_pinned(pinned, file_name):
+    """
+    _export_pinned
+    Writes the pinned readings to /flash, in chunks.  Returns the manifest's
+    entry for the file.
+    """
+    pinned_hash = uhashlib.sha256()
+    pinned_bytes = 0
+    buf = bytearray(EXPORT_CHUNK * EXPORT_PINNED_SIZE)
+    with uio.open(EXPORT_DIR + file_name, mode='wb') as outfile:
+        index = 0
+        while index < pinned.length():
+            count = min(EXPORT_CHUNK, pinned.length() - index)
+            for i in range(count):
+                humidity, temperature, repeats = pinned.values(index + i)
+                ustruct.pack_into(EXPORT_PINNED_FORMAT, buf, i * EXPORT_PINNED_SIZE,
+                                  pinned.seq(index + i), pinned.timestamp(index + i) or 0,
+                                  humidity, temperature, repeats)
+            chunk = memoryview(buf)[:count * EXPORT_PINNED_SIZE]
+            outfile.write(chunk)
+            pinned_hash.update(chunk)
+            pinned_bytes += len(chunk)
+            index += count
+    outfile.close()
+    return {"name": file_name, "bytes": pinned_bytes,
+            "sha256": ubinascii.hexlify(pinned_hash.digest()).decode()}
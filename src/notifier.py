@@ -0,0 +1,255 @@
+"""
+notifier.py
+Reliable delivery of event notifications to paired clients.
+"""
+import uio # pylint: disable=F0401
+import ujson # pylint: disable=F0401
+import utime # pylint: disable=E0401
+
+# Path to json file where the notification seq and pending queues are stored
+NOTIFIER_STATE_PATH = '/flash/notifier.json'
+NOTIFY_PREFIX = 'new_events='
+RETRY_INITIAL_MS = 5000 # first retry after 5 seconds
+RETRY_MAX_MS = 300000 # back off to at most one retry every 5 minutes
+ANY_CLIENT = '' # queue used while no client is paired
+
+class NotificationDispatcher: # pylint: disable=C1001,R0902
+    """
+    NotificationDispatcher
+    Queues event notifications per paired client until the client acks them.
+
+    Every notified event gets a sequence number.  A client's pending queue is
+    the range of sequence numbers it has not acked yet, so a burst of events
+    coalesces into a single "new_events=N,X" notification: N new events
+    starting at seq X.  The client acks with the last seq it received
+    (X + N - 1).
+
+    Notifications are addressed: send_notification(payload, client_id) goes
+    to the connections of that client only.  A connection counts as the
+    client's once it says who it is (pair, sync_client=): on_connected(id)
+    and on_disconnected(id).  Each client's unacked notifications are re-sent
+    with its own exponential backoff while it is connected, and immediately
+    when it connects, so a client that stays away holds up no one else.
+
+    Notifications queued while no client is paired are handed to the first
+    clients that pair.  With a path, the last seq and the pending queues are
+    stored on flash ({"seq": n, "pending": {"<client_id>": first_seq}}) on
+    every change, so seqs keep increasing across reboots (a client's acks
+    stay valid) and unacked notifications are re-sent after one.
+
+    on_sent(last_seq) is called after every notification sent (it covers the
+    events up to last_seq), on_acked(seq) after every accepted ack.
+    """
+    def __init__(self, client_ids, send_notification, on_sent=None, on_acked=None, # pylint: disable=R0913
+                 path=None):
+        self.__send_notification = send_notification
+        self.__on_sent = on_sent
+        self.__on_acked = on_acked
+        self.__client_ids = set(client_ids)
+        self.__connections = {} # client_id -> connections, over any transport
+        self.__last_seq = 0 # seq of the most recently notified event
+        # client_id -> [first_seq, enqueued_ms, next_send_ms, backoff_ms, sent_seq]
+        self.__pending = {}
+        self.__sent = 0
+        self.__retries = 0
+        self.__delivered = 0
+        self.__latency_sum_ms = 0
+        self.__latency_max_ms = 0
+        self.__latency_last_ms = 0
+        self.__path = path
+        if path:
+            self.__load()
+
+    def update_client_ids(self, client_ids):
+        """
+        update_client_ids
+        Update the paired clients.  Unpaired clients lose their pending queue;
+        the queue from before any client paired goes to the paired clients.
+        """
+        self.__client_ids = set(client_ids)
+        if self.__move_unpaired():
+            self.save()
+
+    def __move_unpaired(self):
+        """
+        __move_unpaired
+        Drops the pending queues of clients that are not paired, and hands
+        the ANY_CLIENT queue to the paired clients.  Returns true if the
+        queues changed.
+        """
+        changed = False
+        unpaired = self.__pending.get(ANY_CLIENT)
+        if unpaired and self.__client_ids:
+            for client_id in self.__client_ids:
+                pending = self.__pending.get(client_id)
+                if not pending:
+                    self.__pending[client_id] = _queue(unpaired[0], unpaired[1])
+                elif unpaired[0] < pending[0]:
+                    pending[0] = unpaired[0]
+            changed = True
+        for client_id in list(self.__pending):
+            if client_id not in self.__client_ids and (client_id != ANY_CLIENT
+                                                       or self.__client_ids):
+                del self.__pending[client_id]
+                changed = True
+        return changed
+
+    def notify(self, event): # pylint: disable=W0613
+        """
+        notify
+        Queues a notification for the given event for every paired client.
+        Returns the event's notification seq.
+        """
+        self.__last_seq += 1
+        now = utime.ticks_ms()
+        for client_id in self.__client_ids or [ANY_CLIENT]:
+            pending = self.__pending.get(client_id)
+            if not pending:
+                self.__pending[client_id] = _queue(self.__last_seq, now)
+            else:
+                # Sent from the next poll(), so a burst goes out as one notification.
+                pending[2] = now
+                pending[3] = RETRY_INITIAL_MS
+        self.save()
+        return self.__last_seq
+
+    def on_connected(self, client_id):
+        """
+        on_connected
+        Called when a connection says it is client_id's.  Flushes the
+        client's pending notifications.
+        """
+        self.__connections[client_id] = self.__connections.get(client_id, 0) + 1
+        pending = self.__pending.get(client_id)
+        if pending:
+            pending[3] = RETRY_INITIAL_MS
+            self.__send(client_id, pending, utime.ticks_ms())
+
+    def on_disconnected(self, client_id):
+        """
+        on_disconnected
+        Called when a connection of client_id closes (or says it is another
+        client's).  Retries to the client stop with its last connection.
+        """
+        connections = self.__connections.get(client_id, 0) - 1
+        if connections > 0:
+            self.__connections[client_id] = connections
+        else:
+            self.__connections.pop(client_id, None)
+
+    def on_ack(self, client_id, seq):
+        """
+        on_ack
+        Called when a client acks all notifications up to and including seq.
+        """
+        if client_id not in self.__pending and ANY_CLIENT in self.__pending:
+            client_id = ANY_CLIENT
+        pending = self.__pending.get(client_id)
+        if not pending or seq < pending[0]:
+            return
+        latency = utime.ticks_diff(utime.ticks_ms(), pending[1])
+        self.__delivered += 1
+        self.__latency_sum_ms += latency
+        self.__latency_last_ms = latency
+        self.__latency_max_ms = max(self.__latency_max_ms, latency)
+        if seq >= self.__last_seq:
+            del self.__pending[client_id]
+        else:
+            pending[0] = seq + 1
+        self.save()
+        if self.__on_acked:
+            self.__on_acked(seq)
+
+    def poll(self):
+        """
+        poll
+        Sends queued notifications to the connected clients, or re-sends
+        unacked ones once the client's backoff has expired.
+        """
+        if not self.__connections:
+            return
+        now = utime.ticks_ms()
+        for client_id in list(self.__connections): # a failed send disconnects
+            pending = self.__pending.get(client_id)
+            if pending and utime.ticks_diff(now, pending[2]) >= 0:
+                self.__send(client_id, pending, now)
+
+    def pending_count(self):
+        """
+        pending_count
+        Returns the number of clients with unacked notifications.
+        """
+        return len(self.__pending)
+
+    def get_metrics(self):
+        """
+        get_metrics
+        Returns delivery metrics as a dictionary.
+        """
+        return {
+            "pending_clients": len(self.__pending),
+            "last_seq": self.__last_seq,
+            "sent": self.__sent,
+            "retries": self.__retries,
+            "delivered": self.__delivered,
+            "latency_avg_ms": self.__latency_sum_ms // self.__delivered if self.__delivered else 0, # pylint: disable=C0301
+            "latency_max_ms": self.__latency_max_ms,
+            "latency_last_ms": self.__latency_last_ms
+            }
+
+    def save(self):
+        """
+        save
+        Writes the last seq and the pending queues to flash.
+        """
+        if not self.__path:
+            return
+        pending = {}
+        for client_id, queue in self.__pending.items():
+            pending[client_id] = queue[0]
+        try:
+            with uio.open(self.__path, mode='w') as outfile:
+                outfile.write(ujson.dumps({"seq": self.__last_seq, "pending": pending}))
+            outfile.close()
+        except OSError as err:
+            print('Could not write notifier state file', err)
+
+    def __load(self):
+        try:
+            with uio.open(self.__path, mode='r') as infile:
+                state = ujson.loads(infile.read())
+            infile.close()
+            self.__last_seq = int(state.get("seq") or 0)
+            now = utime.ticks_ms()
+            for client_id, first_seq in (state.get("pending") or {}).items():
+                if first_seq <= self.__last_seq:
+                    self.__pending[client_id] = _queue(first_seq, now)
+        except ValueError as err:
+            print("Could not parse notifier state file JSON", err)
+        except OSError:
+            pass # No state saved yet.
+        self.__move_unpaired()
+
+    def __send(self, client_id, pending, now):
+        """
+        __send
+        Sends client_id its pending range, and schedules the retry.
+        """
+        first_seq = pending[0]
+        count = self.__last_seq - first_seq + 1
+        self.__send_notification(NOTIFY_PREFIX + str(count) + ',' + str(first_seq), client_id)
+        self.__sent += 1
+        if pending[4] == self.__last_seq:
+            self.__retries += 1
+        pending[4] = self.__last_seq
+        pending[2] = utime.ticks_add(now, pending[3])
+        pending[3] = min(pending[3] * 2, RETRY_MAX_MS)
+        if self.__on_sent:
+            self.__on_sent(self.__last_seq)
+
+def _queue(first_seq, now):
+    """
+    _queue
+    Returns a new pending queue from first_seq, due to be sent now.
+    """
+    return [first_seq, now, now, RETRY_INITIAL_MS, 0]
@@ -0,0 +1,217 @@
+"""
+pinned_readings.py
+Event-anchored retention: readings around events outlive the SensorCache ring.
+
+Every event pins a window of seqs around it (see SensorCache.pin).  When the
+full ring evicts a reading, the reading is moved here if it lies in a pinned
+window; everything else is evicted as before.  Windows are kept in seq order
+(events happen in order; overlapping windows are merged), so checking a seq
+only ever looks at the oldest window and drops the ones already passed:
+O(1) amortized per eviction.
+
+The kept readings go into a ring with a fixed budget, allocated up front with
+the same 2-byte columns as the SensorCache plus a 4-byte seq.  When the budget
+is used up, the oldest pinned reading goes first (counted in dropped()).
+"""
+from uarray import array # pylint: disable=E0401
+
+COMPACT_AFTER = 16 # passed windows dropped from the window lists in one go
+
+class PinnedReadings: # pylint: disable=C1001,R0902
+    """
+    PinnedReadings
+    Readings evicted from the SensorCache inside event windows, oldest first.
+    Index 0 is the oldest reading held.
+    """
+    def __init__(self, budget, timebase):
+        self.__budget = int(budget)
+        self.__timebase = timebase
+        self.__seqs = array('i', bytearray(4 * self.__budget))
+        self.__segments = array('H', bytearray(2 * self.__budget))
+        self.__offsets = array('H', bytearray(2 * self.__budget))
+        self.__humidity = array('h', bytearray(2 * self.__budget))
+        self.__temperature = array('h', bytearray(2 * self.__budget))
+        self.__repeats = array('H', bytearray(2 * self.__budget))
+        self.__first = 0 # slot of the oldest reading
+        self.__count = 0
+        self.__dropped = 0 # pinned readings dropped because the budget was used up
+        # Pinned windows [start, end) of seqs; windows before __head have passed.
+        self.__starts = []
+        self.__ends = []
+        self.__head = 0
+
+    def budget(self):
+        """
+        budget
+        returns the number of readings that can be held
+        """
+        return self.__budget
+
+    def length(self):
+        """
+        length
+        returns the number of readings held
+        """
+        return self.__count
+
+    def dropped(self):
+        """
+        dropped
+        returns the number of pinned readings dropped to stay within the budget
+        """
+        return self.__dropped
+
+    def window_count(self):
+        """
+        window_count
+        returns the number of pinned windows not yet evicted from the SensorCache
+        """
+        return len(self.__starts) - self.__head
+
+    def pin(self, start, end):
+        """
+        pin
+        Pins the seqs start..end-1.  Windows must come in order of start.
+        """
+        if self.__head < len(self.__ends) and start <= self.__ends[-1]:
+            if end > self.__ends[-1]:
+                self.__ends[-1] = end
+            return
+        self.__starts.append(start)
+        self.__ends.append(end)
+
+    def is_pinned(self, seq):
+        """
+        is_pinned
+        Returns true if seq is in a pinned window.  Seqs must be asked about
+        in increasing order (the order the ring evicts them in).
+        """
+        while self.__head < len(self.__ends) and self.__ends[self.__head] <= seq:
+            self.__head += 1
+        if self.__head >= COMPACT_AFTER:
+            del self.__starts[:self.__head]
+            del self.__ends[:self.__head]
+            self.__head = 0
+        return self.__head < len(self.__starts) and self.__starts[self.__head] <= seq
+
+    def keep(self, seq, segment, offset, humidity, temperature, repeats): # pylint: disable=R0913
+        """
+        keep
+        Adds a reading, dropping the oldest one if the budget is used up.
+        """
+        if self.__count == self.__budget:
+            self.__first = (self.__first + 1) % self.__budget
+            self.__count -= 1
+            self.__dropped += 1
+        slot = (self.__first + self.__count) % self.__budget
+        self.__seqs[slot] = seq
+        self.__segments[slot] = segment
+        self.__offsets[slot] = offset
+        self.__humidity[slot] = humidity
+        self.__temperature[slot] = temperature
+        self.__repeats[slot] = repeats
+        self.__count += 1
+
+    def resize(self, budget):
+        """
+        resize
+        Changes the budget, keeping the newest readings that fit.  Returns
+        false (and keeps the current budget) if there is not enough memory.
+        """
+        budget = int(budget)
+        if budget == self.__budget:
+            return True
+        try:
+            seqs = array('i', bytearray(4 * budget))
+            segments = array('H', bytearray(2 * budget))
+            offsets = array('H', bytearray(2 * budget))
+            humidity = array('h', bytearray(2 * budget))
+            temperature = array('h', bytearray(2 * budget))
+            repeats = array('H', bytearray(2 * budget))
+        except MemoryError:
+            print('Not enough memory to resize pinned readings to', budget)
+            return False
+        count = min(self.__count, budget)
+        for index in range(count):
+            slot = (self.__first + self.__count - count + index) % self.__budget
+            seqs[index] = self.__seqs[slot]
+            segments[index] = self.__segments[slot]
+            offsets[index] = self.__offsets[slot]
+            humidity[index] = self.__humidity[slot]
+            temperature[index] = self.__temperature[slot]
+            repeats[index] = self.__repeats[slot]
+        self.__dropped += self.__count - count
+        self.__budget = budget
+        self.__seqs = seqs
+        self.__segments = segments
+        self.__offsets = offsets
+        self.__humidity = humidity
+        self.__temperature = temperature
+        self.__repeats = repeats
+        self.__first = 0
+        self.__count = count
+        return True
+
+    def first_segment(self):
+        """
+        first_segment
+        returns the timebase segment of the oldest reading held
+        """
+        return self.__segments[self.__first]
+
+    def seq(self, index):
+        """
+        seq
+        returns the seq of the reading at index
+        """
+        return self.__seqs[(self.__first + index) % self.__budget]
+
+    def timestamp(self, index):
+        """
+        timestamp
+        returns the timestamp of the reading at index (None if pruned)
+        """
+        slot = (self.__first + index) % self.__budget
+        return self.__timebase.to_wall(self.__segments[slot], self.__offsets[slot])
+
+    def values(self, index):
+        """
+        values
+        returns (humidity, temperature, repeats) of the reading at index,
+        humidity and temperature in tenths
+        """
+        slot = (self.__first + index) % self.__budget
+        return self.__humidity[slot], self.__temperature[slot], self.__repeats[slot]
+
+    def find_seq(self, seq):
+        """
+        find_seq
+        returns the index of the oldest reading with a seq at or after seq
+        (or length() if none), by binary search.
+        """
+        low = 0
+        high = self.__count
+        while low < high:
+            mid = (low + high) // 2
+            if self.seq(mid) < seq:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def find_time(self, timestamp):
+        """
+        find_time
+        returns the index of the oldest reading taken at or after timestamp
+        (or length() if none), by binary search.
+        """
+        low = 0
+        high = self.__count
+        while low < high:
+            mid = (low + high) // 2
+            mid_time = self.timestamp(mid)
+            if mid_time is None or mid_time < timestamp:
+                low = mid + 1
+            else:
+                high = mid
+        return low
@@ -0,0 +1,167 @@
+"""
+sampler.py
+Reads the DHT sensor on its own thread, on a fixed grid of ticks_ms deadlines.
+
+The main loop used to sleep `interval` seconds after its work, so every read,
+detection pass and BLE callback pushed later readings back.  The sampler
+thread instead waits for absolute deadlines (start + n * interval), so the
+rate does not drift: a slow read only makes that one reading late.  When the
+thread falls more than half an interval behind, the deadlines it can no
+longer make are skipped (and counted as missed) rather than read in a burst.
+
+Readings go to the main context through a bounded queue (preallocated
+arrays, guarded by a lock).  When the main context does not keep up, the
+oldest queued reading is dropped (and counted).  Apart from the pulse list
+DHT.read gets, nothing allocates per reading.
+"""
+import _thread # pylint: disable=E0401
+import utime # pylint: disable=E0401
+from uarray import array # pylint: disable=E0401
+from lib.dht import DHTResult
+
+SAMPLE_QUEUE_SIZE = 16 # readings the main context may fall behind by
+SAMPLER_STACK_SIZE = 8192 # bytes
+
+class Sampler: # pylint: disable=C1001,R0902
+    """
+    Sampler
+    Fixed-rate sensor reads on a dedicated thread.  start() starts the
+    thread; step() is one iteration of it (wait for the deadline, read,
+    queue), so the simulator can drive it without a thread.
+    """
+    def __init__(self, dht_sensor, interval_ms, queue_size=SAMPLE_QUEUE_SIZE):
+        self.__dht_sensor = dht_sensor
+        self.__result = DHTResult() # refilled by every read
+        self.__interval_ms = interval_ms
+        self.__deadline = utime.ticks_ms()
+        self.__running = False
+        self.__lock = _thread.allocate_lock()
+        # Bounded queue of (humidity, temperature, ticks) readings.
+        self.__size = queue_size
+        self.__humidity = array('h', bytearray(2 * queue_size)) # tenths of %
+        self.__temperature = array('h', bytearray(2 * queue_size)) # tenths of degrees
+        self.__ticks = array('i', bytearray(4 * queue_size)) # ticks_ms of the read
+        self.__first = 0
+        self.__count = 0
+        # Statistics (ms for the jitter: how late a read started after its deadline)
+        self.__reads = 0
+        self.__errors = 0
+        self.__missed = 0
+        self.__dropped = 0
+        self.__late_last = 0
+        self.__late_max = 0
+        self.__late_sum = 0
+
+    def start(self):
+        """
+        start
+        Starts the sampling thread.  The first reading is taken right away.
+        """
+        self.__deadline = utime.ticks_ms()
+        self.__running = True
+        _thread.stack_size(SAMPLER_STACK_SIZE)
+        _thread.start_new_thread(self.__run, ())
+
+    def stop(self):
+        """
+        stop
+        Stops the sampling thread after its current iteration.
+        """
+        self.__running = False
+
+    def set_interval(self, interval_ms):
+        """
+        set_interval
+        Changes the interval.  Takes effect from the next deadline on.
+        """
+        self.__interval_ms = interval_ms
+
+    def __run(self):
+        while self.__running:
+            self.step()
+
+    def step(self):
+        """
+        step
+        Waits for the next deadline (first skipping the ones that are more
+        than half an interval gone), reads the sensor and queues the reading,
+        then moves the deadline on by one interval.
+        """
+        interval = self.__interval_ms
+        late = utime.ticks_diff(utime.ticks_ms(), self.__deadline)
+        if late > interval // 2:
+            skipped = (late + interval // 2) // interval
+            self.__missed += skipped
+            self.__deadline = utime.ticks_add(self.__deadline, skipped * interval)
+            late = utime.ticks_diff(utime.ticks_ms(), self.__deadline)
+        if late < 0:
+            utime.sleep_ms(-late)
+        now = utime.ticks_ms()
+        late = utime.ticks_diff(now, self.__deadline)
+        self.__late_last = late
+        self.__late_sum += late
+        self.__late_max = max(self.__late_max, late)
+        self.__reads += 1
+        result = self.__dht_sensor.read(self.__result)
+        if result.is_valid():
+            self.__put(result.humidity_tenths, result.temperature_tenths, now)
+        else:
+            self.__errors += 1
+        self.__deadline = utime.ticks_add(self.__deadline, interval)
+
+    def __put(self, humidity, temperature, ticks):
+        self.__lock.acquire()
+        if self.__count == self.__size:
+            self.__first = (self.__first + 1) % self.__size
+            self.__count -= 1
+            self.__dropped += 1
+        slot = (self.__first + self.__count) % self.__size
+        self.__humidity[slot] = humidity
+        self.__temperature[slot] = temperature
+        self.__ticks[slot] = ticks
+        self.__count += 1
+        self.__lock.release()
+
+    def pending(self):
+        """
+        pending
+        Returns the number of queued readings.
+        """
+        return self.__count
+
+    def pop(self, dht_result):
+        """
+        pop
+        Moves the oldest queued reading into dht_result (a DHTResult).
+        Returns the ticks_ms it was read at, or None if the queue is empty.
+        """
+        self.__lock.acquire()
+        if not self.__count:
+            self.__lock.release()
+            return None
+        slot = self.__first
+        dht_result.set(DHTResult.ERR_NO_ERROR, self.__temperature[slot], self.__humidity[slot])
+        ticks = self.__ticks[slot]
+        self.__first = (self.__first + 1) % self.__size
+        self.__count -= 1
+        self.__lock.release()
+        return ticks
+
+    def get_metrics(self):
+        """
+        get_metrics
+        Returns the sampling statistics as a dict: reads, read errors, missed
+        deadlines, readings dropped from the full queue, the queue length,
+        and how late reads started (last, max and mean, in ms).
+        """
+        return {
+            "interval_ms": self.__interval_ms,
+            "reads": self.__reads,
+            "errors": self.__errors,
+            "missed": self.__missed,
+            "dropped": self.__dropped,
+            "queued": self.__count,
+            "late_ms": self.__late_last,
+            "late_max_ms": self.__late_max,
+            "late_mean_ms": self.__late_sum // self.__reads if self.__reads else 0
+            }
@@ -1,77 +1,365 @@
-
 """
 sensor_cache.py
 A cache that holds sensor data until it is synced.
+
+Readings live in a fixed-size ring and are addressed by a monotonically
+increasing sequence number: the reading with seq n is stored in slot
+n % max_size.  Clients keep their own read position (seq) into the ring, so
+several clients can read the same readings without copying them.
+
+Each reading takes 14 bytes: humidity and temperature in tenths (the DHT22's
+resolution), its timestamp as a segment id + offset (see timebase.py), a
+repeat count, and the humidity and temperature its repeats were off by (see
+below).  SensorData objects are only created when a reading is read back.
+
+With deadband recording on (set_deadband), push_now only stores a reading when
+humidity or temperature moved more than the deadband from the newest stored
+one, or when the heartbeat interval has passed.  Otherwise the newest record's
+repeat count goes up: record n stands for 1 + repeats(n) readings, one per
+interval from its timestamp, all with its values.  The record also keeps how
+far the folded readings were off its values in total, so the sums (and
+raw_count()) are those of every raw reading: averages are those of the
+full-rate series, whatever the deadband.
+
+With event-anchored retention on (set_pinning), every event pins the records
+around it (pin), and a full ring moves pinned records it evicts into a
+fixed-budget PinnedReadings store (see pinned_readings.py) instead of
+dropping them.  Records released after a sync are dropped as before.
 """
+from uarray import array # pylint: disable=E0401
+from lib.uuid import generate_device_id
+from src.sensor_data import SensorData
+from src.timebase import Timebase
+from src.pinned_readings import PinnedReadings
 
 HUMIDITY_SWING_SIZE = 3 # number of items to consider delta increasing or decreasing
 MIN_HUMIDITY_CHANGE = 10
 
-class SensorCache: # pylint: disable=C1001
+class SensorCache: # pylint: disable=C1001,R0902,R0904
     """
     SensorCache
     Cache for sensor data.  Works like a stack.
     """
-    def __init__(self, max_size):
-        self.__max_size = max_size
-        self.__cache = []
+    def __init__(self, max_size, timebase=None):
+        self.__max_size = int(max_size)
+        self.__timebase = timebase or Timebase()
+        # Prefix for data ids, so ids stay unique across reboots.
+        self.__epoch_id = generate_device_id()
+        # Arrays are initialized from raw (zeroed) bytes: 2 bytes per item.
+        self.__segments = array('H', bytearray(2 * self.__max_size))
+        self.__offsets = array('H', bytearray(2 * self.__max_size))
+        self.__humidity = array('h', bytearray(2 * self.__max_size)) # tenths of %
+        self.__temperature = array('h', bytearray(2 * self.__max_size)) # tenths of degrees
+        self.__repeats = array('H', bytearray(2 * self.__max_size)) # readings folded into the item
+        # Sums of (reading - item value) over the folded readings, in tenths.
+        self.__humidity_folded = array('h', bytearray(2 * self.__max_size))
+        self.__temperature_folded = array('h', bytearray(2 * self.__max_size))
+        self.__humidity_sum = 0 # tenths, over every reading in the cache
+        self.__temperature_sum = 0
+        self.__raw_count = 0 # readings in the cache, counting repeats
+        self.__last_humidity = 0 # tenths, of the newest reading (stored or not)
+        self.__deadband = 0 # tenths
+        self.__heartbeat = 0 # seconds; 0 = store every reading
+        self.__first_seq = 0 # seq of the oldest reading in the cache
+        self.__next_seq = 0 # seq assigned to the next pushed reading
+        self.__pinned = None # PinnedReadings, with event-anchored retention on
+        self.__pin_before = 0 # records pinned before / after each event
+        self.__pin_after = 0
+        self.__evicted = 0 # records dropped because the ring was full
 
     def get_average_humidity(self):
         """
         get_average_humidity
         """
-        items = self.peek_n(self.length())
-        return sum(d.humidity for d in items) / self.length()
+        return self.__humidity_sum / (10 * self.__raw_count)
 
     def get_average_temperature(self):
         """
         get_average_temperature
         """
-        items = self.peek_n(self.length())
-        return sum(d.temperature for d in items) / self.length()
+        return self.__temperature_sum / (10 * self.__raw_count)
+
+    def last_humidity_tenths(self):
+        """
+        last_humidity_tenths
+        returns the humidity of the newest reading, in tenths of %
+        (even if deadband recording folded it into the newest item)
+        """
+        return self.__last_humidity
+
+    def humidity_sum_tenths(self):
+        """
+        humidity_sum_tenths
+        returns the sum of the humidity of every reading, in tenths of %
+        """
+        return self.__humidity_sum
+
+    def raw_count(self):
+        """
+        raw_count
+        returns the number of readings in the cache, counting repeats
+        """
+        return self.__raw_count
+
+    def set_deadband(self, deadband_tenths, heartbeat):
+        """
+        set_deadband
+        Turns on deadband recording (see the module docstring): a reading is
+        only stored if humidity or temperature moved more than deadband_tenths,
+        or heartbeat seconds passed since the newest stored one.  A heartbeat
+        of 0 turns it off.
+        """
+        self.__deadband = deadband_tenths
+        self.__heartbeat = heartbeat
+
+    def set_pinning(self, before, after, budget):
+        """
+        set_pinning
+        Turns on event-anchored retention: pin() keeps the `before` records
+        before and `after` records after the newest one, up to `budget`
+        records in total.  A budget of 0 turns it off (and frees the pinned
+        records).  Returns false if there is not enough memory for the budget.
+        """
+        self.__pin_before = before
+        self.__pin_after = after
+        if not budget or not before + after:
+            self.__pinned = None
+            return True
+        if self.__pinned:
+            return self.__pinned.resize(budget)
+        try:
+            self.__pinned = PinnedReadings(budget, self.__timebase)
+        except MemoryError:
+            print('Not enough memory to pin', budget, 'readings')
+            return False
+        return True
+
+    def pin(self):
+        """
+        pin
+        Pins the records around the newest one (the reading an event fired
+        on), so they outlive the ring.  Does nothing with retention off.
+        """
+        if self.__pinned:
+            newest = self.__next_seq - 1
+            self.__pinned.pin(newest - self.__pin_before, newest + 1 + self.__pin_after)
+
+    def pinned(self):
+        """
+        pinned
+        returns the PinnedReadings (None with event-anchored retention off)
+        """
+        return self.__pinned
+
+    def evicted(self):
+        """
+        evicted
+        returns the number of records dropped because the cache was full
+        (pinned ones included)
+        """
+        return self.__evicted
 
     def length(self):
         """
         length
         returns number of items in cache
         """
-        return len(self.__cache)
+        return self.__next_seq - self.__first_seq
+
+    def first_seq(self):
+        """
+        first_seq
+        returns the seq of the oldest item in the cache
+        """
+        return self.__first_seq
+
+    def next_seq(self):
+        """
+        next_seq
+        returns the seq that the next pushed item will get
+        """
+        return self.__next_seq
+
+    def epoch_id(self):
+        """
+        epoch_id
+        returns the per-boot prefix of data ids (data_id = epoch_id-seq)
+        """
+        return self.__epoch_id
 
     def push(self, sensor_data):
         """
         push
         adds an item to the cache
         """
-        if len(self.__cache) == self.__max_size:
-            self.deque()
-        self.__cache.append(sensor_data)
+        segment, offset = self.__timebase.encode(sensor_data.timestamp)
+        self.__last_humidity = int(round(sensor_data.humidity * 10))
+        self.__store(self.__last_humidity,
+                     int(round(sensor_data.temperature * 10)),
+                     segment, offset)
+
+    def push_now(self, humidity_tenths, temperature_tenths, ticks=None):
+        """
+        push_now
+        adds a reading (in tenths) taken now, or at the given ticks_ms.  Does
+        not allocate.  Returns false if deadband recording folded it into the
+        newest item.
+        """
+        timebase = self.__timebase
+        timebase.stamp(ticks)
+        self.__last_humidity = humidity_tenths
+        if self.__heartbeat and self.__next_seq > self.__first_seq \
+                and self.__fold(humidity_tenths, temperature_tenths):
+            return False
+        self.__store(humidity_tenths, temperature_tenths, timebase.segment_id, timebase.offset)
+        return True
+
+    def __fold(self, humidity, temperature):
+        """
+        __fold
+        Folds a reading taken at the timebase's stamp into the newest item, if
+        it is within the deadband of its values and the heartbeat of its time,
+        and the item's counters have room.  Returns false otherwise.
+        """
+        slot = (self.__next_seq - 1) % self.__max_size
+        deadband = self.__deadband
+        humidity_off = humidity - self.__humidity[slot]
+        temperature_off = temperature - self.__temperature[slot]
+        if humidity_off < -deadband or humidity_off > deadband \
+                or temperature_off < -deadband or temperature_off > deadband:
+            return False
+        timebase = self.__timebase
+        if self.__segments[slot] != timebase.segment_id \
+                or timebase.offset - self.__offsets[slot] >= self.__heartbeat \
+                or self.__repeats[slot] == 0xFFFF:
+            return False
+        humidity_off += self.__humidity_folded[slot]
+        temperature_off += self.__temperature_folded[slot]
+        if not -0x8000 <= humidity_off <= 0x7FFF or not -0x8000 <= temperature_off <= 0x7FFF:
+            return False
+        self.__repeats[slot] += 1
+        self.__humidity_folded[slot] = humidity_off
+        self.__temperature_folded[slot] = temperature_off
+        self.__humidity_sum += humidity
+        self.__temperature_sum += temperature
+        self.__raw_count += 1
+        return True
+
+    def __store(self, humidity, temperature, segment, offset):
+        if self.length() == self.__max_size:
+            self.__evict_oldest()
+        slot = self.__next_seq % self.__max_size
+        self.__segments[slot] = segment
+        self.__offsets[slot] = offset
+        self.__humidity[slot] = humidity
+        self.__temperature[slot] = temperature
+        self.__repeats[slot] = 0
+        self.__humidity_folded[slot] = 0
+        self.__temperature_folded[slot] = 0
+        self.__humidity_sum += humidity
+        self.__temperature_sum += temperature
+        self.__raw_count += 1
+        self.__next_seq += 1
+
+    def get(self, seq):
+        """
+        get
+        returns the item with the given seq, or None if it is not in the cache.
+        """
+        if not self.__first_seq <= seq < self.__next_seq:
+            return None
+        slot = seq % self.__max_size
+        return SensorData(
+            self.__humidity[slot] / 10,
+            self.__temperature[slot] / 10,
+            timestamp=self.__timebase.to_wall(self.__segments[slot], self.__offsets[slot]),
+            data_id=self.__epoch_id + '-' + str(seq))
+
+    def timestamp(self, seq):
+        """
+        timestamp
+        returns the timestamp of the item with the given seq (None if its
+        segment has been pruned, or it is not in the cache).
+        """
+        if not self.__first_seq <= seq < self.__next_seq:
+            return None
+        slot = seq % self.__max_size
+        return self.__timebase.to_wall(self.__segments[slot], self.__offsets[slot])
+
+    def humidity_tenths(self, seq):
+        """
+        humidity_tenths
+        returns the humidity of the item with the given seq, in tenths of %
+        """
+        return self.__humidity[seq % self.__max_size]
+
+    def temperature_tenths(self, seq):
+        """
+        temperature_tenths
+        returns the temperature of the item with the given seq, in tenths of degrees
+        """
+        return self.__temperature[seq % self.__max_size]
+
+    def repeats(self, seq):
+        """
+        repeats
+        returns how many later readings were folded into the item with the given seq
+        """
+        return self.__repeats[seq % self.__max_size]
+
+    def find_time(self, timestamp):
+        """
+        find_time
+        returns the seq of the oldest item taken at or after timestamp (or
+        next_seq if none), by binary search: readings are stored in time order.
+        """
+        low = self.__first_seq
+        high = self.__next_seq
+        while low < high:
+            mid = (low + high) // 2
+            mid_time = self.timestamp(mid)
+            if mid_time is None or mid_time < timestamp:
+                low = mid + 1
+            else:
+                high = mid
+        return low
 
     def peek(self, index=-1):
         """
         peek
         returns the top of the stack without removing it.
         """
-        if self.__cache:
-            return self.__cache[index]
-        return None
+        if not self.length():
+            return None
+        if index < 0:
+            return self.get(self.__next_seq + index)
+        return self.get(self.__first_seq + index)
 
     def peek_n(self, n=1): # pylint: disable=C0103
         """
         peek_n
         returns n items from top of stack without removing.
         """
-        if self.__cache:
-            return self.__cache[-1 * n:]
-        return []
+        start = max(self.__next_seq - n, self.__first_seq)
+        return [self.get(seq) for seq in range(start, self.__next_seq)]
 
     def pop(self, index=None):
         """
         deque
-        removes and returns the top of the stack (or the item at specified index)
+        removes and returns the top of the stack (or the oldest item if index is 0)
         """
-        if self.__cache:
-            return self.__cache.pop(index)
-        return None
+        if not self.length():
+            return None
+        if index == 0:
+            item = self.get(self.__first_seq)
+            self.__drop_oldest()
+        else:
+            item = self.get(self.__next_seq - 1)
+            self.__next_seq -= 1
+            self.__subtract(self.__next_seq % self.__max_size)
+            if self.length():
+                self.__last_humidity = self.__humidity[(self.__next_seq - 1) % self.__max_size]
+        return item
 
     def deque(self):
         """
@@ -80,11 +368,95 @@ class SensorCache: # pylint: disable=C1001
         """
         return self.pop(0)
 
+    def release_before(self, seq):
+        """
+        release_before
+        removes every item older than seq
+        """
+        while self.__first_seq < seq and self.length():
+            self.__drop_oldest()
+
+    def max_size(self):
+        """
+        max_size
+        returns the number of items the cache can hold
+        """
+        return self.__max_size
+
+    def resize(self, max_size):
+        """
+        resize
+        Changes the capacity.  Items keep their seq; when shrinking, the oldest
+        items that no longer fit are dropped.  Returns false (and keeps the
+        current capacity) if there is not enough memory for the new arrays.
+        """
+        max_size = int(max_size)
+        if max_size == self.__max_size:
+            return True
+        try:
+            segments = array('H', bytearray(2 * max_size))
+            offsets = array('H', bytearray(2 * max_size))
+            humidity = array('h', bytearray(2 * max_size))
+            temperature = array('h', bytearray(2 * max_size))
+            repeats = array('H', bytearray(2 * max_size))
+            humidity_folded = array('h', bytearray(2 * max_size))
+            temperature_folded = array('h', bytearray(2 * max_size))
+        except MemoryError:
+            print('Not enough memory to resize sensor cache to', max_size)
+            return False
+        while self.length() > max_size:
+            self.__evict_oldest()
+        for seq in range(self.__first_seq, self.__next_seq):
+            old_slot = seq % self.__max_size
+            new_slot = seq % max_size
+            segments[new_slot] = self.__segments[old_slot]
+            offsets[new_slot] = self.__offsets[old_slot]
+            humidity[new_slot] = self.__humidity[old_slot]
+            temperature[new_slot] = self.__temperature[old_slot]
+            repeats[new_slot] = self.__repeats[old_slot]
+            humidity_folded[new_slot] = self.__humidity_folded[old_slot]
+            temperature_folded[new_slot] = self.__temperature_folded[old_slot]
+        self.__segments = segments
+        self.__offsets = offsets
+        self.__humidity = humidity
+        self.__temperature = temperature
+        self.__repeats = repeats
+        self.__humidity_folded = humidity_folded
+        self.__temperature_folded = temperature_folded
+        self.__max_size = max_size
+        return True
+
+    def __evict_oldest(self):
+        # Dropping unsynced data to make room: keep it if an event pinned it.
+        self.__evicted += 1
+        pinned = self.__pinned
+        if pinned and pinned.is_pinned(self.__first_seq):
+            slot = self.__first_seq % self.__max_size
+            pinned.keep(self.__first_seq, self.__segments[slot], self.__offsets[slot],
+                        self.__humidity[slot], self.__temperature[slot], self.__repeats[slot])
+        self.__drop_oldest()
+
+    def __drop_oldest(self):
+        self.__subtract(self.__first_seq % self.__max_size)
+        self.__first_seq += 1
+        # Segments older than the oldest (pinned) reading are no longer needed.
+        if self.__pinned and self.__pinned.length():
+            self.__timebase.prune(self.__pinned.first_segment())
+        elif self.length():
+            self.__timebase.prune(self.__segments[self.__first_seq % self.__max_size])
+
+    def __subtract(self, slot):
+        count = 1 + self.__repeats[slot]
+        self.__humidity_sum -= self.__humidity[slot] * count + self.__humidity_folded[slot]
+        self.__temperature_sum -= self.__temperature[slot] * count + self.__temperature_folded[slot]
+        self.__raw_count -= count
+
 def calculate_cache_size(duration, interval):
     """
     calculate_cache_size
     Calculates the necessary size for cache based on interval and number of days
     duration = number of days
     interval = number of seconds between updates.
+    Returns a whole number of items (CapacityPlanner decides what fits).
     """
-    return (60 / interval) * 60 * 24 * duration
+    return int(86400 * duration / interval + 0.5)
@@ -4,17 +4,16 @@ SensorData
 Class containing humidity/temp data from sensor reading
 """
 
-import time
-import uuid
+from lib.helpers import current_timestamp
 
 class SensorData: # pylint: disable=C1001, R0903
     """
     SensorData
     Represents a sensor reading
     """
-    def __init__(self, humidity, temperature):
-        self.data_id = str(uuid.uuid4())
-        self.timestamp = time.time()
+    def __init__(self, humidity, temperature, timestamp=None, data_id=''):
+        self.data_id = data_id
+        self.timestamp = current_timestamp() if timestamp is None else timestamp
         self.humidity = humidity
         self.temperature = temperature
 
@@ -0,0 +1,163 @@
+"""
+socket_server.py
+Serves the sync protocol (see sync_protocol.py) over TCP, for bench rigs and
+installations with WiFi.
+
+One request or reply per line:
+* client -> device: "R <name>" reads an operation, "W <name> <value>" writes one.
+* device -> client: "= <value>" answers a read, "=" a write, "! <error>" a bad
+  request; "* <name> <value>" is a notification (event_notif).
+
+Replies come back in request order, so a client can keep many requests in
+flight; the replies to every request in one packet go out in one send.
+Each connection has its own SyncSession, and batched data reads are capped at
+TCP_MAX_BYTES instead of the 512 bytes of a BLE attribute.
+"""
+import usocket # pylint: disable=E0401
+import uselect # pylint: disable=E0401
+from src.sync_protocol import SyncSession, OP_EVENT_NOTIF
+
+SYNC_TCP_PORT = 8266
+TCP_MAX_BYTES = 4096 # bytes of rows per batched data read (SyncSession.max_bytes)
+MAX_CLIENTS = 4
+RECV_SIZE = 1024
+MAX_LINE = 1024 # longest request line accepted
+SEND_TIMEOUT = 5 # seconds a client may stall a reply before it is dropped
+
+class SocketServer: # pylint: disable=C1001
+    """
+    SocketServer
+    Non-blocking TCP server; poll() serves whatever is ready.
+    """
+    def __init__(self, protocol, port=SYNC_TCP_PORT, max_clients=MAX_CLIENTS):
+        self.__protocol = protocol
+        self.__max_clients = max_clients
+        self.__clients = {} # socket -> [session, unparsed bytes]
+        self.__listener = usocket.socket(usocket.AF_INET, usocket.SOCK_STREAM)
+        self.__listener.setsockopt(usocket.SOL_SOCKET, usocket.SO_REUSEADDR, 1)
+        self.__listener.bind(usocket.getaddrinfo('0.0.0.0', port)[0][-1])
+        self.__listener.listen(max_clients)
+        self.__listener.setblocking(False)
+        self.__poller = uselect.poll()
+        self.__poller.register(self.__listener, uselect.POLLIN)
+
+    def client_count(self):
+        """
+        client_count
+        Returns the number of connected clients.
+        """
+        return len(self.__clients)
+
+    def poll(self, timeout_ms=0):
+        """
+        poll
+        Accepts connections and answers requests that arrive within
+        timeout_ms.  Returns after the first batch of ready sockets.
+        """
+        for entry in self.__poller.poll(timeout_ms):
+            sock, events = entry[0], entry[1]
+            if sock is self.__listener:
+                self.__accept()
+            elif events & (uselect.POLLHUP | uselect.POLLERR):
+                self.__close(sock)
+            else:
+                self.__receive(sock)
+
+    def send_notification(self, payload, client_id):
+        """
+        send_notification
+        Sends payload as an event_notif notification to the connections of
+        client_id (whose session says they are that client's).
+        """
+        line = ('* ' + OP_EVENT_NOTIF + ' ' + payload + '\n').encode()
+        for sock, client in list(self.__clients.items()):
+            if client[0].client_id == client_id:
+                self.__send(sock, line)
+
+    def close(self):
+        """
+        close
+        Disconnects every client and stops listening.
+        """
+        for sock in list(self.__clients):
+            self.__close(sock)
+        self.__poller.unregister(self.__listener)
+        self.__listener.close()
+
+    def __accept(self):
+        try:
+            sock, addr = self.__listener.accept()
+        except OSError:
+            return
+        if len(self.__clients) >= self.__max_clients:
+            sock.close()
+            return
+        print('TCP client connected: ', addr)
+        sock.settimeout(SEND_TIMEOUT)
+        session = SyncSession(TCP_MAX_BYTES)
+        self.__clients[sock] = [session, b'']
+        self.__poller.register(sock, uselect.POLLIN)
+        self.__protocol.on_connected(session)
+
+    def __receive(self, sock):
+        try:
+            data = sock.recv(RECV_SIZE)
+        except OSError:
+            data = None
+        if not data:
+            self.__close(sock)
+            return
+        client = self.__clients[sock]
+        buf = client[1] + data
+        replies = []
+        start = 0
+        end = buf.find(b'\n')
+        while end >= 0:
+            replies.append(self.__handle(client[0], buf[start:end]))
+            start = end + 1
+            end = buf.find(b'\n', start)
+        client[1] = buf[start:]
+        if len(client[1]) > MAX_LINE:
+            self.__close(sock)
+            return
+        if replies:
+            self.__send(sock, ('\n'.join(replies) + '\n').encode())
+
+    def __handle(self, session, line):
+        """
+        __handle
+        Runs one request line (bytes).  Returns the reply line (without
+        newline).  A line that is not UTF-8, or whose handler raises, gets an
+        error reply: a bad request must not stop poll(), which the main loop
+        runs.
+        """
+        try:
+            parts = line.decode().rstrip('\r').split(' ', 2)
+            if parts[0] == 'R' and len(parts) == 2:
+                value = self.__protocol.read(session, parts[1])
+                if value is not None:
+                    return '= ' + value
+            elif parts[0] == 'W' and len(parts) >= 2:
+                self.__protocol.write(session, parts[1], parts[2] if len(parts) == 3 else '')
+                return '='
+        except (ValueError, IndexError) as err: # UnicodeError is a ValueError
+            return '! ' + str(err)
+        except Exception as err: # pylint: disable=W0703
+            print('TCP request failed', err)
+            return '! ' + str(err)
+        return '! bad request'
+
+    def __send(self, sock, data):
+        try:
+            sock.sendall(data)
+        except OSError:
+            self.__close(sock)
+
+    def __close(self, sock):
+        client = self.__clients.pop(sock, None)
+        if client is None:
+            return
+        self.__poller.unregister(sock)
+        sock.close()
+        print('TCP client disconnected')
+        self.__protocol.on_disconnected(client[0])
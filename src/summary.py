@@ -0,0 +1,153 @@
+"""
+summary.py
+Hourly humidity/temperature aggregates for the summary characteristic.
+
+Every reading updates the min/max/sum/count of the current hour's bucket, so
+keeping the aggregates up to date is O(1) and allocation-free, and building a
+summary is O(buckets).  Buckets form a ring of one week of hours, aligned to
+when the device started counting (ticks_ms), not to wall-clock hours.
+"""
+from uarray import array # pylint: disable=E0401
+import utime # pylint: disable=E0401
+
+HOUR_MS = 3600000
+NUM_BUCKETS = 168 # one week of hours
+DAY_BUCKETS = 24
+TREND_BUCKETS = 6 # hours the trend is fitted over
+PAGE_BUCKETS = 12 # hourly buckets per summary read (keeps it under 512 bytes)
+
+class HourlyStats: # pylint: disable=C1001,R0902
+    """
+    HourlyStats
+    Ring of hourly buckets; bucket 0 is the current hour, bucket i the hour
+    that ended i - 1 hours ago.  Values are in tenths, like the SensorCache.
+    """
+    def __init__(self):
+        self.__h_min = array('h', bytearray(2 * NUM_BUCKETS))
+        self.__h_max = array('h', bytearray(2 * NUM_BUCKETS))
+        self.__h_sum = array('i', bytearray(4 * NUM_BUCKETS))
+        self.__t_min = array('h', bytearray(2 * NUM_BUCKETS))
+        self.__t_max = array('h', bytearray(2 * NUM_BUCKETS))
+        self.__t_sum = array('i', bytearray(4 * NUM_BUCKETS))
+        self.__count = array('H', bytearray(2 * NUM_BUCKETS))
+        self.__current = 0 # slot of the current hour
+        self.__hours = 0 # completed hours held by the ring
+        self.__start_ticks = utime.ticks_ms() # start of the current hour
+
+    def add(self, humidity_tenths, temperature_tenths):
+        """
+        add
+        Adds a reading to the current hour.  O(1), does not allocate.
+        """
+        self.__roll()
+        slot = self.__current
+        if self.__count[slot]:
+            if humidity_tenths < self.__h_min[slot]:
+                self.__h_min[slot] = humidity_tenths
+            if humidity_tenths > self.__h_max[slot]:
+                self.__h_max[slot] = humidity_tenths
+            if temperature_tenths < self.__t_min[slot]:
+                self.__t_min[slot] = temperature_tenths
+            if temperature_tenths > self.__t_max[slot]:
+                self.__t_max[slot] = temperature_tenths
+        else:
+            self.__h_min[slot] = self.__h_max[slot] = humidity_tenths
+            self.__t_min[slot] = self.__t_max[slot] = temperature_tenths
+        self.__h_sum[slot] += humidity_tenths
+        self.__t_sum[slot] += temperature_tenths
+        self.__count[slot] += 1
+
+    def aggregate(self, num_buckets):
+        """
+        aggregate
+        Returns {"h": [min, max, mean], "t": [min, max, mean], "n": count}
+        over the newest num_buckets hours (values in tenths), or None if
+        there are no readings.
+        """
+        self.__roll()
+        count = h_sum = t_sum = 0
+        h_min = t_min = 32767
+        h_max = t_max = -32768
+        for age in range(min(num_buckets, self.__hours + 1)):
+            slot = (self.__current - age) % NUM_BUCKETS
+            if not self.__count[slot]:
+                continue
+            count += self.__count[slot]
+            h_sum += self.__h_sum[slot]
+            t_sum += self.__t_sum[slot]
+            h_min = min(h_min, self.__h_min[slot])
+            h_max = max(h_max, self.__h_max[slot])
+            t_min = min(t_min, self.__t_min[slot])
+            t_max = max(t_max, self.__t_max[slot])
+        if not count:
+            return None
+        return {
+            "h": [h_min, h_max, (h_sum + count // 2) // count],
+            "t": [t_min, t_max, (t_sum + count // 2) // count],
+            "n": count
+        }
+
+    def hours(self, first_age, num_buckets):
+        """
+        hours
+        Returns [[min, max, mean] humidity, ...] for the hours first_age ..
+        first_age + num_buckets - 1 ago (newest first); empty hours are [].
+        """
+        self.__roll()
+        result = []
+        for age in range(first_age, min(first_age + num_buckets, self.__hours + 1)):
+            slot = (self.__current - age) % NUM_BUCKETS
+            count = self.__count[slot]
+            if count:
+                result.append([self.__h_min[slot], self.__h_max[slot],
+                               (self.__h_sum[slot] + count // 2) // count])
+            else:
+                result.append([])
+        return result
+
+    def trend(self):
+        """
+        trend
+        Least-squares slope of the hourly mean humidity over the last
+        TREND_BUCKETS hours, in tenths of % per hour (0 with < 2 hours).
+        """
+        self.__roll()
+        points = []
+        for age in range(min(TREND_BUCKETS, self.__hours + 1)):
+            slot = (self.__current - age) % NUM_BUCKETS
+            if self.__count[slot]:
+                points.append((-age, self.__h_sum[slot] / self.__count[slot]))
+        if len(points) < 2:
+            return 0
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        var_x = sum((x - mean_x) ** 2 for x, _ in points)
+        cov = sum((x - mean_x) * (y - mean_y) for x, y in points)
+        return int(round(cov / var_x))
+
+    def hour_age_seconds(self):
+        """
+        hour_age_seconds
+        Returns how many seconds ago the current hour's bucket started.
+        """
+        return utime.ticks_diff(utime.ticks_ms(), self.__start_ticks) // 1000
+
+    def __roll(self):
+        """
+        __roll
+        Starts new buckets for every hour that has passed.
+        """
+        elapsed = utime.ticks_diff(utime.ticks_ms(), self.__start_ticks)
+        skipped = 0
+        while elapsed >= HOUR_MS:
+            self.__current = (self.__current + 1) % NUM_BUCKETS
+            if skipped < NUM_BUCKETS:
+                slot = self.__current
+                self.__count[slot] = 0
+                self.__h_sum[slot] = 0
+                self.__t_sum[slot] = 0
+                skipped += 1
+            if self.__hours < NUM_BUCKETS - 1:
+                self.__hours += 1
+            self.__start_ticks = utime.ticks_add(self.__start_ticks, HOUR_MS)
+            elapsed -= HOUR_MS
@@ -0,0 +1,178 @@
+"""
+sync_cursors.py
+Per-client read positions into the shared sensor data and event caches.
+"""
+import uio # pylint: disable=F0401
+import ujson # pylint: disable=F0401
+
+# Path to json file where the cursors are stored (next to device-info.json)
+SYNC_CURSORS_PATH = '/flash/sync-cursors.json'
+# Cursors are written to flash after this many unsaved acks.
+SAVE_EVERY_N_ACKS = 10
+DATA_CURSOR = 0
+EVENT_CURSOR = 1
+ACKED = 2 # cursor[ACKED + kind] is the acked position of that kind
+
+class SyncCursors: # pylint: disable=C1001
+    """
+    SyncCursors
+    Tracks, for every paired client, two positions in the data and in the
+    event cache:
+    * read: the seq of the next item its reads return,
+    * acked: the seq of the first item it has not acked (data_ack=,
+      event_ack=) yet.
+    Reads only move the read position.  Items older than every paired
+    client's acked position have been received by everyone and can be
+    released from the caches; until then a reply lost on the way is read
+    again after rewind() (a client identifying itself moves its read
+    positions back to the acked ones).
+
+    Reads and acks from a client that has not identified itself use an
+    anonymous cursor, which only releases items while no client is paired.
+
+    The acked positions are stored on flash, as {"<client_id>": [data_seq,
+    event_seq], ...}; after a reboot, reading resumes from them.
+    """
+    def __init__(self, path=None):
+        self.__path = path
+        self.__cursors = {} # client_id -> [data read, event read, data acked, event acked]
+        self.__anonymous = [0, 0, 0, 0]
+        self.__unsaved_acks = 0
+        if path:
+            self.__load()
+
+    def update_client_ids(self, client_ids, data_seq, event_seq):
+        """
+        update_client_ids
+        Adds cursors for newly paired clients (starting at the given seqs),
+        and drops cursors of clients that are no longer paired.
+        """
+        changed = False
+        for client_id in client_ids:
+            if client_id not in self.__cursors:
+                self.__cursors[client_id] = [data_seq, event_seq, data_seq, event_seq]
+                changed = True
+        for client_id in list(self.__cursors):
+            if client_id not in client_ids:
+                del self.__cursors[client_id]
+                changed = True
+        if changed:
+            self.save()
+
+    def has_client(self, client_id):
+        """
+        has_client
+        Returns true if there is a cursor for the given client.
+        """
+        return client_id in self.__cursors
+
+    def get(self, client_id, kind):
+        """
+        get
+        Returns the data (kind=DATA_CURSOR) or event (kind=EVENT_CURSOR)
+        read position of the given client.
+        """
+        return self.__cursor(client_id)[kind]
+
+    def acked(self, client_id, kind):
+        """
+        acked
+        Returns the data or event acked position of the given client.
+        """
+        return self.__cursor(client_id)[ACKED + kind]
+
+    def advance(self, client_id, kind, seq):
+        """
+        advance
+        Moves a client's read position to seq.
+        """
+        self.__cursor(client_id)[kind] = seq
+
+    def ack(self, client_id, kind, seq):
+        """
+        ack
+        Records that a client received every item before seq.  Acked
+        positions only move forward, and the read position is kept at or
+        past the acked one.  Returns true if the acked position moved.
+        """
+        cursor = self.__cursor(client_id)
+        if seq <= cursor[ACKED + kind]:
+            return False
+        cursor[ACKED + kind] = seq
+        cursor[kind] = max(cursor[kind], seq)
+        if client_id in self.__cursors:
+            self.__unsaved_acks += 1
+            if self.__unsaved_acks >= SAVE_EVERY_N_ACKS:
+                self.save()
+        return True
+
+    def rewind(self, client_id):
+        """
+        rewind
+        Moves a client's read positions back to its acked ones, so the items
+        it read but did not ack are read again.
+        """
+        cursor = self.__cursor(client_id)
+        cursor[DATA_CURSOR] = cursor[ACKED + DATA_CURSOR]
+        cursor[EVENT_CURSOR] = cursor[ACKED + EVENT_CURSOR]
+
+    def clamp(self, kind, first_seq, next_seq):
+        """
+        clamp
+        Keeps every read and acked position of the given kind within
+        [first_seq, next_seq].
+        """
+        for cursor in list(self.__cursors.values()) + [self.__anonymous]:
+            cursor[kind] = min(max(cursor[kind], first_seq), next_seq)
+            cursor[ACKED + kind] = min(max(cursor[ACKED + kind], first_seq), next_seq)
+
+    def min_seq(self, kind):
+        """
+        min_seq
+        Returns the lowest acked position of the given kind across paired
+        clients: every item before it can be released.
+        """
+        if not self.__cursors:
+            return self.__anonymous[ACKED + kind]
+        return min(cursor[ACKED + kind] for cursor in self.__cursors.values())
+
+    def save(self):
+        """
+        save
+        Writes the acked positions to flash.
+        """
+        if not self.__path:
+            return
+        acked = {}
+        for client_id, cursor in self.__cursors.items():
+            acked[client_id] = cursor[ACKED:]
+        try:
+            with uio.open(self.__path, mode='w') as outfile:
+                outfile.write(ujson.dumps(acked))
+            outfile.close()
+            self.__unsaved_acks = 0
+        except OSError as err:
+            print('Could not write sync cursors file', err)
+
+    def flush(self):
+        """
+        flush
+        Writes the cursors to flash if any acks have not been saved yet.
+        """
+        if self.__unsaved_acks:
+            self.save()
+
+    def __cursor(self, client_id):
+        return self.__cursors.get(client_id) or self.__anonymous
+
+    def __load(self):
+        try:
+            with uio.open(self.__path, mode='r') as infile:
+                acked = ujson.loads(infile.read())
+            infile.close()
+            for client_id, seqs in acked.items():
+                self.__cursors[client_id] = [seqs[0], seqs[1], seqs[0], seqs[1]]
+        except (ValueError, IndexError) as err:
+            print("Could not parse sync cursors file JSON", err)
+        except OSError:
+            pass # No cursors saved yet.
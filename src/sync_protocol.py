@@ -0,0 +1,199 @@
+"""
+sync_protocol.py
+The sync protocol, independent of the transport it runs over.
+
+Clients talk to the device through named operations, the same names as the
+BLE characteristics: writes to setup, pair, unpair and event_clear, and reads
+of data, event, diag, summary and query.  Event notifications go out on
+event_notif.  BluetoothServer maps GATT characteristics onto these
+operations, SocketServer maps lines on a TCP connection onto them.
+
+Everything that belongs to one connection (the client reading data/events,
+its batch size, summary page and query) lives in a SyncSession, so several
+connections can be served at the same time.
+"""
+from lib.helpers import current_timestamp
+
+EVENT_CLEAR_PREFIX = 'event_cleared='
+TIME_SETUP_PREFIX = 'setup_time='
+NOTIFY_ACK_PREFIX = 'notify_ack='
+SYNC_CLIENT_PREFIX = 'sync_client='
+SYNC_BATCH_PREFIX = 'sync_batch='
+CONFIG_PREFIX = 'setup_config='
+SUMMARY_PAGE_PREFIX = 'summary_page='
+QUERY_PREFIX = 'query_range='
+EXPORT_PREFIX = 'export='
+DIAG_SECTION_PREFIX = 'diag_section='
+DATA_ACK_PREFIX = 'data_ack='
+EVENT_ACK_PREFIX = 'event_ack='
+
+# Operation names
+OP_SETUP = 'setup'
+OP_PAIR = 'pair'
+OP_UNPAIR = 'unpair'
+OP_DATA = 'data'
+OP_EVENT = 'event'
+OP_EVENT_NOTIF = 'event_notif'
+OP_EVENT_CLEAR = 'event_clear'
+OP_DIAG = 'diag'
+OP_SUMMARY = 'summary'
+OP_QUERY = 'query'
+
+class SyncSession: # pylint: disable=C1001,R0902,R0903
+    """
+    SyncSession
+    Per-connection protocol state.  max_bytes caps the rows of a batched read
+    (a BLE attribute holds at most 512 bytes; a TCP line has no such limit).
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.client_id = None # client reading data/events right now
+        self.batch = 1 # max data points per read
+        self.summary_page = 0 # page of hourly buckets the summary read returns
+        self.query_seq = 0 # next seq the query read returns
+        self.query_end = 0 # seq after the last one the query matches
+        self.pinned_seq = 0 # next pinned seq the query read returns
+        self.pinned_end = 0 # pinned seq after the last one the query matches
+        self.diag_section = None # section the diag read returns; None = all
+
+class SyncProtocol: # pylint: disable=C1001,R0902
+    """
+    SyncProtocol
+    Dispatches reads and writes of the protocol operations to the device.
+    Callbacks that depend on the connection get its SyncSession first.
+    """
+    def __init__(self, # pylint: disable=R0913,R0914
+                 on_client_paired=None,
+                 on_client_unpaired=None,
+                 get_next_data_item=None,
+                 get_next_event_item=None,
+                 clear_event=None,
+                 on_client_connected=None,
+                 on_client_disconnected=None,
+                 on_notification_ack=None,
+                 get_diagnostics=None,
+                 on_sync_client=None,
+                 set_time=None,
+                 on_sync_batch=None,
+                 on_config=None,
+                 get_summary=None,
+                 on_summary_page=None,
+                 on_query=None,
+                 get_query_data=None,
+                 on_export=None,
+                 on_diag_section=None,
+                 on_data_ack=None,
+                 on_event_ack=None):
+        self.__on_client_paired = on_client_paired
+        self.__on_client_unpaired = on_client_unpaired
+        self.__get_next_data_item = get_next_data_item
+        self.__get_next_event_item = get_next_event_item
+        self.__clear_event = clear_event
+        self.__on_client_connected = on_client_connected
+        self.__on_client_disconnected = on_client_disconnected
+        self.__on_notification_ack = on_notification_ack
+        self.__get_diagnostics = get_diagnostics
+        self.__on_sync_client = on_sync_client
+        self.__set_time = set_time
+        self.__on_sync_batch = on_sync_batch
+        self.__on_config = on_config
+        self.__get_summary = get_summary
+        self.__on_summary_page = on_summary_page
+        self.__on_query = on_query
+        self.__get_query_data = get_query_data
+        self.__on_export = on_export
+        self.__on_diag_section = on_diag_section
+        self.__on_data_ack = on_data_ack
+        self.__on_event_ack = on_event_ack
+
+    def on_connected(self, session):
+        """
+        on_connected
+        Called by a transport when a client connects.
+        """
+        self.__on_client_connected(session)
+
+    def on_disconnected(self, session):
+        """
+        on_disconnected
+        Called by a transport when a client disconnects.
+        """
+        self.__on_client_disconnected(session)
+
+    def read(self, session, name):
+        """
+        read
+        Handles a read of the named operation.  Returns the value as a string,
+        or None if name is not a readable operation.
+        """
+        if name == OP_DATA:
+            return self.__get_next_data_item(session)
+        if name == OP_EVENT:
+            return self.__get_next_event_item(session)
+        if name == OP_DIAG:
+            return self.__get_diagnostics(session)
+        if name == OP_SUMMARY:
+            return self.__get_summary(session)
+        if name == OP_QUERY:
+            return self.__get_query_data(session)
+        return None
+
+    def write(self, session, name, data):
+        """
+        write
+        Handles a write of data (a string) to the named operation.
+        """
+        if name == OP_SETUP:
+            self.__setup(session, data)
+        elif name == OP_PAIR:
+            # Expected data is the unique "client id" from the app.
+            self.__on_client_paired(session, data)
+            print("pair_write: ", data)
+        elif name == OP_UNPAIR:
+            self.__on_client_unpaired(session, data)
+            print("unpair_write: ", data)
+        elif name == OP_EVENT_CLEAR:
+            if EVENT_CLEAR_PREFIX in data:
+                self.__clear_event(data.replace(EVENT_CLEAR_PREFIX, "", 1))
+
+    def __setup(self, session, data):
+        """
+        __setup
+        Setup device
+        """
+        print("setup_write: ", data)
+        if TIME_SETUP_PREFIX in data:
+            time_vals = data.replace(TIME_SETUP_PREFIX, "", 1)
+            time_vals = [int(x) for x in time_vals.split(",")]
+            self.__set_time((time_vals[0],
+                             time_vals[1],
+                             time_vals[2],
+                             time_vals[3],
+                             time_vals[4],
+                             time_vals[5]))
+            print("Current timestamp: ", current_timestamp())
+        elif NOTIFY_ACK_PREFIX in data:
+            ack_vals = data.replace(NOTIFY_ACK_PREFIX, "", 1).split(",")
+            self.__on_notification_ack(ack_vals[0], int(ack_vals[1]))
+        elif SYNC_CLIENT_PREFIX in data:
+            self.__on_sync_client(session, data.replace(SYNC_CLIENT_PREFIX, "", 1))
+        elif SYNC_BATCH_PREFIX in data:
+            self.__on_sync_batch(session, int(data.replace(SYNC_BATCH_PREFIX, "", 1)))
+        elif CONFIG_PREFIX in data:
+            # setup_config=interval=10,retention=3,events=200 (any subset)
+            config_vals = data.replace(CONFIG_PREFIX, "", 1).split(",")
+            self.__on_config(dict(x.split("=", 1) for x in config_vals if "=" in x))
+        elif SUMMARY_PAGE_PREFIX in data:
+            self.__on_summary_page(session, int(data.replace(SUMMARY_PAGE_PREFIX, "", 1)))
+        elif QUERY_PREFIX in data:
+            query_vals = [int(x) for x in data.replace(QUERY_PREFIX, "", 1).split(",")]
+            self.__on_query(session, query_vals[0], query_vals[1], query_vals[2])
+        elif EXPORT_PREFIX in data:
+            self.__on_export(data.replace(EXPORT_PREFIX, "", 1))
+        elif DIAG_SECTION_PREFIX in data:
+            self.__on_diag_section(session, data.replace(DIAG_SECTION_PREFIX, "", 1))
+        elif DATA_ACK_PREFIX in data:
+            # data_ack=<seq>: every data point before seq was received
+            self.__on_data_ack(session, int(data.replace(DATA_ACK_PREFIX, "", 1)))
+        elif EVENT_ACK_PREFIX in data:
+            self.__on_event_ack(session, int(data.replace(EVENT_ACK_PREFIX, "", 1)))
@@ -0,0 +1,130 @@
+"""
+timebase.py
+Compact, correctable timestamps.
+
+A timestamp is stored as a 16-bit segment id plus a 16-bit offset (seconds)
+from that segment's base time.  A new segment starts whenever an offset would
+not fit in 16 bits (about 18 hours), or when the clock jumps backwards.
+
+Until the RTC has been set by the app the clock counts from 1970/2000, so the
+bases of those segments are wrong.  When the clock is set, every unsynced base
+is shifted by the same amount the clock moved; no stored record is touched.
+
+Readings are stamped with stamp(), which counts the offset from ticks_ms
+instead of calling utime.time(): epoch seconds don't fit a MicroPython small
+int, so every utime.time() call allocates.
+"""
+import utime # pylint: disable=E0401
+
+MAX_OFFSET = 0xFFFF # seconds (~18 hours) per segment
+SEGMENT_ID_MASK = 0xFFFF
+
+class Timebase: # pylint: disable=C1001,R0902
+    """
+    Timebase
+    Table of segment base times, shared by the caches of a device.
+    """
+    def __init__(self, time_set=False):
+        self.__time_set = time_set
+        self.__first_id = 0 # id of self.__bases[0]
+        self.__bases = []
+        self.__synced = []
+        # stamp() state: the segment/offset of the last stamp, and the
+        # ticks_ms at which the anchor offset was taken.
+        self.segment_id = 0
+        self.offset = 0
+        self.__anchor_offset = 0
+        self.__anchor_ticks = None
+
+    def encode(self, timestamp):
+        """
+        encode
+        Returns (segment_id, offset) for the given timestamp, starting a new
+        segment if it does not fit in the current one.
+        """
+        if self.__bases:
+            offset = timestamp - self.__bases[-1]
+            if 0 <= offset <= MAX_OFFSET:
+                return (self.__first_id + len(self.__bases) - 1) & SEGMENT_ID_MASK, offset
+        self.__bases.append(timestamp)
+        self.__synced.append(self.__time_set)
+        return (self.__first_id + len(self.__bases) - 1) & SEGMENT_ID_MASK, 0
+
+    def now(self):
+        """
+        now
+        Returns (segment_id, offset) for the current time.
+        """
+        return self.encode(utime.time())
+
+    def stamp(self, ticks=None):
+        """
+        stamp
+        Sets self.segment_id and self.offset to the current time, or to the
+        time of the given ticks_ms (a reading queued by the sampler thread).
+        Only allocates when it has to re-anchor to utime.time(): on the first
+        call, after the clock was set, and when the offset outgrows the segment.
+        """
+        now = utime.ticks_ms()
+        if ticks is None:
+            ticks = now
+        if self.__anchor_ticks is not None:
+            offset = self.__anchor_offset + \
+                utime.ticks_diff(ticks, self.__anchor_ticks) // 1000
+            if 0 <= offset <= MAX_OFFSET:
+                self.offset = offset
+                return
+        # Anchor to the reading, which may have been queued a while ago.
+        self.segment_id, self.offset = self.encode(
+            utime.time() - utime.ticks_diff(now, ticks) // 1000)
+        self.__anchor_offset = self.offset
+        self.__anchor_ticks = ticks
+
+    def to_wall(self, segment_id, offset):
+        """
+        to_wall
+        Returns the wall-clock timestamp of (segment_id, offset), or None if
+        the segment has been pruned.
+        """
+        index = (segment_id - self.__first_id) & SEGMENT_ID_MASK
+        if index >= len(self.__bases):
+            return None
+        return self.__bases[index] + offset
+
+    def is_time_set(self):
+        """
+        is_time_set
+        Returns true once the RTC has been set.
+        """
+        return self.__time_set
+
+    def on_time_set(self, delta):
+        """
+        on_time_set
+        Called after the RTC moved by delta seconds.  Shifts the base of every
+        segment recorded before the clock was first set.  O(segments).
+        """
+        for index, synced in enumerate(self.__synced):
+            if not synced:
+                self.__bases[index] += delta
+                self.__synced[index] = True
+        self.__time_set = True
+        self.__anchor_ticks = None
+
+    def prune(self, segment_id):
+        """
+        prune
+        Drops every segment older than segment_id.
+        """
+        index = (segment_id - self.__first_id) & SEGMENT_ID_MASK
+        if 0 < index < len(self.__bases):
+            del self.__bases[:index]
+            del self.__synced[:index]
+            self.__first_id = (self.__first_id + index) & SEGMENT_ID_MASK
+
+    def segment_count(self):
+        """
+        segment_count
+        Returns the number of segments currently held.
+        """
+        return len(self.__bases)
@@ -0,0 +1,14 @@
+"""
+conftest.py
+The device code runs under CPython on host.sim's MicroPython stand-ins
+(virtual clock, /flash in a temporary directory), so install them before any
+src/ or lib/ module is imported.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from host.sim.micropython import install # pylint: disable=C0413
+
+install()
@@ -0,0 +1,59 @@
+"""
+test_allocation.py
+The sample -> store -> detect path (Device.process_samples) runs every
+interval forever, so a quiet reading must allocate next to nothing and keep
+nothing.  Measured with tracemalloc, which the sim's gc.mem_alloc also reads.
+"""
+import json
+import os
+import tracemalloc
+
+from host.sim import SimDevice
+from src.sampler import Sampler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEVICE_CODE = [tracemalloc.Filter(True, os.path.join(ROOT, 'src', '*')),
+               tracemalloc.Filter(True, os.path.join(ROOT, 'lib', '*'))]
+QUIET_PEAK = 512 # bytes a quiet reading may allocate at once
+WARMUP = 300 # readings before measuring: the new sampler's counters pass 256 too
+READINGS = 500
+
+
+def test_quiet_readings_allocate_little_and_keep_nothing():
+    humidity = [45.0]
+    sim = SimDevice(sensor=lambda seconds: (humidity[0], 22.0), duration=1, interval=5)
+    # An hour of readings: the caches are past their first compactions and
+    # the counters past CPython's small int cache (whose ints cost nothing).
+    sim.run(3600)
+    device = sim.device
+    with sim.active():
+        # Drive the sampler by hand, so only process_samples() is measured.
+        device.sampler = Sampler(device.dht_sensor, 5000)
+
+        def reading():
+            device.sampler.step()
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            device.process_samples()
+            return tracemalloc.get_traced_memory()[1] - before
+
+        tracemalloc.start()
+        try:
+            for _ in range(WARMUP):
+                reading()
+            start = tracemalloc.take_snapshot().filter_traces(DEVICE_CODE)
+            peaks = [reading() for _ in range(READINGS)]
+            end = tracemalloc.take_snapshot().filter_traces(DEVICE_CODE)
+            kept = sum(stat.size_diff for stat in end.compare_to(start, 'lineno'))
+            humidity[0] = 100.0 # a jump: fires an event
+            event_peak = reading()
+            sampling = json.loads(device.get_diagnostics_json())['sampling']
+        finally:
+            tracemalloc.stop()
+
+    assert max(peaks) <= QUIET_PEAK
+    assert kept <= 0
+    # The measure sees allocations: an event (object, id, notifications) does.
+    assert event_peak > QUIET_PEAK
+    assert sampling['alloc_detect_max'] > 0
+    sim.close()
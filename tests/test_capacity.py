@@ -0,0 +1,116 @@
+"""
+test_capacity.py
+A board short of heap boots anyway: the capacity planner sizes the caches
+from gc.mem_free(), allocate() retries smaller when an allocation fails, and
+the retention degrades (a planned heartbeat folds repeated readings) instead
+of the device running out of memory.  A config change never resizes the
+sensor cache below what it holds, unless it asks for less.
+"""
+import json
+
+import src.device
+from host.sim import SimDevice
+from host.sim.micropython import CONTEXT
+from src.capacity import SENSOR_RECORD_BYTES
+
+RETENTION_DAYS = 7
+INTERVAL = 5
+LARGEST_BLOCK = 16384 # bytes: the fragmented heap's largest free block
+
+
+def test_low_memory_boot(tmp_path, monkeypatch):
+    monkeypatch.setattr(CONTEXT, 'mem_free', 60000)
+    sensor_cache = src.device.SensorCache
+
+    def fragmented(size, timebase=None):
+        if size * SENSOR_RECORD_BYTES > LARGEST_BLOCK:
+            raise MemoryError('memory allocation failed')
+        return sensor_cache(size, timebase)
+
+    monkeypatch.setattr(src.device, 'SensorCache', fragmented)
+    sim = SimDevice(flash_dir=str(tmp_path), duration=RETENTION_DAYS, interval=INTERVAL)
+    sim.run(3600)
+
+    capacity = json.loads(sim.read('diag').decode())['capacity']
+    sensor_data = sim.device.sensor_data
+    assert capacity['wanted'] == RETENTION_DAYS * 86400 // INTERVAL
+    assert capacity['sensor'] == sensor_data.max_size()
+    assert sensor_data.max_size() * SENSOR_RECORD_BYTES <= LARGEST_BLOCK
+    assert capacity['shrunk'] > 0
+    # No heartbeat was configured: the planner set one, and it folds the
+    # (constant) readings.
+    assert sim.device.config.heartbeat == 0
+    assert capacity['heartbeat'] > INTERVAL
+    assert sensor_data.raw_count() > sensor_data.length()
+    assert capacity['horizon_s'][0] == capacity['sensor'] * INTERVAL
+    assert capacity['horizon_s'][0] < capacity['horizon_s'][1] < RETENTION_DAYS * 86400
+    sim.close()
+
+
+def full_device(tmp_path, monkeypatch):
+    """
+    full_device
+    Returns a SimDevice whose one day cache is full of unsynced readings,
+    with the heap then down to 120 KB: less than the cache takes.
+    """
+    sim = SimDevice(flash_dir=str(tmp_path), duration=1, interval=INTERVAL)
+    assert sim.device.sensor_data.max_size() == 17280
+    while sim.device.sensor_data.length() < 17280:
+        sim.run(3600)
+    monkeypatch.setattr(CONTEXT, 'mem_free', 120000)
+    return sim
+
+
+def configure(sim, config):
+    """
+    configure
+    Writes a setup_config= change, and lets the main loop's idle() apply it.
+    """
+    sim.write('setup', 'setup_config=' + config)
+    with sim.active():
+        sim.device.idle()
+
+
+def test_resize_keeps_unsynced_readings(tmp_path, monkeypatch):
+    sim = full_device(tmp_path, monkeypatch)
+    sensor_data = sim.device.sensor_data
+    first = sensor_data.first_seq()
+    configure(sim, 'retention=1.1')
+    # The heap has no room for a second, larger copy: the cache keeps its
+    # capacity (short of the 19008 records asked for) and its readings.
+    capacity = json.loads(sim.read('diag').decode())['capacity']
+    assert (capacity['wanted'], capacity['sensor']) == (19008, 17280)
+    assert sensor_data.max_size() == 17280
+    assert sensor_data.first_seq() == first
+    assert sensor_data.length() == 17280
+    sim.close()
+
+
+def test_failed_resize_keeps_the_cache(tmp_path, monkeypatch):
+    sim = full_device(tmp_path, monkeypatch)
+    monkeypatch.setattr(CONTEXT, 'mem_free', 2 * 1024 * 1024)
+    sensor_data = sim.device.sensor_data
+    first = sensor_data.first_seq()
+
+    def fragmented(size):
+        raise MemoryError('memory allocation failed')
+
+    monkeypatch.setattr(sensor_data, 'resize', fragmented)
+    configure(sim, 'retention=2')
+    capacity = json.loads(sim.read('diag').decode())['capacity']
+    assert (capacity['sensor'], capacity['resize_failed'], capacity['shrunk']) == (17280, 1, 0)
+    assert sensor_data.first_seq() == first
+    sim.close()
+
+
+def test_resize_down_when_asked(tmp_path, monkeypatch):
+    sim = full_device(tmp_path, monkeypatch)
+    sensor_data = sim.device.sensor_data
+    next_seq = sensor_data.next_seq()
+    sim.write('setup', 'setup_config=retention=0.5')
+    assert sensor_data.max_size() == 17280 # not resized in the BLE callback
+    with sim.active():
+        sim.device.idle()
+    assert sensor_data.max_size() == 8640
+    assert sensor_data.first_seq() == next_seq - 8640 # the newest readings are kept
+    sim.close()
@@ -0,0 +1,82 @@
+"""
+test_detection_trace.py
+DetectionTrace books the time from a humidity rise to the event into
+warmup, suppressed and pending time, then records when the notification was
+sent and acked, and the diagnostics report the breakdowns.
+"""
+import json
+
+import utime # pylint: disable=E0401
+
+from host.sim import SimDevice
+from src.detection_trace import DetectionTrace, STATE_WARMUP, STATE_SUPPRESSED, STATE_PENDING
+
+INTERVAL = 5
+
+
+def test_breakdown():
+    trace = DetectionTrace(size=2)
+    start = utime.ticks_ms()
+
+    def at(seconds):
+        return utime.ticks_add(start, seconds * 1000)
+
+    trace.mark(at(0), STATE_PENDING) # no onset yet: not traced
+    trace.mark(at(5), STATE_WARMUP) # the onset
+    trace.mark(at(10), STATE_WARMUP)
+    trace.mark(at(15), STATE_SUPPRESSED)
+    trace.mark(at(20), STATE_PENDING)
+    trace.fire(at(25), 7)
+    assert trace.records() == [{
+        "onset_ms": 20000, "warmup_ms": 10000, "suppressed_ms": 5000, "pending_ms": 5000,
+        "readings": 5, "sent_ms": None, "acked_ms": None, "repeat": False}]
+    # Humidity stays up: the next event is a repeat, its onset the reading it fires on.
+    trace.mark(at(30), STATE_SUPPRESSED)
+    trace.fire(at(40), 8)
+    assert [(record["onset_ms"], record["suppressed_ms"], record["repeat"])
+            for record in trace.records()] == [(20000, 5000, False), (10000, 10000, True)]
+    # An onset humidity falls back from is abandoned.
+    trace.clear()
+    trace.mark(at(45), STATE_WARMUP)
+    trace.clear()
+    assert trace.get_metrics()["abandoned"] == 1
+    assert trace.get_metrics()["onset_age_ms"] is None
+
+    trace.on_sent(7) # covers the first event only
+    trace.on_acked(8)
+    sent = [record["sent_ms"] for record in trace.records()]
+    acked = [record["acked_ms"] for record in trace.records()]
+    assert sent[0] == utime.ticks_diff(utime.ticks_ms(), at(25)) and sent[1] is None
+    assert acked == [utime.ticks_diff(utime.ticks_ms(), at(25)),
+                     utime.ticks_diff(utime.ticks_ms(), at(40))]
+    trace.fire(at(50), 9)
+    metrics = trace.get_metrics()
+    assert metrics["fired"] == 3
+    assert len(metrics["events"]) == 2 # the oldest breakdown made room
+    assert metrics["events"][0] == [10000, 0, 10000, 0, 2, None, acked[1], 1]
+
+
+def test_device_traces_an_event(tmp_path):
+    humidity = [45.0]
+    sim = SimDevice(sensor=lambda seconds: (humidity[0], 22.0), flash_dir=str(tmp_path),
+                    duration=1, interval=INTERVAL)
+    sim.write('setup', 'setup_time=2026,1,1,0,0,0') # long past the last event (none)
+    notifications = []
+    sim.connect()
+    sim.subscribe('event_notif', notifications.append)
+    sim.write('pair', 'phone')
+    sim.run(2 * INTERVAL)
+    humidity[0] = 100.0
+    # Readings 3 to 5 are the warmup (fewer than MIN_DATA_POINTS); the 6th fires.
+    sim.run(4 * INTERVAL)
+    assert notifications == [b'new_events=1,1']
+    detection = json.loads(sim.read('diag').decode())['detection']
+    assert detection['fired'] == 1
+    onset, warmup, suppressed, pending, readings, sent, acked, repeat = detection['events'][0]
+    assert abs(onset - 3 * INTERVAL * 1000) < 500 and warmup == onset
+    assert (suppressed, pending, readings, repeat) == (0, 0, 4, 0)
+    assert sent is not None and acked is None
+    sim.write('setup', 'notify_ack=phone,1')
+    detection = json.loads(sim.read('diag').decode())['detection']
+    assert detection['events'][0][6] is not None
+    sim.close()
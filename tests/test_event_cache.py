@@ -0,0 +1,94 @@
+"""
+test_event_cache.py
+EventCache capacity, seqs and the event log.
+"""
+from src.event import Event, EventType
+from src.event_cache import EventCache
+
+
+def _event(name, event_type=EventType.one):
+    return Event(event_type, initial_values={'event_id': name, 'timestamp': 1,
+                                             'event_type': event_type})
+
+
+def _ids(cache):
+    ids = []
+    seq = cache.find_next(cache.first_seq())
+    while seq < cache.next_seq():
+        ids.append(cache.get(seq).event_id)
+        seq = cache.find_next(seq + 1)
+    return ids
+
+
+def test_removed_event_frees_its_place():
+    cache = EventCache(3)
+    for name in 'ABC':
+        cache.push(_event(name))
+    cache.remove_event('B')
+    cache.push(_event('D'))
+    assert cache.length() == 3
+    assert _ids(cache) == ['A', 'C', 'D']
+    assert cache.find_by_id('A') is not None
+
+
+def test_clear_events_do_not_shrink_capacity():
+    # clear_event removes an event and pushes its changed copy: a dirty event
+    # that stays unhandled must not be evicted while the cache has room.
+    cache = EventCache(3)
+    cache.push(_event('dirty'))
+    for index in range(10):
+        cache.push(_event('other-%d' % index))
+        cache.remove_event('other-%d' % index)
+        cache.push(_event('other-%d' % index, EventType.changed))
+        cache.remove_event('other-%d' % index)
+    assert _ids(cache) == ['dirty']
+    assert cache.unhandled_count() == 1
+
+
+def test_full_cache_evicts_oldest_event():
+    cache = EventCache(2)
+    for name in 'ABC':
+        cache.push(_event(name))
+    assert _ids(cache) == ['B', 'C']
+    assert cache.first_seq() == 1
+    assert cache.next_seq() == 3
+
+
+def test_seqs_survive_removals():
+    cache = EventCache(4)
+    for name in 'ABCD':
+        cache.push(_event(name))
+    cache.remove_event('B')
+    assert cache.find_next(1) == 2
+    assert cache.count_from(1) == 2
+    assert cache.count_from(0) == 3
+    assert cache.get(1) is None
+    assert cache.peek().event_id == 'D'
+    cache.release_before(3)
+    assert _ids(cache) == ['D']
+
+
+def test_resize_keeps_newest_events():
+    cache = EventCache(4)
+    for name in 'ABCD':
+        cache.push(_event(name))
+    cache.resize(2)
+    assert _ids(cache) == ['C', 'D']
+    cache.resize(3)
+    cache.push(_event('E'))
+    assert _ids(cache) == ['C', 'D', 'E']
+
+
+def test_log_replay_keeps_events_and_seqs(tmp_path):
+    path = str(tmp_path / 'events.log')
+    cache = EventCache(3, path)
+    for name in 'ABCD':
+        cache.push(_event(name))
+    cache.remove_event('C')
+
+    recovered = EventCache(3, path)
+    assert _ids(recovered) == ['B', 'D']
+    assert recovered.get(3).event_id == 'D'
+    assert recovered.next_seq() == 4
+    recovered.push(_event('E'))
+    assert _ids(recovered) == ['B', 'D', 'E']
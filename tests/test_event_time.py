@@ -0,0 +1,34 @@
+"""
+test_event_time.py
+Events created before the clock was set get corrected timestamps, which
+outlive the sensor timebase and reboots.
+"""
+import json
+
+from host.sim import SimDevice
+from host.sim.micropython import CONTEXT, time_to_seconds
+
+SET_TIME = (2026, 10, 18, 0, 0, 0)
+
+
+def test_event_from_before_clock_set(tmp_path):
+    CONTEXT.clock.seconds = 0.0 # the RTC right after boot
+    sim = SimDevice(flash_dir=str(tmp_path), duration=0.01, interval=60)
+    CONTEXT.clock.advance(61)
+    sim.step()
+    with sim.active():
+        sim.device.clear_event('none') # pushes a "changed" event at t=61
+    sim.write('setup', 'setup_time=' + ','.join(str(x) for x in SET_TIME))
+    expected = time_to_seconds(SET_TIME) - 1 # the event was 1 s before the clock was set
+    # 20 hours of readings: the ring (0.01 days) turns over and old segments are pruned.
+    sim.run(20 * 3600)
+    assert sim.device.timebase.segment_count() < 3
+    first = sim.device.events.first_seq()
+    assert abs(sim.device.events.get(first).timestamp - expected) <= 1
+    sim.close()
+
+    rebooted = SimDevice(flash_dir=str(tmp_path), duration=0.01, interval=60)
+    event = json.loads(rebooted.read('event').decode())['event']
+    assert event['event_type'] == 3
+    assert abs(event['timestamp'] - expected) <= 1
+    rebooted.close()
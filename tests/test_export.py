@@ -0,0 +1,45 @@
+"""
+test_export.py
+A sync that releases readings or events while an export runs must not leave
+records with pruned timestamps (or a crash) in the export.
+"""
+import os
+
+from host.export.reader import read_export
+from host.sim import SimDevice
+from src.export import EXPORT_CHUNK, export_history
+
+
+def test_release_during_export(tmp_path):
+    sim = SimDevice(flash_dir=str(tmp_path), duration=1, interval=5)
+    sim.run(4 * EXPORT_CHUNK * 5)
+    with sim.active():
+        sim.device.clear_event('none')
+        sim.device.clear_event('none')
+    sensor_data = sim.device.sensor_data
+    events = sim.device.events
+    first = sensor_data.first_seq()
+    expected = dict((seq, sensor_data.timestamp(seq))
+                    for seq in range(first, sensor_data.next_seq()))
+    released = events.first_seq()
+    repeats = sensor_data.repeats
+
+    def releasing_repeats(seq):
+        # A sync reading past the export, halfway through its second chunk.
+        if seq == first + EXPORT_CHUNK + EXPORT_CHUNK // 2:
+            sensor_data.release_before(first + 3 * EXPORT_CHUNK)
+            events.release_before(released + 1)
+        return repeats(seq)
+
+    sensor_data.repeats = releasing_repeats
+    with sim.active():
+        manifest = export_history(sensor_data, events)
+    del sensor_data.repeats
+
+    assert manifest['records'] == EXPORT_CHUNK # the first chunk, before the release
+    exported = read_export(os.path.join(str(tmp_path), 'export.json'))
+    for offset, record in enumerate(exported.data):
+        assert record['timestamp'] == expected[first + offset]
+    assert [event['event_id'] for event in exported.events] == \
+        [events.get(seq).event_id for seq in range(released + 1, events.next_seq())]
+    sim.close()
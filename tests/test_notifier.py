@@ -0,0 +1,109 @@
+"""
+test_notifier.py
+NotificationDispatcher queues, acks, addressing and persistence.
+"""
+from host.sim.micropython import CONTEXT
+from src.notifier import NotificationDispatcher
+
+
+class Link:
+    """
+    Link
+    Collects the notifications a dispatcher sends, as (client_id, payload).
+    """
+    def __init__(self):
+        self.sent = []
+
+    def send(self, payload, client_id):
+        """
+        send
+        send_notification callback.
+        """
+        self.sent.append((client_id, payload))
+
+
+def test_notifications_before_pairing_go_to_first_client():
+    link = Link()
+    notifier = NotificationDispatcher([], link.send)
+    notifier.notify(None)
+    notifier.notify(None)
+    notifier.update_client_ids(['phone'])
+    assert notifier.pending_count() == 1
+    notifier.on_connected('phone')
+    assert link.sent == [('phone', 'new_events=2,1')]
+    notifier.on_ack('phone', 2)
+    assert notifier.pending_count() == 0
+
+
+def test_unpaired_client_loses_its_queue():
+    notifier = NotificationDispatcher(['phone', 'tablet'], Link().send)
+    notifier.notify(None)
+    notifier.update_client_ids(['phone'])
+    assert notifier.pending_count() == 1
+
+
+def test_seq_and_pending_survive_reboot(tmp_path):
+    path = str(tmp_path / 'notifier.json')
+    notifier = NotificationDispatcher(['phone'], Link().send, path=path)
+    for _ in range(3):
+        notifier.notify(None)
+    notifier.on_ack('phone', 2)
+
+    link = Link()
+    rebooted = NotificationDispatcher(['phone'], link.send, path=path)
+    rebooted.on_connected('phone')
+    assert link.sent == [('phone', 'new_events=1,3')] # seq 3 still unacked
+    assert rebooted.notify(None) == 4 # seqs keep increasing
+    rebooted.on_ack('phone', 4)
+    assert rebooted.pending_count() == 0
+    assert NotificationDispatcher(['phone'], Link().send, path=path).pending_count() == 0
+
+
+def test_retry_backs_off():
+    link = Link()
+    notifier = NotificationDispatcher(['phone'], link.send)
+    notifier.on_connected('phone')
+    notifier.notify(None)
+    notifier.poll()
+    assert len(link.sent) == 1
+    notifier.poll() # backoff not expired
+    assert len(link.sent) == 1
+    CONTEXT.clock.advance(5)
+    notifier.poll()
+    assert link.sent == [('phone', 'new_events=1,1')] * 2
+    assert notifier.get_metrics()['retries'] == 1
+
+
+def test_offline_client_holds_up_no_one():
+    link = Link()
+    notifier = NotificationDispatcher(['phone', 'tablet'], link.send)
+    notifier.on_connected('phone')
+    notifier.notify(None)
+    notifier.poll()
+    notifier.on_ack('phone', 1)
+    for _ in range(200 * 60 // 5): # 200 minutes of main loop, the tablet away
+        CONTEXT.clock.advance(5)
+        notifier.poll()
+    assert link.sent == [('phone', 'new_events=1,1')]
+    notifier.notify(None) # only the new event for the phone, both for the tablet
+    notifier.poll()
+    notifier.on_connected('tablet')
+    assert link.sent[1:] == [('phone', 'new_events=1,2'), ('tablet', 'new_events=2,1')]
+
+
+def test_backoff_is_per_client():
+    link = Link()
+    notifier = NotificationDispatcher(['phone', 'tablet'], link.send)
+    notifier.on_connected('phone')
+    notifier.notify(None)
+    notifier.poll()
+    CONTEXT.clock.advance(5)
+    notifier.poll() # the phone's first retry: its next one is 10 s out
+    notifier.on_connected('tablet') # sent now, retried in 5 s
+    CONTEXT.clock.advance(5)
+    notifier.poll()
+    assert [client_id for client_id, _ in link.sent] == ['phone', 'phone', 'tablet', 'tablet']
+    notifier.on_disconnected('tablet')
+    CONTEXT.clock.advance(5)
+    notifier.poll()
+    assert [client_id for client_id, _ in link.sent[4:]] == ['phone']
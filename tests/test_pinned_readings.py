@@ -0,0 +1,90 @@
+"""
+test_pinned_readings.py
+Event-anchored retention: the readings around an event outlive the sensor
+cache ring in a PinnedReadings store of fixed budget, and query_range and
+the history export return them ahead of the cached readings.
+"""
+import asyncio
+import os
+
+from host.export.reader import read_export
+from host.sim import SimDevice
+from host.sync import SyncClient, InProcessTransport
+from src.pinned_readings import PinnedReadings
+from src.timebase import Timebase
+
+INTERVAL = 5
+PIN = 60 # seconds pinned on each side of an event
+WINDOW = PIN // INTERVAL
+
+
+def _seqs(pinned):
+    return [pinned.seq(index) for index in range(pinned.length())]
+
+
+def test_windows_budget_and_resize():
+    pinned = PinnedReadings(4, Timebase())
+    pinned.pin(10, 13)
+    pinned.pin(12, 15) # overlaps the first window: merged
+    pinned.pin(20, 22)
+    assert pinned.window_count() == 2
+    kept = [seq for seq in range(30) if pinned.is_pinned(seq)]
+    assert kept == [10, 11, 12, 13, 14, 20, 21]
+    assert pinned.window_count() == 0
+    for seq in kept:
+        pinned.keep(seq, 0, seq, seq * 10, 200, seq % 2)
+    # Over budget: the oldest pinned readings went first.
+    assert (_seqs(pinned), pinned.dropped()) == ([13, 14, 20, 21], 3)
+    assert pinned.values(0) == (130, 200, 1)
+    assert pinned.find_seq(15) == 2
+    assert pinned.resize(6)
+    assert (_seqs(pinned), pinned.budget()) == ([13, 14, 20, 21], 6)
+    pinned.keep(30, 0, 30, 300, 200, 0)
+    assert pinned.resize(2) # keeps the newest
+    assert (_seqs(pinned), pinned.dropped()) == ([21, 30], 6)
+    assert pinned.values(1) == (300, 200, 0)
+
+
+def test_pinned_rows_in_query_and_export(tmp_path):
+    humidity = [45.0]
+    sim = SimDevice(sensor=lambda seconds: (humidity[0], 22.0), flash_dir=str(tmp_path),
+                    duration=0.01, interval=INTERVAL)
+    sim.write('setup', 'setup_config=pin=%d,pin_budget=100' % PIN)
+    sim.run(600)
+    sensor_data = sim.device.sensor_data
+    events = sim.device.events.next_seq()
+    humidity[0] = 100.0
+    sim.run(INTERVAL)
+    assert sim.device.events.next_seq() == events + 1
+    fired = sensor_data.next_seq() - 1
+    humidity[0] = 45.0
+    sim.run(2 * sensor_data.max_size() * INTERVAL) # the ring evicts the event's readings
+    pinned = sensor_data.pinned()
+    assert _seqs(pinned) == list(range(fired - WINDOW, fired + WINDOW + 1))
+    assert sensor_data.first_seq() > fired + WINDOW
+
+    client = SyncClient(InProcessTransport(sim), 'phone')
+
+    async def run():
+        await client.connect()
+        records = await client.query(0, 2 ** 31)
+        await client.disconnect()
+        return records
+
+    expected = ['%s-%d' % (sensor_data.epoch_id(), seq)
+                for seq in _seqs(pinned) + list(range(sensor_data.first_seq(),
+                                                      sensor_data.next_seq()))]
+    queried = asyncio.run(run())
+    assert [record['data_id'] for record in queried] == expected
+    assert queried[WINDOW]['humidity'] == 100.0
+    timestamps = [record['timestamp'] for record in queried]
+    assert timestamps == sorted(timestamps)
+
+    sim.write('setup', 'export=pins')
+    with sim.active():
+        sim.device.idle()
+    exported = read_export(os.path.join(str(tmp_path), 'pins.json'))
+    assert exported.manifest['pinned'] == 2 * WINDOW + 1
+    assert [record['data_id'] for record in exported.data] == expected
+    assert [record['timestamp'] for record in exported.data] == timestamps
+    sim.close()
@@ -0,0 +1,81 @@
+"""
+test_query.py
+find_time() and query_range= over readings whose timestamps span several
+timebase segments: segments run out after ~18 hours, and setting the clock
+starts a new one.  The binary searches must agree with a scan of the cache.
+"""
+import asyncio
+import datetime
+
+from host.sim import SimDevice
+from host.sync import SyncClient, InProcessTransport
+
+INTERVAL = 600
+HOUR = 3600
+
+
+def _scan(sensor_data, timestamp):
+    for seq in range(sensor_data.first_seq(), sensor_data.next_seq()):
+        if sensor_data.timestamp(seq) >= timestamp:
+            return seq
+    return sensor_data.next_seq()
+
+
+def _device(tmp_path):
+    """
+    _device
+    Returns a SimDevice with 48 hours of readings in four segments: the clock
+    is set, then set forward a day after 10 hours.
+    """
+    sim = SimDevice(flash_dir=str(tmp_path), duration=3, interval=INTERVAL)
+    client = SyncClient(InProcessTransport(sim), 'phone')
+    asyncio.run(client.set_time(datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)))
+    sim.run(10 * HOUR)
+    when = datetime.datetime.fromtimestamp(sim.clock.seconds + 24 * HOUR, datetime.timezone.utc)
+    asyncio.run(client.set_time(when))
+    sim.run(38 * HOUR)
+    assert sim.device.timebase.segment_count() >= 4
+    return sim, client
+
+
+def test_find_time_across_segments(tmp_path):
+    sim, _ = _device(tmp_path)
+    sensor_data = sim.device.sensor_data
+    first, end = sensor_data.first_seq(), sensor_data.next_seq()
+    times = [sensor_data.timestamp(seq) for seq in range(first, end)]
+    assert times == sorted(times)
+    probes = [times[0] - 1, times[-1], times[-1] + 1]
+    for seq in range(1, len(times)):
+        probes += [times[seq - 1] + 1, times[seq]]
+    for timestamp in probes:
+        assert sensor_data.find_time(timestamp) == _scan(sensor_data, timestamp)
+    sim.close()
+
+
+def test_query_range_across_segments(tmp_path):
+    sim, client = _device(tmp_path)
+    sensor_data = sim.device.sensor_data
+    epoch = sensor_data.epoch_id()
+    first, end = sensor_data.first_seq(), sensor_data.next_seq()
+    times = dict((seq, sensor_data.timestamp(seq)) for seq in range(first, end))
+    # The clock jump, the segment it starts, and an offset overflow later on.
+    jump = max(range(first + 1, end), key=lambda seq: times[seq] - times[seq - 1])
+    ranges = [(times[jump] - 2 * HOUR, times[jump] + 2 * HOUR, 1000),
+              (times[first], times[end - 1], 1000),
+              (times[jump - 3], times[end - 1] - 1, 50),
+              (times[jump - 1] + 1, times[jump] - 1, 1000)]
+
+    async def query(start, stop, max_count):
+        await client.connect()
+        records = await client.query(start, stop, max_count)
+        await client.disconnect()
+        return records
+
+    for start, stop, max_count in ranges:
+        expected = [seq for seq in range(first, end) if start <= times[seq] <= stop][:max_count]
+        records = asyncio.run(query(start, stop, max_count))
+        assert [record['data_id'] for record in records] == \
+            ['%s-%d' % (epoch, seq) for seq in expected]
+        assert [record['timestamp'] for record in records] == [times[seq] for seq in expected]
+    assert times[jump] - times[jump - 1] > 24 * HOUR
+    sim.close()
@@ -0,0 +1,92 @@
+"""
+test_sampler.py
+Sampler.step() and Device.process_samples() on the virtual clock, the way the
+sampler thread and the main loop share them: readings land on the fixed
+interval grid, deadlines the thread cannot make are skipped and counted, a
+full queue drops (and counts) its oldest reading, and nothing else is lost or
+stored twice.
+"""
+from host.sim import SimDevice
+from src.sampler import Sampler
+
+INTERVAL = 5
+QUEUE_SIZE = 4
+
+
+def start(tmp_path):
+    """
+    start
+    Returns a SimDevice with a Sampler that is not started (the test steps
+    it), and the wall time of the sampler's first deadline.  The sensor's
+    temperature (in tenths) is the index of the deadline a read was made at.
+    """
+    start_time = []
+    sim = SimDevice(sensor=lambda seconds: (45.0, round((seconds - start_time[0]) / INTERVAL) / 10.0),
+                    flash_dir=str(tmp_path), duration=1, interval=INTERVAL)
+    start_time.append(sim.clock.seconds)
+    sim.device.sampler = Sampler(sim.device.dht_sensor, INTERVAL * 1000, QUEUE_SIZE)
+    return sim, start_time[0]
+
+
+def stored(sim, first, start_time):
+    """
+    stored
+    Returns the deadline indexes of the readings stored from seq first,
+    checking their timestamps: whole seconds, anchored to ticks_ms at a
+    second's phase, so within a second of the deadline.
+    """
+    data = sim.device.sensor_data
+    indexes = [data.temperature_tenths(seq) for seq in range(first, data.next_seq())]
+    for seq, index in zip(range(first, data.next_seq()), indexes):
+        assert abs(data.timestamp(seq) - (start_time + index * INTERVAL)) <= 1
+    return indexes
+
+
+def test_fixed_rate(tmp_path):
+    sim, start_time = start(tmp_path)
+    first = sim.device.sensor_data.next_seq()
+    with sim.active():
+        for _ in range(100):
+            sim.device.sampler.step()
+            sim.clock.advance(1.3) # the read, detection and BLE callbacks
+            sim.device.process_samples()
+    assert stored(sim, first, start_time) == list(range(100))
+    metrics = sim.device.sampler.get_metrics()
+    assert (metrics['reads'], metrics['missed'], metrics['dropped']) == (100, 0, 0)
+    sim.close()
+
+
+def test_missed_deadlines(tmp_path):
+    sim, start_time = start(tmp_path)
+    first = sim.device.sensor_data.next_seq()
+    with sim.active():
+        sim.device.sampler.step()
+        sim.clock.advance(3.7 * INTERVAL) # the thread stalls past 3 deadlines
+        for _ in range(3):
+            sim.device.sampler.step()
+        sim.device.process_samples()
+    # The 3 deadlines gone are skipped, not read in a burst: the 4th one is
+    # made late, the others on time.
+    assert stored(sim, first, start_time) == [0, 4, 5, 6]
+    metrics = sim.device.sampler.get_metrics()
+    assert (metrics['reads'], metrics['missed'], metrics['dropped']) == (4, 3, 0)
+    sim.close()
+
+
+def test_queue_overflow(tmp_path):
+    sim, start_time = start(tmp_path)
+    first = sim.device.sensor_data.next_seq()
+    with sim.active():
+        sim.device.sampler.step()
+        sim.device.process_samples()
+        for _ in range(QUEUE_SIZE + 3): # the main context stalls
+            sim.device.sampler.step()
+        sim.device.process_samples()
+        sim.device.sampler.step()
+        sim.device.process_samples()
+    # The 3 oldest queued readings are dropped; the rest are stored once, in order.
+    assert stored(sim, first, start_time) == [0, 4, 5, 6, 7, 8]
+    metrics = sim.device.sampler.get_metrics()
+    assert (metrics['reads'], metrics['missed'], metrics['dropped']) == (QUEUE_SIZE + 5, 0, 3)
+    assert metrics['queued'] == 0
+    sim.close()
@@ -0,0 +1,59 @@
+"""
+test_sensor_cache.py
+Deadband recording: readings within the deadband fold into the newest
+record, and the sums (so the averages detection uses) stay those of every
+raw reading, as records are stored, folded and evicted.
+"""
+from host.sim.micropython import CONTEXT
+from src.sensor_cache import SensorCache
+
+INTERVAL = 5
+
+
+def push(cache, readings):
+    """
+    push
+    Pushes (humidity, temperature) readings in tenths, one per interval.
+    Returns how many of them were stored as a new record.
+    """
+    stored = 0
+    for humidity, temperature in readings:
+        stored += cache.push_now(humidity, temperature)
+        CONTEXT.clock.advance(INTERVAL)
+    return stored
+
+
+def test_folded_readings_keep_raw_sums():
+    cache = SensorCache(4)
+    cache.set_deadband(5, 60)
+    readings = [(500, 200), (503, 198), (497, 205), (505, 201)]
+    assert push(cache, readings) == 1
+    assert (cache.length(), cache.repeats(cache.first_seq())) == (1, 3)
+    assert cache.humidity_tenths(cache.first_seq()) == 500 # the record keeps its values
+    assert cache.raw_count() == 4
+    assert cache.humidity_sum_tenths() == sum(humidity for humidity, _ in readings)
+    assert cache.get_average_temperature() == sum(temp for _, temp in readings) / 40
+    # Out of the deadband, then past the heartbeat: new records.
+    more = [(520, 200)] + [(520, 200)] * (60 // INTERVAL)
+    assert push(cache, more) == 2
+    assert cache.humidity_sum_tenths() == sum(humidity for humidity, _ in readings + more)
+    # Evicting the folded record takes its raw readings out of the sums.
+    last = [(600, 250), (610, 251)]
+    assert push(cache, last) == 2
+    kept = more + last
+    assert cache.raw_count() == len(kept)
+    assert cache.humidity_sum_tenths() == sum(humidity for humidity, _ in kept)
+    assert cache.get_average_temperature() == sum(temp for _, temp in kept) / (10 * len(kept))
+
+
+def test_resize_keeps_raw_sums():
+    cache = SensorCache(4)
+    cache.set_deadband(10, 3600)
+    readings = [(400, 200), (409, 200), (391, 200), (700, 200), (705, 195), (900, 200)]
+    assert push(cache, readings) == 3
+    assert cache.resize(8)
+    assert cache.humidity_sum_tenths() == sum(humidity for humidity, _ in readings)
+    assert cache.resize(2) # drops the oldest record, with its 3 readings
+    assert cache.raw_count() == 3
+    assert cache.humidity_sum_tenths() == 700 + 705 + 900
+    assert cache.get_average_temperature() == (200 + 195 + 200) / 30
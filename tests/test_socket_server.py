@@ -0,0 +1,102 @@
+"""
+test_socket_server.py
+The device's TCP sync server (SimDevice(tcp_port=...)) and TcpTransport.
+"""
+import asyncio
+import json
+import socket
+
+from host.sim import SimDevice
+from host.sync.benchmark import free_port
+from host.sync.transport import TcpTransport
+
+
+def test_reply_to_cancelled_request_is_dropped():
+    port = free_port()
+    sim = SimDevice(tcp_port=port)
+
+    async def run():
+        transport = TcpTransport('127.0.0.1', port)
+        await transport.connect() # queued in the listen backlog until served
+        abandoned = asyncio.ensure_future(transport.read('summary'))
+        await asyncio.sleep(0.05)
+        abandoned.cancel()
+        with sim.serving():
+            diag = await asyncio.wait_for(transport.read('diag'), 5)
+            await transport.disconnect()
+        return diag
+
+    diag = json.loads(asyncio.run(run()))
+    assert 'notifications' in diag # the diag reply, not the summary one
+    sim.close()
+
+
+def test_bad_requests_get_error_replies():
+    port = free_port()
+    sim = SimDevice(tcp_port=port)
+    read = sim.device.protocol.read
+
+    def failing_read(session, name):
+        if name == 'summary':
+            raise RuntimeError('summary failed')
+        return read(session, name)
+
+    sim.device.protocol.read = failing_read
+    with sim.serving():
+        with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+            sock.sendall(b'\xff\xfe\nR summary\nR diag\n')
+            replies = b''
+            while replies.count(b'\n') < 3:
+                replies += sock.recv(65536)
+    lines = replies.split(b'\n')
+    assert lines[0].startswith(b'! ') # not UTF-8: dropped
+    assert lines[1] == b'! summary failed'
+    assert 'notifications' in json.loads(lines[2][2:]) # still serving
+    sim.close()
+
+
+def test_pipelined_clients_and_notifications():
+    port = free_port()
+    sim = SimDevice(tcp_port=port)
+    sim.run(300 * 5)
+    stored = sim.device.sensor_data.length()
+
+    async def run():
+        from host.sync import SyncClient # pylint: disable=C0415
+        clients = [SyncClient(TcpTransport('127.0.0.1', port), 'client-%d' % i,
+                              batch_size=16, window=8) for i in range(2)]
+        with sim.serving():
+            for client in clients:
+                await client.connect()
+                await client.pair()
+            # Pipelined: every request is written before the first reply comes in.
+            replies = await asyncio.gather(*[clients[0].transport.read(name)
+                                             for name in ('diag', 'summary', 'diag')])
+            # Several clients, each draining the caches through its own cursor.
+            results = await asyncio.gather(*[client.sync() for client in clients])
+            # clear_event notifies the paired clients, each on its own connection;
+            # a client that pairs later is not notified of it.
+            await clients[0].clear_event('none')
+            notifications = [await asyncio.wait_for(client.notifications.get(), 5)
+                             for client in clients]
+            late = SyncClient(TcpTransport('127.0.0.1', port), 'late')
+            await late.connect()
+            await late.pair()
+            await asyncio.sleep(0.2)
+            notifications.append(late.notifications.qsize())
+            for client in clients + [late]:
+                await client.disconnect()
+            for _ in range(100): # until the server has seen the disconnects
+                if not sim.device.socket_server.client_count():
+                    break
+                await asyncio.sleep(0.05)
+        return replies, results, notifications
+
+    replies, results, notifications = asyncio.run(run())
+    assert ['notifications' in json.loads(reply) for reply in replies] == [True, False, True]
+    for result in results:
+        assert len(result.data) == stored
+        assert result.reads < stored // 4 # batched: many rows per reply
+    assert notifications == ['new_events=1,1'] * 2 + [0]
+    assert sim.device.socket_server.client_count() == 0
+    sim.close()
@@ -0,0 +1,69 @@
+"""
+test_summary.py
+HourlyStats on the virtual clock: hourly buckets roll over (skipped hours
+stay empty, a week later the ring is reused), aggregates and the trend
+cover the newest hours, and the summary characteristic pages through them.
+"""
+import json
+
+from host.sim import SimDevice
+from host.sim.micropython import CONTEXT
+from src.summary import HourlyStats, DAY_BUCKETS, NUM_BUCKETS, PAGE_BUCKETS
+
+HOUR = 3600
+
+
+def test_hour_rollover_and_aggregates():
+    stats = HourlyStats()
+    for humidity, temperature in [(500, 200), (520, 210), (510, 190)]:
+        stats.add(humidity, temperature)
+    assert stats.aggregate(DAY_BUCKETS) == {"h": [500, 520, 510], "t": [190, 210, 200], "n": 3}
+    CONTEXT.clock.advance(HOUR)
+    stats.add(601, 220)
+    assert stats.hours(0, 3) == [[601, 601, 601], [500, 520, 510]]
+    CONTEXT.clock.advance(2 * HOUR + 10) # an hour without readings
+    stats.add(400, 180)
+    assert stats.hour_age_seconds() == 10
+    assert stats.hours(0, 5) == [[400, 400, 400], [], [601, 601, 601], [500, 520, 510]]
+    assert stats.aggregate(2) == {"h": [400, 400, 400], "t": [180, 180, 180], "n": 1}
+    assert stats.aggregate(DAY_BUCKETS) == \
+        {"h": [400, 601, 506], "t": [180, 220, 200], "n": 5} # (2530 + 2) // 5
+    # A week of hourly readings later, every bucket has been reused.
+    for _ in range(NUM_BUCKETS):
+        CONTEXT.clock.advance(HOUR)
+        stats.add(450, 210)
+    assert stats.aggregate(NUM_BUCKETS) == \
+        {"h": [450, 450, 450], "t": [210, 210, 210], "n": NUM_BUCKETS}
+    assert len(stats.hours(0, NUM_BUCKETS + 1)) == NUM_BUCKETS
+
+
+def test_trend():
+    stats = HourlyStats()
+    stats.add(500, 200)
+    assert stats.trend() == 0 # one hour: no trend yet
+    for hour in range(1, 8):
+        CONTEXT.clock.advance(HOUR)
+        stats.add(500 + 15 * hour, 200)
+    assert stats.trend() == 15
+    CONTEXT.clock.advance(HOUR)
+    stats.add(500, 200)
+    assert stats.trend() < 0
+
+
+def test_summary_read(tmp_path):
+    sim = SimDevice(sensor=lambda seconds: (55.0, 21.5), flash_dir=str(tmp_path),
+                    duration=1, interval=60)
+    sim.run(14 * HOUR)
+    summary = json.loads(sim.read('summary').decode())
+    readings = sim.device.sensor_data.raw_count()
+    assert summary["week"] == {"h": [550, 550, 550], "t": [215, 215, 215], "n": readings}
+    assert summary["day"] == summary["week"]
+    assert summary["trend"] == 0
+    assert (summary["page"], len(summary["hours"])) == (0, PAGE_BUCKETS)
+    assert summary["hours"][1] == [550, 550, 550]
+    sim.write('setup', 'summary_page=1')
+    summary = json.loads(sim.read('summary').decode())
+    assert summary["page"] == 1
+    assert 1 <= len(summary["hours"]) <= 3 # 14 or 15 hours in all
+    assert summary["hours"][0] == [550, 550, 550]
+    sim.close()
@@ -0,0 +1,108 @@
+"""
+test_sync_client.py
+SyncClient against a simulated device that keeps taking readings while it
+is being drained, and the acks that let the device release what it synced.
+"""
+import asyncio
+import json
+
+from host.sim import SimDevice
+from host.sync import SyncClient, InProcessTransport
+from src.sync_cursors import DATA_CURSOR, EVENT_CURSOR
+
+
+class LiveTransport(InProcessTransport):
+    """
+    LiveTransport
+    Every read lets the device take a reading first, as if the device kept
+    sampling while the client drains it.
+    """
+    async def read(self, name):
+        self.sim.step()
+        self.sim.clock.advance(self.sim.interval)
+        return await super().read(name)
+
+
+def _drain(transport, batch_size, window, readings=50):
+    sim = SimDevice(duration=1, interval=5)
+    sim.run(readings * 5)
+    client = SyncClient(transport(sim), 'phone', batch_size=batch_size, window=window)
+
+    async def run():
+        await client.connect()
+        await client.pair()
+        await client.identify()
+        data = await client.fetch_data()
+        await client.disconnect()
+        return data
+
+    data = asyncio.run(run())
+    cursor = sim.device.sync_cursors.acked('phone', DATA_CURSOR)
+    sim.close()
+    return [int(record['data_id'].rsplit('-', 1)[1]) for record in data], cursor, client.reads
+
+
+def test_drain_keeps_every_record_it_consumed():
+    for batch_size in (4, 16):
+        seqs, cursor, _ = _drain(LiveTransport, batch_size, window=4)
+        assert len(seqs) > 50
+        assert seqs == list(range(seqs[0], seqs[0] + len(seqs)))
+        assert seqs[-1] + 1 == cursor # everything the device handed out arrived, and was acked
+
+
+def test_drain_reads_no_more_than_remaining():
+    seqs, cursor, reads = _drain(InProcessTransport, 16, window=8)
+    assert len(seqs) == cursor == 50
+    assert reads == 4 # 16 + 16 + 16 + 2: no reads past the end
+
+
+def _read_seq(sim):
+    return int(json.loads(sim.read('data').decode())['data']['data_id'].rsplit('-', 1)[1])
+
+
+def test_lost_replies_are_read_again():
+    sim = SimDevice(duration=1, interval=5)
+    sim.run(50 * 5)
+    sensor_data = sim.device.sensor_data
+    first = sensor_data.first_seq()
+    sim.write('pair', 'phone')
+    sim.write('pair', 'tablet')
+    sim.write('setup', 'sync_client=phone')
+    assert [_read_seq(sim) for _ in range(3)] == [first, first + 1, first + 2]
+    assert sensor_data.first_seq() == first # read, not acked: kept
+    # The last two replies were lost: the phone acks the first one only, and
+    # reads the others again after identifying itself again.
+    sim.write('setup', 'data_ack=%d' % (first + 1))
+    sim.write('setup', 'sync_client=phone')
+    assert _read_seq(sim) == first + 1
+    assert sensor_data.first_seq() == first # the tablet has not acked it
+    sim.write('setup', 'sync_client=tablet')
+    sim.write('setup', 'data_ack=%d' % (first + 2))
+    assert sensor_data.first_seq() == first + 1
+    # Acks never move back, nor past what the device handed out.
+    sim.write('setup', 'data_ack=%d' % first)
+    sim.write('setup', 'data_ack=%d' % (sensor_data.next_seq() + 100))
+    assert sim.device.sync_cursors.acked('tablet', DATA_CURSOR) == sensor_data.next_seq()
+    sim.close()
+
+
+def test_sync_acks_events():
+    sim = SimDevice(duration=1, interval=5)
+    with sim.active():
+        sim.device.clear_event('none')
+        sim.device.clear_event('none')
+    events = sim.device.events
+    client = SyncClient(InProcessTransport(sim), 'phone')
+
+    async def run():
+        await client.connect()
+        await client.pair()
+        result = await client.sync()
+        await client.disconnect()
+        return result
+
+    result = asyncio.run(run())
+    assert len(result.events) == 2
+    assert sim.device.sync_cursors.acked('phone', EVENT_CURSOR) == events.next_seq()
+    assert events.first_seq() == events.next_seq() # acked by the only client: released
+    sim.close()